@@ -6,6 +6,11 @@ from .models import (
     TagWithUDPipeTask,
     BuildFreqVocabTask,
     ProcessWithNlpUKTask,
+    ReprocessNlpUkDeadLettersTask,
+    DetectLanguageTask,
+    DeduplicateTask,
+    ConvertUDPipedLayersTask,
+    BuildNgramsTask,
 )
 
 
@@ -37,3 +42,28 @@ class BuildFreqVocabTask(TaskAdmin):
 @admin.register(ProcessWithNlpUKTask)
 class ProcessWithNlpUKTask(TaskAdmin):
     pass
+
+
+@admin.register(ReprocessNlpUkDeadLettersTask)
+class ReprocessNlpUkDeadLettersTask(TaskAdmin):
+    pass
+
+
+@admin.register(DetectLanguageTask)
+class DetectLanguageTask(TaskAdmin):
+    pass
+
+
+@admin.register(DeduplicateTask)
+class DeduplicateTask(TaskAdmin):
+    pass
+
+
+@admin.register(ConvertUDPipedLayersTask)
+class ConvertUDPipedLayersTask(TaskAdmin):
+    pass
+
+
+@admin.register(BuildNgramsTask)
+class BuildNgramsTask(TaskAdmin):
+    pass
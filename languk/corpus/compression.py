@@ -0,0 +1,311 @@
+import os
+import bz2
+import gzip
+import lzma
+import pathlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+
+# Approximate amount of text (in characters) to accumulate before compressing it into a segment
+DEFAULT_SEGMENT_SIZE: int = 16 * 1024 * 1024
+
+# Approximate amount of text (in characters) in the block, compressed by one thread
+DEFAULT_BLOCK_SIZE: int = 4 * 1024 * 1024
+
+# file_compression -> file extension
+COMPRESSION_EXTENSIONS: Dict[str, str] = {
+    "none": "",
+    "bz2": ".bz2",
+    "lzma": ".xz",
+    "zstd": ".zst",
+    "pbz2": ".bz2",
+    "pxz": ".xz",
+    "pgz": ".gz",
+}
+
+# Compressions, that split the stream into the blocks and compress them on multiple cores
+PARALLEL_COMPRESSIONS: List[str] = ["pbz2", "pxz", "pgz"]
+
+# Every n-th marked document is added to the offset index, along with the first one in each block
+DEFAULT_INDEX_INTERVAL: int = 1000
+
+
+def get_compressor(
+    compression: str, level: Optional[int] = None, threads: int = 1
+) -> Callable[[bytes], bytes]:
+    """
+    Get function, that compresses a chunk of data into a complete stream (or frame), so
+    the compressed chunks can be concatenated and still decoded by the standard tools
+    :param compression: one of the keys of COMPRESSION_EXTENSIONS
+    :param level: compression level, None for the default one
+    :param threads: number of threads for the compressors with the native multithreading (zstd)
+    :return: function to compress the data
+    """
+    if compression == "none":
+        return lambda data: data
+
+    if compression in ("bz2", "pbz2"):
+        return lambda data: bz2.compress(
+            data, compresslevel=9 if level is None else level
+        )
+
+    if compression in ("lzma", "pxz"):
+        return lambda data: lzma.compress(data, preset=6 if level is None else level)
+
+    if compression == "pgz":
+        return lambda data: gzip.compress(
+            data, compresslevel=9 if level is None else level, mtime=0
+        )
+
+    if compression == "zstd":
+        import zstandard  # type: ignore
+
+        compressor = zstandard.ZstdCompressor(
+            level=3 if level is None else level,
+            threads=threads if threads > 1 else 0,
+            write_content_size=True,
+        )
+        return compressor.compress
+
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def get_decompressor(compression: str) -> Callable[[bytes], bytes]:
+    """
+    Get function, that decompresses a complete stream (or frame), i.e. the block of the
+    file, written by SegmentedWriter, found with its offset index
+    :param compression: one of the keys of COMPRESSION_EXTENSIONS
+    :return: function to decompress the data
+    """
+    if compression == "none":
+        return lambda data: data
+
+    if compression in ("bz2", "pbz2"):
+        return bz2.decompress
+
+    if compression in ("lzma", "pxz"):
+        return lzma.decompress
+
+    if compression == "pgz":
+        return gzip.decompress
+
+    if compression == "zstd":
+        import zstandard  # type: ignore
+
+        return zstandard.ZstdDecompressor().decompress
+
+    raise ValueError(f"Unknown compression {compression}")
+
+
+class SegmentedWriter:
+    """
+    Text writer, that compresses the output in segments. Each segment is a complete
+    compressed stream, so the file can be cut after any of them and appended later,
+    while bzip2/xz/gzip/zstd tools and python decode such multi-stream files transparently.
+    Segments are written out as soon as they fill up, flush_segment() only has to be called
+    to end the segment at the document boundary, i.e. to record the checkpoint.
+
+    With the parallel compressions segments are further split into the blocks, which
+    are compressed by the pool of threads (compressors release the GIL) and written
+    in order.
+
+    Starts of the documents, marked with mark(), are collected into the sparse offset
+    index: the offset and the size of the compressed block (complete stream) and the
+    offset of the document in the decompressed block.
+    """
+
+    def __init__(
+        self,
+        filename: pathlib.Path,
+        compression: str = "none",
+        offset: int = 0,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        level: Optional[int] = None,
+        threads: int = 1,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        index_interval: int = DEFAULT_INDEX_INTERVAL,
+    ) -> None:
+        """
+        Open the file for writing
+        :param filename: name of the file
+        :param compression: one of the keys of COMPRESSION_EXTENSIONS
+        :param offset: size of the already written segments to keep (i.e. when resuming), the
+            rest of the file is truncated
+        :param segment_size: approximate size of the segment in characters
+        :param level: compression level, None for the default one
+        :param threads: number of compression threads
+        :param block_size: approximate size of the block in characters for the parallel compressions
+        :param index_interval: add every n-th marked document to the offset index
+        """
+        self.compress: Callable[[bytes], bytes] = get_compressor(
+            compression, level=level, threads=threads
+        )
+        self.segment_size: int = segment_size
+
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending: Deque[Tuple[Future, List[Tuple[Dict, int]]]] = deque()
+        self.block_size: int = segment_size
+
+        if compression in PARALLEL_COMPRESSIONS and threads > 1:
+            self.executor = ThreadPoolExecutor(max_workers=threads)
+            self.max_pending: int = threads * 2
+            self.block_size = min(block_size, segment_size)
+
+        if offset:
+            self.fp = open(filename, "r+b")
+            self.fp.truncate(offset)
+            self.fp.seek(offset)
+        else:
+            self.fp = open(filename, "wb")
+
+        self.buffer: List[str] = []
+        self.buffered: int = 0
+        # Size of the text in the current segment, including the blocks already sent for compression
+        self.segment_buffered: int = 0
+
+        self.index_interval: int = index_interval
+        # Marked documents of the current block with their positions in the buffer
+        self.marks: List[Tuple[Dict, int]] = []
+        self.unindexed_marks: int = 0
+        # Entries of the offset index for the blocks, that are already written
+        self.index: List[Dict] = []
+
+    def write(self, s: str) -> int:
+        self.buffer.append(s)
+        self.buffered += len(s)
+        self.segment_buffered += len(s)
+
+        # Blocks are written as soon as they are full, so the output is streamed to the
+        # disk, while flush_segment() is left to mark the points the file can be cut at
+        if self.buffered >= self.block_size:
+            if self.executor is not None:
+                self._submit_block()
+            else:
+                data, marks = self._take_block()
+                self._write_block(self.compress(data), marks)
+
+        return len(s)
+
+    def mark(self, key: Dict) -> None:
+        """
+        Mark the start of the document, that is about to be written
+        :param key: fields to identify the document in the offset index
+        """
+        if self.marks and self.marks[-1][1] == len(self.buffer):
+            # Nothing was written after the previous mark, i.e. the document was filtered out
+            self.marks[-1] = (key, len(self.buffer))
+            return
+
+        self.unindexed_marks += 1
+        if not self.marks or self.unindexed_marks >= self.index_interval:
+            self.marks.append((key, len(self.buffer)))
+            self.unindexed_marks = 0
+
+    def pop_index(self) -> List[Dict]:
+        """
+        Get the entries of the offset index, collected since the last call
+        """
+        index: List[Dict] = self.index
+        self.index = []
+
+        return index
+
+    def _take_block(self) -> Tuple[bytes, List[Tuple[Dict, int]]]:
+        """
+        Encode the buffered text and resolve the marks into the offsets in it
+        :return: encoded block and the list of (key, offset) of the documents in it
+        """
+        marks: List[Tuple[Dict, int]] = []
+
+        if self.marks:
+            chunks: List[bytes] = [s.encode("utf-8") for s in self.buffer]
+            data: bytes = b"".join(chunks)
+
+            offset: int = 0
+            position: int = 0
+            for key, mark_position in self.marks:
+                # Trailing mark without the document doesn't point anywhere
+                if mark_position == len(chunks):
+                    break
+
+                offset += sum(map(len, chunks[position:mark_position]))
+                position = mark_position
+                marks.append((key, offset))
+        else:
+            data = "".join(self.buffer).encode("utf-8")
+
+        self.buffer = []
+        self.buffered = 0
+        self.marks = []
+
+        return data, marks
+
+    def _write_block(self, compressed: bytes, marks: List[Tuple[Dict, int]]) -> None:
+        block_offset: int = self.fp.tell()
+        self.fp.write(compressed)
+
+        for key, offset in marks:
+            self.index.append(
+                dict(
+                    key,
+                    block_offset=block_offset,
+                    block_size=len(compressed),
+                    offset=offset,
+                )
+            )
+
+    def _submit_block(self) -> None:
+        """
+        Send the buffered text to the pool of threads for the compression, writing out
+        the compressed blocks that are ready, or waiting for them when too many are pending
+        """
+        if self.buffer:
+            data, marks = self._take_block()
+            self.pending.append((self.executor.submit(self.compress, data), marks))
+
+        while self.pending and (
+            self.pending[0][0].done() or len(self.pending) > self.max_pending
+        ):
+            future, marks = self.pending.popleft()
+            self._write_block(future.result(), marks)
+
+    @property
+    def segment_is_full(self) -> bool:
+        return self.segment_buffered >= self.segment_size
+
+    def flush_segment(self) -> int:
+        """
+        Compress the buffered text as a separate segment and write it to the disk
+        :return: size of the file after the segment is written
+        """
+        if self.executor is not None:
+            self._submit_block()
+
+            while self.pending:
+                future, marks = self.pending.popleft()
+                self._write_block(future.result(), marks)
+        elif self.buffer:
+            data, marks = self._take_block()
+            self._write_block(self.compress(data), marks)
+
+        if self.segment_buffered:
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+            self.segment_buffered = 0
+
+        return self.fp.tell()
+
+    def close(self) -> int:
+        """
+        Write the leftovers and close the file
+        :return: size of the file
+        """
+        size: int = self.flush_segment()
+        self.fp.close()
+
+        if self.executor is not None:
+            self.executor.shutdown()
+
+        return size
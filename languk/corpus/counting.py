@@ -0,0 +1,204 @@
+import os
+import heapq
+import pickle
+import pathlib
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# Rough estimate of the memory taken by one entry of the counter (dict slot, tuple
+# of the key, list of the values and the ints in it) besides the characters of the key
+ENTRY_OVERHEAD: int = 240
+
+# Number of the records, pickled at once into the run file
+BLOCK_SIZE: int = 10000
+
+DEFAULT_MEMORY_LIMIT: int = 1024 * 1024 * 1024
+
+
+def write_run(filename: pathlib.Path, records: Iterable) -> None:
+    """
+    Write the sorted records into the run file, block by block
+    :param filename: name of the file
+    :param records: sorted records
+    """
+    with open(filename, "wb") as fp:
+        block: List = []
+
+        for record in records:
+            block.append(record)
+
+            if len(block) == BLOCK_SIZE:
+                pickle.dump(block, fp, protocol=pickle.HIGHEST_PROTOCOL)
+                block = []
+
+        if block:
+            pickle.dump(block, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_run(filename: pathlib.Path) -> Iterator:
+    """
+    Read the records of the run file back
+    """
+    with open(filename, "rb") as fp:
+        while True:
+            try:
+                block: List = pickle.load(fp)
+            except EOFError:
+                return
+
+            yield from block
+
+
+class ExternalSorter:
+    """
+    Sorter of the records, that don't fit into memory: records are accumulated and sorted
+    in memory, then spilled into the run files, which are k-way merged in the end
+    """
+
+    def __init__(
+        self,
+        key: Optional[Callable[[Any], Any]] = None,
+        max_records: int = 1000000,
+        tmp_dir: Optional[pathlib.Path] = None,
+    ) -> None:
+        """
+        :param key: sort key of the records
+        :param max_records: number of the records to keep in memory
+        :param tmp_dir: directory for the run files, the system temporary directory by default
+        """
+        self.key: Optional[Callable[[Any], Any]] = key
+        self.max_records: int = max_records
+        self.tmp_dir: pathlib.Path = pathlib.Path(
+            tempfile.mkdtemp(prefix="sort-", dir=tmp_dir)
+        )
+        self.records: List = []
+        self.runs: List[pathlib.Path] = []
+
+    def add(self, record) -> None:
+        self.records.append(record)
+
+        if len(self.records) >= self.max_records:
+            self.spill()
+
+    def spill(self) -> None:
+        if not self.records:
+            return
+
+        filename: pathlib.Path = self.tmp_dir / f"{len(self.runs)}.run"
+        write_run(filename, sorted(self.records, key=self.key))
+
+        self.runs.append(filename)
+        self.records = []
+
+    def __iter__(self) -> Iterator:
+        return heapq.merge(
+            sorted(self.records, key=self.key),
+            *[read_run(filename) for filename in self.runs],
+            key=self.key,
+        )
+
+    def close(self) -> None:
+        for filename in self.runs:
+            filename.unlink()
+
+        self.tmp_dir.rmdir()
+        self.runs = []
+        self.records = []
+
+    def __enter__(self) -> "ExternalSorter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def merge_runs(filenames: Iterable[pathlib.Path]) -> Iterator[Tuple[Tuple, List[int]]]:
+    """
+    K-way merge of the run files of the counters, values of the same keys are summed up
+    :param filenames: run files, written by SpillingCounter.spill
+    :return: iterator of (key, values), sorted by key
+    """
+    current_key: Optional[Tuple] = None
+    current_values: List[int] = []
+
+    for key, values in heapq.merge(
+        *[read_run(filename) for filename in filenames], key=lambda r: r[0]
+    ):
+        if key == current_key:
+            current_values = [a + b for a, b in zip(current_values, values)]
+            continue
+
+        if current_key is not None:
+            yield current_key, current_values
+
+        current_key, current_values = key, values
+
+    if current_key is not None:
+        yield current_key, current_values
+
+
+class SpillingCounter:
+    """
+    Counter with the bounded memory. Keys are the tuples of strings, each with the same
+    number of integer values (i.e. count and document count). When the estimated size of
+    the counter exceeds the memory limit, counts are sorted by key and spilled into the
+    run file, and the counting starts over. Runs are merged with merge_runs
+    """
+
+    def __init__(
+        self,
+        memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        tmp_dir: Optional[pathlib.Path] = None,
+    ) -> None:
+        """
+        :param memory_limit: approximate memory budget in bytes
+        :param tmp_dir: directory for the run files, the system temporary directory by default
+        """
+        self.memory_limit: int = memory_limit
+        self.tmp_dir: Optional[pathlib.Path] = tmp_dir
+
+        self.counts: Dict[Tuple, List[int]] = {}
+        self.estimated_size: int = 0
+        self.runs: List[pathlib.Path] = []
+
+    def add(self, key: Tuple, *values: int) -> None:
+        counts: Optional[List[int]] = self.counts.get(key)
+
+        if counts is None:
+            self.counts[key] = list(values)
+            self.estimated_size += ENTRY_OVERHEAD + sum(map(len, key))
+
+            if self.estimated_size >= self.memory_limit:
+                self.spill()
+        else:
+            for i, value in enumerate(values):
+                counts[i] += value
+
+    def spill(self) -> None:
+        """
+        Write the counts, accumulated in memory, into the run file
+        """
+        if not self.counts:
+            return
+
+        fd, name = tempfile.mkstemp(prefix="counts-", suffix=".run", dir=self.tmp_dir)
+        os.close(fd)
+
+        filename: pathlib.Path = pathlib.Path(name)
+        write_run(filename, sorted(self.counts.items()))
+
+        self.runs.append(filename)
+        self.counts = {}
+        self.estimated_size = 0
+
+    def pop_runs(self) -> List[pathlib.Path]:
+        """
+        Spill the leftovers and hand the run files over, i.e. to the parent process,
+        which merges them with the runs of the other counters
+        """
+        self.spill()
+        runs: List[pathlib.Path] = self.runs
+        self.runs = []
+
+        return runs
@@ -0,0 +1,475 @@
+"""
+Small expression language to filter the documents of the corpora on export, i.e.
+
+    date_of_publish >= 2020-01-01 and date_of_publish < 2021-01-01
+        and source in (12, 15) and not tags contains "реклама"
+        and (uk_rate >= 0.8 or has langid) and words > 50
+
+Expressions are compiled into the Mongo match clause as much as possible, while the
+parts that cannot be expressed in Mongo (the length and the number of words of the
+exported text) are evaluated in Python on the documents that passed the match.
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+class FilterExpressionError(ValueError):
+    pass
+
+
+# name in the expression -> path of the field in the corpus document
+STORED_FIELDS: Dict[str, str] = {
+    "date_of_publish": "date_of_publish",
+    "date": "date_of_publish",
+    "source": "source",
+    "tags": "tags",
+    "uk_rate": "langid.uk_rate",
+    "lang": "langid.lang",
+}
+
+# Fields, that are calculated from the exported title and text, which exist only in
+# Python, so they are never compiled into the match clause
+COMPUTED_FIELDS: List[str] = ["length", "words"]
+
+COMPARISONS: Dict[str, str] = {
+    "=": "$eq",
+    "==": "$eq",
+    "!=": "$ne",
+    "<": "$lt",
+    "<=": "$lte",
+    ">": "$gt",
+    ">=": "$gte",
+}
+
+KEYWORDS: List[str] = ["and", "or", "not", "in", "contains", "has"]
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<date>\d{4}-\d{2}-\d{2}(?:[T\ ]\d{2}:\d{2}(?::\d{2})?)?)
+    |(?P<number>-?\d+(?:\.\d+)?)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<op><=|>=|==|!=|=|<|>)
+    |(?P<punct>[(),])
+    |(?P<ident>[^\W\d][\w.]*)
+    """,
+    re.VERBOSE,
+)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(expression: str) -> List[Tuple[str, Any]]:
+    """
+    Split the expression into the list of (kind, value) tokens
+    :param expression: filter expression
+    :return: list of tokens
+    """
+    tokens: List[Tuple[str, Any]] = []
+    pos: int = 0
+
+    while pos < len(expression):
+        match = _TOKEN_PATTERN.match(expression, pos)
+
+        if match is None:
+            raise FilterExpressionError(
+                f"Unexpected character {expression[pos]!r} at position {pos}"
+            )
+
+        kind: str = match.lastgroup
+        value: str = match.group()
+        pos = match.end()
+
+        if kind == "space":
+            continue
+        if kind == "date":
+            try:
+                tokens.append(("value", datetime.fromisoformat(value)))
+            except ValueError:
+                raise FilterExpressionError(f"Cannot parse the date {value!r}")
+        elif kind == "number":
+            tokens.append(("value", float(value) if "." in value else int(value)))
+        elif kind == "string":
+            tokens.append(("value", re.sub(r"\\(.)", r"\1", value[1:-1])))
+        elif kind == "ident" and value.lower() in KEYWORDS:
+            tokens.append((value.lower(), value))
+        else:
+            tokens.append((kind, value))
+
+    return tokens
+
+
+def _get_path(article: Dict, path: str) -> Any:
+    value: Any = article
+
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+
+    # Dates might be stored as dates or strings, they are compared as datetimes
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if path == "date_of_publish" and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+
+    return value
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    if op == "$ne":
+        return value != operand
+    if value is None:
+        return False
+
+    try:
+        if op == "$eq":
+            return value == operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+    except TypeError:
+        # Mongo doesn't match the values of the different types either
+        return False
+
+    raise FilterExpressionError(f"Unknown comparison {op}")
+
+
+class Node:
+    def to_mongo(self) -> Optional[Dict]:
+        """
+        Compile the node into Mongo match clause
+        :return: match clause or None if the node can only be evaluated in Python
+        """
+        raise NotImplementedError()
+
+    def evaluate(self, article: Dict) -> bool:
+        """
+        Evaluate the node on the document
+        :param article: document with the metadata and the exported title and text
+        """
+        raise NotImplementedError()
+
+    def get_fields(self) -> Set[str]:
+        """
+        Top-level fields of the corpus document, required to evaluate the node in Python
+        """
+        raise NotImplementedError()
+
+
+@dataclass
+class BoolOp(Node):
+    op: str
+    children: List[Node]
+
+    def to_mongo(self) -> Optional[Dict]:
+        clauses: List[Optional[Dict]] = [child.to_mongo() for child in self.children]
+
+        if any(clause is None for clause in clauses):
+            return None
+
+        return {f"${self.op}": clauses}
+
+    def evaluate(self, article: Dict) -> bool:
+        if self.op == "and":
+            return all(child.evaluate(article) for child in self.children)
+
+        return any(child.evaluate(article) for child in self.children)
+
+    def get_fields(self) -> Set[str]:
+        return set().union(*[child.get_fields() for child in self.children])
+
+
+@dataclass
+class Not(Node):
+    child: Node
+
+    def to_mongo(self) -> Optional[Dict]:
+        clause: Optional[Dict] = self.child.to_mongo()
+
+        return None if clause is None else {"$nor": [clause]}
+
+    def evaluate(self, article: Dict) -> bool:
+        return not self.child.evaluate(article)
+
+    def get_fields(self) -> Set[str]:
+        return self.child.get_fields()
+
+
+@dataclass
+class HasLayer(Node):
+    layer_name: str
+
+    def to_mongo(self) -> Optional[Dict]:
+        return {f"layers.{self.layer_name}": {"$exists": True}}
+
+    def evaluate(self, article: Dict) -> bool:
+        return self.layer_name in (article.get("layers") or {})
+
+    def get_fields(self) -> Set[str]:
+        return {"layers"}
+
+
+@dataclass
+class Comparison(Node):
+    name: str
+    op: str
+    operand: Any
+
+    def to_mongo(self) -> Optional[Dict]:
+        if self.name in COMPUTED_FIELDS:
+            return None
+
+        path: str = STORED_FIELDS[self.name]
+
+        if self.op == "$in":
+            return {path: {"$in": self.operand}}
+        if self.op == "contains":
+            return {path: self.operand}
+
+        return {path: {self.op: self.operand}}
+
+    def evaluate(self, article: Dict) -> bool:
+        if self.name in COMPUTED_FIELDS:
+            title_and_text: str = (article.get("title") or "") + (
+                article.get("text") or ""
+            )
+
+            if self.name == "length":
+                value: Any = len(title_and_text)
+            else:
+                value = len(_WORD_PATTERN.findall(title_and_text))
+
+            return _compare(value, self.op, self.operand)
+
+        value = _get_path(article, STORED_FIELDS[self.name])
+
+        if self.op == "contains":
+            return isinstance(value, list) and self.operand in value
+
+        if self.op == "$in":
+            if isinstance(value, list):
+                return any(v in self.operand for v in value)
+            return value in self.operand
+
+        return _compare(value, self.op, self.operand)
+
+    def get_fields(self) -> Set[str]:
+        if self.name in COMPUTED_FIELDS:
+            return {"title", "text"}
+
+        return {STORED_FIELDS[self.name].split(".")[0]}
+
+
+class Parser:
+    """
+    Recursive descent parser of the filter expressions:
+
+        expression := conjunction ("or" conjunction)*
+        conjunction := negation ("and" negation)*
+        negation := "not" negation | "(" expression ")" | "has" IDENT | comparison
+        comparison := FIELD OP value | FIELD "in" "(" value ("," value)* ")"
+            | FIELD "contains" value
+    """
+
+    def __init__(self, expression: str) -> None:
+        self.tokens: List[Tuple[str, Any]] = tokenize(expression)
+        self.pos: int = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self, kind: str) -> Any:
+        if self.peek() != kind:
+            found: str = (
+                repr(self.tokens[self.pos][1])
+                if self.pos < len(self.tokens)
+                else "end of the expression"
+            )
+            raise FilterExpressionError(f"Expected {kind}, found {found}")
+
+        value: Any = self.tokens[self.pos][1]
+        self.pos += 1
+
+        return value
+
+    def parse(self) -> Node:
+        node: Node = self.parse_expression()
+
+        if self.peek() is not None:
+            raise FilterExpressionError(
+                f"Unexpected {self.tokens[self.pos][1]!r} after the end of the expression"
+            )
+
+        return node
+
+    def parse_expression(self) -> Node:
+        children: List[Node] = [self.parse_conjunction()]
+
+        while self.peek() == "or":
+            self.take("or")
+            children.append(self.parse_conjunction())
+
+        return children[0] if len(children) == 1 else BoolOp("or", children)
+
+    def parse_conjunction(self) -> Node:
+        children: List[Node] = []
+
+        while True:
+            node: Node = self.parse_negation()
+
+            # Nested conjunctions are flattened, so more of them can be pushed to Mongo
+            if isinstance(node, BoolOp) and node.op == "and":
+                children += node.children
+            else:
+                children.append(node)
+
+            if self.peek() != "and":
+                break
+            self.take("and")
+
+        return children[0] if len(children) == 1 else BoolOp("and", children)
+
+    def parse_negation(self) -> Node:
+        if self.peek() == "not":
+            self.take("not")
+            return Not(self.parse_negation())
+
+        if self.peek() == "punct" and self.tokens[self.pos][1] == "(":
+            self.take("punct")
+            node: Node = self.parse_expression()
+            self.take_punct(")")
+            return node
+
+        if self.peek() == "has":
+            self.take("has")
+            return HasLayer(self.take("ident"))
+
+        return self.parse_comparison()
+
+    def take_punct(self, char: str) -> None:
+        if self.peek() != "punct" or self.tokens[self.pos][1] != char:
+            raise FilterExpressionError(f"Expected {char!r}")
+        self.pos += 1
+
+    def parse_comparison(self) -> Node:
+        name: str = self.take("ident")
+
+        if name not in STORED_FIELDS and name not in COMPUTED_FIELDS:
+            raise FilterExpressionError(
+                f"Unknown field {name!r}, known fields are "
+                + ", ".join(list(STORED_FIELDS) + COMPUTED_FIELDS)
+            )
+
+        if self.peek() == "in":
+            self.take("in")
+            self.take_punct("(")
+            values: List[Any] = [self.take_value(name)]
+
+            while self.peek() == "punct" and self.tokens[self.pos][1] == ",":
+                self.take_punct(",")
+                values.append(self.take_value(name))
+
+            self.take_punct(")")
+            return Comparison(name, "$in", values)
+
+        if self.peek() == "contains":
+            self.take("contains")
+
+            if name != "tags":
+                raise FilterExpressionError("Only tags can be used with contains")
+
+            return Comparison(name, "contains", self.take("value"))
+
+        op: str = COMPARISONS[self.take("op")]
+
+        if name == "tags":
+            raise FilterExpressionError("Tags can only be used with contains and in")
+
+        return Comparison(name, op, self.take_value(name))
+
+    def take_value(self, name: str) -> Any:
+        value: Any = self.take("value")
+
+        # Quoted dates are parsed as well, so they are compared as dates both in Mongo
+        # and in Python
+        if STORED_FIELDS.get(name) == "date_of_publish" and isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                raise FilterExpressionError(f"Cannot parse the date {value!r}")
+
+        return value
+
+
+@dataclass
+class CompiledFilter:
+    # Part of the expression, compiled into the Mongo match clause
+    match: Dict = field(default_factory=dict)
+
+    # Part of the expression to evaluate in Python, None if everything goes to Mongo
+    remainder: Optional[Node] = None
+
+    def evaluate(self, article: Dict) -> bool:
+        return self.remainder is None or self.remainder.evaluate(article)
+
+    @property
+    def fields(self) -> Set[str]:
+        """
+        Fields of the corpus document, required to evaluate the remainder
+        """
+        return set() if self.remainder is None else self.remainder.get_fields()
+
+
+@lru_cache(maxsize=32)
+def compile_filter(expression: str) -> CompiledFilter:
+    """
+    Parse the expression and split it into the Mongo match clause and the
+    remainder, which is evaluated in Python
+    :param expression: filter expression
+    :return: compiled filter
+    """
+    if not expression.strip():
+        return CompiledFilter()
+
+    node: Node = Parser(expression).parse()
+    conjuncts: List[Node] = (
+        node.children if isinstance(node, BoolOp) and node.op == "and" else [node]
+    )
+
+    clauses: List[Dict] = []
+    remainder: List[Node] = []
+
+    for conjunct in conjuncts:
+        clause: Optional[Dict] = conjunct.to_mongo()
+
+        if clause is None:
+            remainder.append(conjunct)
+        else:
+            clauses.append(clause)
+
+    compiled: CompiledFilter = CompiledFilter()
+
+    if len(clauses) == 1:
+        compiled.match = clauses[0]
+    elif clauses:
+        compiled.match = {"$and": clauses}
+
+    if len(remainder) == 1:
+        compiled.remainder = remainder[0]
+    elif remainder:
+        compiled.remainder = BoolOp("and", remainder)
+
+    return compiled
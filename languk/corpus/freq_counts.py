@@ -0,0 +1,157 @@
+import json
+import shutil
+import pathlib
+import itertools
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from corpus.counting import read_run, write_run
+
+
+# Version of the layout of the stored counts, artifacts of the other versions are ignored
+COUNTS_FORMAT: int = 1
+
+# Number of the versions of the counts of each corpus to keep on the disk
+KEEP_VERSIONS: int = 3
+
+_MANIFEST: str = "manifest.json"
+
+
+def get_filtering_key(filtering: Iterable[str]) -> str:
+    """
+    Key of the filters, applied to the counted documents, same as in the names of the exports
+    """
+    filtering = sorted(filtering)
+
+    return "filter_" + "+".join(filtering) if filtering else "nofilter"
+
+
+class CountsArtifact:
+    """
+    Stored raw counts of the lemmas of one corpus: sorted run file of
+    ((pos, lemma), [count, doc_count]) for each pos and the manifest with the totals
+    and the moment the documents were counted until, so the next run can count only
+    the documents tagged after it and merge them in
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        """
+        :param path: directory of the version of the counts
+        """
+        self.path: pathlib.Path = path
+        self.manifest: Dict = json.loads((path / _MANIFEST).read_text())
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"]
+
+    @property
+    def counted_until(self) -> str:
+        return self.manifest["counted_until"]
+
+    @property
+    def runs(self) -> List[pathlib.Path]:
+        return [
+            self.path / self.manifest["runs"][pos]
+            for pos in sorted(self.manifest["runs"])
+        ]
+
+    def __iter__(self):
+        for run in self.runs:
+            yield from read_run(run)
+
+
+class CountsStore:
+    """
+    Versioned raw counts of the corpora, each corpus and set of filters in its own
+    directory, one subdirectory per version
+    """
+
+    def __init__(self, basedir: pathlib.Path) -> None:
+        self.basedir: pathlib.Path = pathlib.Path(basedir)
+
+    def get_dir(self, corpus: str, filtering: Iterable[str]) -> pathlib.Path:
+        return self.basedir / f"{corpus}.{get_filtering_key(filtering)}"
+
+    def get_versions(self, corpus: str, filtering: Iterable[str]) -> List[int]:
+        """
+        Complete versions of the counts, oldest first
+        """
+        path: pathlib.Path = self.get_dir(corpus, filtering)
+
+        if not path.exists():
+            return []
+
+        return sorted(
+            int(version.name)
+            for version in path.iterdir()
+            if version.name.isdigit() and (version / _MANIFEST).exists()
+        )
+
+    def get_latest(
+        self, corpus: str, filtering: Iterable[str]
+    ) -> Optional[CountsArtifact]:
+        """
+        Latest version of the counts of the corpus, or None, when there is no
+        compatible one
+        """
+        for version in reversed(self.get_versions(corpus, filtering)):
+            artifact: CountsArtifact = CountsArtifact(
+                self.get_dir(corpus, filtering) / f"{version:06d}"
+            )
+
+            if artifact.manifest.get("format") == COUNTS_FORMAT:
+                return artifact
+
+        return None
+
+    def write(
+        self,
+        corpus: str,
+        filtering: Iterable[str],
+        records: Iterable[Tuple[Tuple[str, str], List[int]]],
+        manifest: Dict,
+    ) -> CountsArtifact:
+        """
+        Store the new version of the counts. Version becomes visible only once it is
+        complete, older versions above KEEP_VERSIONS are removed
+        :param corpus: corpus name
+        :param filtering: filters, applied to the counted documents
+        :param records: ((pos, lemma), [count, doc_count]), sorted by (pos, lemma)
+        :param manifest: totals_by_pos, processed_articles, counted_until and the rest
+            of the description of the counts
+        :return: stored version
+        """
+        filtering = sorted(filtering)
+        versions: List[int] = self.get_versions(corpus, filtering)
+        version: int = versions[-1] + 1 if versions else 1
+
+        path: pathlib.Path = self.get_dir(corpus, filtering) / f"{version:06d}"
+        tmp_path: pathlib.Path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        runs: Dict[str, str] = {}
+        for pos, group in itertools.groupby(records, key=lambda r: r[0][0]):
+            runs[pos] = f"{len(runs):03d}.run"
+            write_run(tmp_path / runs[pos], group)
+
+        (tmp_path / _MANIFEST).write_text(
+            json.dumps(
+                dict(
+                    manifest,
+                    format=COUNTS_FORMAT,
+                    version=version,
+                    corpus=corpus,
+                    filtering=filtering,
+                    runs=runs,
+                ),
+                ensure_ascii=False,
+                indent=2,
+            )
+        )
+        tmp_path.rename(path)
+
+        for old in versions[: max(len(versions) + 1 - KEEP_VERSIONS, 0)]:
+            shutil.rmtree(self.get_dir(corpus, filtering) / f"{old:06d}")
+
+        return CountsArtifact(path)
@@ -1,14 +1,35 @@
 import re
+import os
 import json
 import logging
 import bz2
 import lzma
 import pathlib
 import csv
-from hashlib import sha1
-from collections import defaultdict, Counter
-from typing import TextIO, Optional, Dict, List, Tuple
-
+import time
+import random
+import tempfile
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from hashlib import sha1, sha256
+from collections import defaultdict, Counter, deque
+from typing import (
+    Any,
+    TextIO,
+    Optional,
+    Dict,
+    List,
+    Tuple,
+    Callable,
+    Iterable,
+    Iterator,
+    Deque,
+)
+
+import bson
 import pymongo
 import gcld3
 
@@ -17,9 +38,56 @@ from django.core.serializers.json import DjangoJSONEncoder
 from django_task.job import Job
 
 from corpus.utils import md_to_text2, batch_iterator
-from corpus.ud_converter import COMPRESS_UPOS_MAPPING, compress_features, decompress
+from corpus.ud_converter import (
+    COMPRESS_UPOS_MAPPING,
+    BINARY_ENCODING,
+    LemmaVocabulary,
+    UPOS_NAMES,
+    DecodedField,
+    MalformedLayerError,
+    compress_features,
+    decode_batch,
+    encode_binary,
+    decode_binary,
+)
 from corpus.models import _CORPORA_CHOICES, Corpus
 from corpus.nlp_uk_client import NlpUkClient, NlpUkApiException
+from corpus.nlp_batching import (
+    AdaptiveBudget,
+    split_text,
+    stitch_results,
+    iter_slices,
+)
+from corpus.compression import (
+    SegmentedWriter,
+    COMPRESSION_EXTENSIONS,
+    DEFAULT_INDEX_INTERVAL,
+)
+from corpus.parquet_writer import ParquetArticleWriter
+from corpus.sketch import FrequencySketch, get_sketch_filename
+from corpus.freq_counts import CountsStore, CountsArtifact
+from corpus.ngrams import (
+    NGRAM_SEGMENT_SIZE,
+    NGRAM_INDEX_INTERVAL,
+    get_ngrams,
+    get_index_filename,
+    get_manifest_filename,
+)
+from corpus.counting import (
+    ENTRY_OVERHEAD,
+    ExternalSorter,
+    SpillingCounter,
+    merge_runs,
+)
+from corpus.filter_dsl import compile_filter, CompiledFilter
+from corpus.udpipe_cache import SentenceTagCache, get_model_id
+from corpus.minhash import (
+    LSHIndex,
+    get_shingles,
+    get_signature,
+    pack_signature,
+    unpack_signature,
+)
 
 
 detector = gcld3.NNetLanguageIdentifier(min_num_bytes=0, max_num_bytes=1000)
@@ -27,11 +95,21 @@ detector = gcld3.NNetLanguageIdentifier(min_num_bytes=0, max_num_bytes=1000)
 word_pattern = re.compile(r"[а-яіїєґА-ЯІЇЄҐa-zA-Z0-9]")
 
 
+# Minimal share of the characters in the Ukrainian paragraphs, see DetectLanguageJob
+_UK_RATE_THRESHOLD: float = 0.5
+
+
 def _filter_rus_gcld(task: Dict) -> bool:
     """
-    Filter out Russian texts with gcld3
+    Filter out Russian texts using the language identification, stored by
+    DetectLanguageJob, or with gcld3 for the documents that weren't processed yet
     :param task: article
     """
+    langid: Optional[Dict] = task.get("langid")
+
+    if langid is not None:
+        return langid["uk_rate"] >= _UK_RATE_THRESHOLD and langid["reliable"]
+
     result = detector.FindLanguage(
         text=task.get("text", "") + " " + task.get("title", "")
     )
@@ -39,13 +117,106 @@ def _filter_rus_gcld(task: Dict) -> bool:
     return result.language == "uk" and result.is_reliable
 
 
+def _mongo_filter_rus_gcld(task) -> Dict:
+    """
+    Mongo-side counterpart of _filter_rus_gcld. Documents without the stored language
+    identification are passed through to be checked with gcld3
+    :param task: task instance
+    """
+    return {
+        "$or": [
+            {"langid": {"$exists": False}},
+            {
+                "langid.uk_rate": {"$gte": _UK_RATE_THRESHOLD},
+                "langid.reliable": True,
+            },
+        ]
+    }
+
+
+# Minimal length of the title and text combined, see _filter_short
+_SHORT_TEXT_LENGTH: int = 100
+
+
 def _filter_short(task: Dict) -> bool:
     """
     Filter out short texts
     :param task: article
     """
 
-    return len(task.get("text", "") + task.get("title", "")) >= 100
+    return (
+        len((task.get("text") or "") + (task.get("title") or "")) >= _SHORT_TEXT_LENGTH
+    )
+
+
+def _mongo_filter_short(task) -> Dict:
+    """
+    Mongo-side counterpart of _filter_short, which measures the original title and text,
+    so the short documents are rejected before the layers are looked up and sent over.
+    It matches the Python filter only when the latter measures the stored texts as well
+    :param task: task instance
+    """
+    return {
+        "$expr": {
+            "$gte": [
+                {
+                    "$add": [
+                        {"$strLenCP": {"$ifNull": ["$title", ""]}},
+                        {"$strLenCP": {"$ifNull": ["$text", ""]}},
+                    ]
+                },
+                _SHORT_TEXT_LENGTH,
+            ]
+        }
+    }
+
+
+def _filter_dedup(task: Dict) -> bool:
+    """
+    Filter out near-duplicates, found by DeduplicateJob. The first text of each
+    cluster of near-duplicates is kept
+    :param task: article
+    """
+    return not (task.get("dedup") or {}).get("duplicate", False)
+
+
+def _mongo_filter_dedup(task) -> Dict:
+    """
+    Mongo-side counterpart of _filter_dedup
+    :param task: task instance
+    """
+    return {"dedup.duplicate": {"$ne": True}}
+
+
+# UDPipe model and its id, loaded by TagWithUDPipeJob before the pool of workers is forked
+_udpipe_model = None
+_udpipe_model_id: Optional[str] = None
+
+# Cache of the tagged sentences of the current process, see TagWithUDPipeJob.get_tag_cache
+_tag_cache: Optional[SentenceTagCache] = None
+
+# Shared counter of the processed documents, inherited by the workers of BaseCorpusTask.run_in_pool
+_pool_progress = None
+
+
+def _init_pool_worker(
+    progress, initializer: Optional[Callable], initargs: Tuple
+) -> None:
+    global _pool_progress
+    _pool_progress = progress
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def report_pool_progress(processed: int) -> None:
+    """
+    Report the number of processed documents from the worker process to the parent
+    :param processed: number of documents processed since the last report
+    """
+    if _pool_progress is not None and processed:
+        with _pool_progress.get_lock():
+            _pool_progress.value += processed
 
 
 class BaseCorpusTask(Job):
@@ -71,12 +242,94 @@ class BaseCorpusTask(Job):
     def get_layer_id(corpus: str, id_: str, layer_name: str) -> str:
         return sha1(f"{corpus}/{id_}/{layer_name}".encode()).hexdigest()
 
+    @staticmethod
+    def merge_mongo_filters(*clauses: Optional[Dict]) -> Dict:
+        """
+        Combine match clauses with $and, skipping the empty ones
+        """
+        clauses = [clause for clause in clauses if clause]
+
+        if not clauses:
+            return {}
+        if len(clauses) == 1:
+            return clauses[0]
+
+        return {"$and": clauses}
+
+    @staticmethod
+    def get_filtering_clause(mongo_filters: Dict[str, Callable], task) -> Dict:
+        """
+        Combine the Mongo-side predicates of the filters, selected in the task. Python
+        implementations of the filters are still applied to the documents that pass
+        :param mongo_filters: filter name -> function that returns the match clause for the task
+        :param task: task instance
+        """
+        return BaseCorpusTask.merge_mongo_filters(
+            *[
+                mongo_filters[filt](task)
+                for filt in task.filtering
+                if filt in mongo_filters
+            ]
+        )
+
+    @staticmethod
+    def run_in_pool(
+        task,
+        func: Callable,
+        jobs: Iterable[Tuple],
+        workers: int,
+        total_docs: int,
+        initializer: Optional[Callable] = None,
+        initargs: Tuple = (),
+    ) -> List:
+        """
+        Run func(*args) for every args in jobs on a pool of forked processes.
+        Workers report processed documents with report_pool_progress, which
+        is aggregated into the task progress
+        :param task: task instance
+        :param func: function to call, must be picklable
+        :param jobs: list of argument tuples
+        :param workers: number of worker processes
+        :param total_docs: total number of documents, used to calculate the progress
+        :param initializer: optional initializer of the worker process
+        :param initargs: arguments for the initializer
+        :return: results in the order of jobs
+        """
+        from django.db import connections
+
+        ctx = multiprocessing.get_context("fork")
+        progress = ctx.Value("q", 0)
+
+        # Forked workers must not share the connection to the postgres with the parent
+        connections.close_all()
+
+        with ProcessPoolExecutor(
+            max_workers=max(workers, 1),
+            mp_context=ctx,
+            initializer=_init_pool_worker,
+            initargs=(progress, initializer, initargs),
+        ) as executor:
+            futures = [executor.submit(func, *args) for args in jobs]
+            pending = set(futures)
+
+            while pending:
+                _, pending = wait(pending, timeout=10, return_when=FIRST_COMPLETED)
+
+                if total_docs:
+                    task.set_progress(
+                        min(progress.value, total_docs) * 100 // total_docs, step=1
+                    )
+
+            return [future.result() for future in futures]
+
     @staticmethod
     def generate_filename(
         job,
         task,
         basedir: str = settings.CORPUS_EXPORT_PATH,
         file_prefix: str = "ubertext",
+        since: Optional[datetime] = None,
+        shard: Optional[str] = None,
     ) -> pathlib.Path:
         suffixes: List[Tuple[str, str]] = []
 
@@ -96,9 +349,26 @@ class BaseCorpusTask(Job):
             else:
                 suffixes.append(("filtering", "filter_" + "+".join(filtering)))
 
+        if getattr(task, "filter_expression", ""):
+            suffixes.append(
+                (
+                    "expression",
+                    "expr_" + sha1(task.filter_expression.encode()).hexdigest()[:8],
+                )
+            )
+
         if hasattr(task, "processing"):
             suffixes.append(("processing", task.processing))
 
+        if getattr(task, "counting", "exact") != "exact":
+            suffixes.append(("counting", task.counting))
+
+        if since is not None:
+            suffixes.append(("since", f"delta_since_{since:%Y%m%d%H%M%S}"))
+
+        if shard is not None:
+            suffixes.append(("shard", shard))
+
         if hasattr(task, "file_format"):
             suffixes.append(("file_format", task.file_format))
 
@@ -106,19 +376,48 @@ class BaseCorpusTask(Job):
             ".".join([file_prefix] + [suf for _, suf in suffixes])
         )
 
-        if hasattr(task, "file_compression"):
-            if task.file_compression == "bz2":
-                return filename.with_name(filename.name + ".bz2")
-            if task.file_compression == "lzma":
-                return filename.with_name(filename.name + ".xz")
+        # Parquet files are compressed column by column
+        if (
+            hasattr(task, "file_compression")
+            and getattr(task, "file_format", None) != "parquet"
+        ):
+            return filename.with_name(
+                filename.name + COMPRESSION_EXTENSIONS[task.file_compression]
+            )
 
         return filename
 
     @staticmethod
-    def any_open(filename: pathlib.Path) -> TextIO:
+    def describe_file(filename: pathlib.Path) -> Dict:
+        """
+        Get the name, size and SHA-256 checksum of the file for the manifest
+        """
+        checksum = sha256()
+
+        with open(filename, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+                checksum.update(chunk)
+
+        return {
+            "filename": str(filename),
+            "size": filename.stat().st_size,
+            "sha256": checksum.hexdigest(),
+        }
+
+    @staticmethod
+    def any_open(filename: pathlib.Path, task=None) -> TextIO:
         """
-        Open file using the opener, deducted from the file extension
+        Open file using the opener, deducted from the file extension, or from the
+        compression settings of the task, when it is given
         """
+        if task is not None and task.file_compression not in ("none", "bz2", "lzma"):
+            return SegmentedWriter(
+                filename,
+                task.file_compression,
+                level=task.compression_level,
+                threads=task.compression_threads,
+            )
+
         if filename.suffix == ".bz2":
             return bz2.open(filename, "wt")
         elif filename.suffix == ".xz":
@@ -135,6 +434,14 @@ class ExportCorpusJob(BaseCorpusTask):
     _filters = {
         "short": _filter_short,
         "rus_gcld": _filter_rus_gcld,
+        "dedup": _filter_dedup,
+    }
+
+    # Optional Mongo-side predicates of the filters above
+    _mongo_filters = {
+        "short": _mongo_filter_short,
+        "rus_gcld": _mongo_filter_rus_gcld,
+        "dedup": _mongo_filter_dedup,
     }
 
     _task_to_layer = {
@@ -145,43 +452,154 @@ class ExportCorpusJob(BaseCorpusTask):
         "lemmas": ["lemmatized"],
     }
 
+    # Processings, that export the stored title and text as is. Others are measured
+    # by _filter_short after the processing, i.e. the joined tokens, which might be
+    # longer than the stored text, so the short filter is not pushed down for them
+    _stored_text_processings = ["orig", "orig_titles"]
+
     @staticmethod
-    def _get_mongo_filter(task) -> dict:
+    def _get_mongo_filter(task, since: Optional[str] = None) -> dict:
+        mongo_filters: Dict[str, Callable] = ExportCorpusJob._mongo_filters
+        if task.processing not in ExportCorpusJob._stored_text_processings:
+            mongo_filters = {
+                name: mongo_filter
+                for name, mongo_filter in mongo_filters.items()
+                if name != "short"
+            }
+
+        filtering_clause: Dict = ExportCorpusJob.merge_mongo_filters(
+            ExportCorpusJob.get_filtering_clause(mongo_filters, task),
+            compile_filter(task.filter_expression).match,
+        )
+
         # export routines for the original texts doesn't require any processing and layers
-        if task.processing in ["orig", "orig_titles"]:
-            return {}
+        if task.processing in ExportCorpusJob._stored_text_processings:
+            return ExportCorpusJob.merge_mongo_filters(
+                ExportCorpusJob.get_delta_clause(since), filtering_clause
+            )
 
         # All the rest relies on the texts that are already processed by NLP-UK
-        return {"processing_status": {"$in": ["nlp_uk"]}}
+        return ExportCorpusJob.merge_mongo_filters(
+            {"processing_status": {"$in": ["nlp_uk"]}},
+            ExportCorpusJob.get_delta_clause(since),
+            filtering_clause,
+        )
 
     @staticmethod
-    def get_total_count(db, job, task) -> int:
+    def get_delta_clause(since: Optional[str]) -> Dict:
+        """
+        Match clause for the documents, added or reprocessed after the given moment
+        :param since: moment in iso format or None for the full export
+        """
+        if since is None:
+            return {}
+
+        return {"updated_at": {"$gt": datetime.fromisoformat(since)}}
+
+    @staticmethod
+    def get_total_count(db, job, task, since: Optional[str] = None) -> int:
         total = 0
         for corpus in task.corpora:
-            total += db[corpus].count_documents(ExportCorpusJob._get_mongo_filter(task))
+            total += db[corpus].count_documents(
+                ExportCorpusJob._get_mongo_filter(task, since)
+            )
 
         return total
 
+    @staticmethod
+    def get_base_task(task):
+        """
+        Find the latest successful export with the same corpora, filtering, filter expression
+        and processing, that was started before the given one
+        :param task: task instance
+        :return: task instance or None
+        """
+        from .models import ExportCorpusTask
+
+        candidates = (
+            ExportCorpusTask.objects.filter(
+                status="SUCCESS",
+                processing=task.processing,
+                filter_expression=task.filter_expression,
+                dry_run=False,
+                started_on__isnull=False,
+            )
+            .exclude(pk=task.pk)
+            .order_by("-started_on")
+        )
+
+        if task.started_on is not None:
+            candidates = candidates.filter(started_on__lt=task.started_on)
+
+        for candidate in candidates:
+            if sorted(candidate.corpora) == sorted(task.corpora) and sorted(
+                candidate.filtering
+            ) == sorted(task.filtering):
+                return candidate
+
+        return None
+
+    @staticmethod
+    def stamp_unmarked(db, task) -> None:
+        """
+        Documents, that came to the corpora from the scrapers, have no change marker yet.
+        They are stamped with the start of the export, so they are included into it
+        and skipped by the next incremental export
+        """
+        stamp: datetime = task.started_on or datetime.now(timezone.utc)
+
+        for corpus in task.corpora:
+            db[corpus].create_index("updated_at")
+            db[corpus].update_many(
+                {"updated_at": {"$exists": False}}, {"$set": {"updated_at": stamp}}
+            )
+
+    @staticmethod
+    def get_cursor(
+        task, corpus: str, match_clause: Optional[Dict] = None, database=None
+    ):
+        """
+        Get cursor over the articles of the corpus with the layers required for the processing,
+        ordered by id
+        :param task: task instance
+        :param corpus: corpus name
+        :param match_clause: additional match clause, i.e. range of ids of the shard
+        :param database: database to use instead of the default one
+        """
+        match_clause = ExportCorpusJob.merge_mongo_filters(
+            ExportCorpusJob._get_mongo_filter(task), match_clause
+        )
+
+        if task.processing in ["orig", "orig_titles"]:
+            return Corpus.get_articles_with_layers(
+                collection=corpus,
+                layer_names=[],
+                match_clause=match_clause,
+                project_clause=dict(
+                    # Fields to evaluate the part of the filter expression in Python
+                    {f: 1 for f in compile_filter(task.filter_expression).fields},
+                    title=1,
+                    text=1 if task.processing == "orig" else 0,
+                    langid=1,
+                    dedup=1,
+                ),
+                database=database,
+                sort_clause={"_id": 1},
+            )
+
+        return Corpus.get_articles_with_layers(
+            collection=corpus,
+            layer_names=ExportCorpusJob._task_to_layer[task.processing],
+            match_clause=match_clause,
+            project_clause={"title": 0, "text": 0, "clean": 0, "nlp": 0},
+            database=database,
+            sort_clause={"_id": 1},
+        )
+
     @staticmethod
     def get_iter(db, job, task):
         for corpus in task.corpora:
-            if task.processing in ["orig", "orig_titles"]:
-                cursor = Corpus.get_articles_with_layers(
-                    collection=corpus,
-                    layer_names=[],
-                    match_clause=ExportCorpusJob._get_mongo_filter(task),
-                    project_clause={
-                        "title": 1,
-                        "text": 1 if task.processing == "orig" else 0,
-                    },
-                )
-            else:
-                cursor = Corpus.get_articles_with_layers(
-                    collection=corpus,
-                    layer_names=ExportCorpusJob._task_to_layer[task.processing],
-                    match_clause=ExportCorpusJob._get_mongo_filter(task),
-                    project_clause={"title": 0, "text": 0, "clean": 0, "nlp": 0},
-                )
+            cursor = ExportCorpusJob.get_cursor(task, corpus)
 
             for article in cursor:
                 yield corpus, article
@@ -200,13 +618,22 @@ class ExportCorpusJob(BaseCorpusTask):
         return True
 
     @staticmethod
-    def write_article(job, task, fp: TextIO, article: Dict) -> bool:
+    def write_article(
+        job,
+        task,
+        fp: TextIO,
+        article: Dict,
+        corpus: Optional[str] = None,
+        counters: Optional[Dict] = None,
+    ) -> bool:
         """
         Write article from a corresponding layer to file
         :param job: job instance
         :param task: task instance
-        :param fp: file pointer
+        :param fp: file pointer (or ParquetArticleWriter for the parquet format)
         :param article: article
+        :param corpus: corpus of the article
+        :param counters: optional dict to count the written tokens in
         """
 
         def join_sentences(sentences: List[str]) -> str:
@@ -273,10 +700,21 @@ class ExportCorpusJob(BaseCorpusTask):
             text = join_sentences(article["sentenced"].get("text", []))
 
         if not ExportCorpusJob.apply_filter(
-            task=task, article={"title": title, "text": text}
+            task=task,
+            article={
+                "title": title,
+                "text": text,
+                "langid": article.get("langid"),
+                "dedup": article.get("dedup"),
+            },
         ):
             return False
 
+        # The part of the filter expression, that cannot be evaluated by Mongo
+        expression: CompiledFilter = compile_filter(task.filter_expression)
+        if not expression.evaluate(dict(article, title=title, text=text)):
+            return False
+
         if task.file_format == "txt":
             if task.processing == "orig_titles":
                 fp.write(f"{title}\n\n")
@@ -299,6 +737,8 @@ class ExportCorpusJob(BaseCorpusTask):
                         "text",
                         "layers",
                         "processing_status",
+                        "langid",
+                        "dedup",
                     ]
                 }
                 doc["title"] = title
@@ -307,149 +747,787 @@ class ExportCorpusJob(BaseCorpusTask):
                 fp.write(
                     f"{json.dumps(doc, ensure_ascii=False, sort_keys=True, cls=DjangoJSONEncoder)}\n"
                 )
+        elif task.file_format == "parquet":
+            row: Dict = ParquetArticleWriter.get_metadata(article)
+            row.update(
+                {
+                    "corpus": corpus,
+                    "_id": article["_id"],
+                    "title": title,
+                    "text": text,
+                }
+            )
+
+            for layer_name in ExportCorpusJob._task_to_layer.get(task.processing, []):
+                for f in ["title", "text"]:
+                    row[f"{layer_name}_{f}"] = article[layer_name].get(f)
+
+            fp.write_row(row)
+
+        if counters is not None:
+            counters["tokens"] += len((title or "").split()) + len((text or "").split())
 
         return True
 
     @staticmethod
-    def execute(job, task):
-        from .mongodb import get_db
+    def write_manifest(filename: pathlib.Path, manifest: Dict) -> pathlib.Path:
+        """
+        Write the manifest of the export next to the exported file
+        :param filename: name of the exported file
+        :param manifest: manifest contents
+        :return: name of the manifest file
+        """
+        manifest_filename: pathlib.Path = filename.with_name(
+            filename.name + ".manifest.json"
+        )
 
-        db = get_db()
+        with open(manifest_filename, "w", encoding="utf-8") as fp:
+            json.dump(manifest, fp, ensure_ascii=False, indent=2, cls=DjangoJSONEncoder)
 
-        total_docs: int = ExportCorpusJob.get_total_count(db, job, task)
-        stored_articles: int = 0
+        return manifest_filename
 
-        filename: pathlib.Path = ExportCorpusJob.generate_filename(job, task)
-        task.log(
-            logging.INFO,
-            f"About to export {total_docs} to the file {filename}",
+    @staticmethod
+    def describe_export_file(filename: pathlib.Path) -> Dict:
+        """
+        Describe the exported file and its offset index (if any) for the manifest
+        """
+        index_filename: pathlib.Path = ExportCorpusJob.get_index_filename(filename)
+
+        return dict(
+            ExportCorpusJob.describe_file(filename),
+            index=(
+                ExportCorpusJob.describe_file(index_filename)
+                if index_filename.exists()
+                else None
+            ),
         )
 
-        fp: TextIO = ExportCorpusJob.any_open(filename)
-        for i, (corpus, article) in enumerate(ExportCorpusJob.get_iter(db, job, task)):
-            if ExportCorpusJob.write_article(job, task, fp, article):
-                stored_articles += 1
+    @staticmethod
+    def get_export_parameters(task) -> Dict:
+        """
+        Parameters of the task that define the contents of the export
+        """
+        return {
+            "corpora": task.corpora,
+            "filtering": task.filtering,
+            "processing": task.processing,
+            "file_format": task.file_format,
+            "file_compression": task.file_compression,
+            "incremental": task.incremental,
+            "filter_expression": task.filter_expression,
+        }
 
-            task.set_progress((i + 1) * 100 // total_docs, step=1)
+    @staticmethod
+    def get_checkpoint_filename(filename: pathlib.Path) -> pathlib.Path:
+        return filename.with_name(filename.name + ".checkpoint.json")
 
-        fp.close()
-        task.log(
-            logging.INFO,
-            f"Saved {stored_articles} out of {total_docs} docs to the file {filename}",
+    @staticmethod
+    def get_index_filename(filename: pathlib.Path) -> pathlib.Path:
+        return filename.with_name(filename.name + ".index.jsonl")
+
+    @staticmethod
+    def load_checkpoint(filename: pathlib.Path, parameters: Dict) -> Optional[Dict]:
+        """
+        Load the checkpoint of the interrupted export into the file
+        :param filename: name of the exported file
+        :param parameters: parameters of the export, see get_export_parameters
+        :return: checkpoint or None if there is no usable checkpoint
+        """
+        try:
+            with open(
+                ExportCorpusJob.get_checkpoint_filename(filename), encoding="utf-8"
+            ) as fp:
+                checkpoint: Dict = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if checkpoint.get("parameters") != parameters:
+            return None
+
+        # Checkpointed segments and their offset index must be intact
+        for checked_filename, size_key in [
+            (filename, "bytes_written"),
+            (ExportCorpusJob.get_index_filename(filename), "index_size"),
+        ]:
+            if size_key in checkpoint and (
+                not checked_filename.exists()
+                or checked_filename.stat().st_size < checkpoint[size_key]
+            ):
+                return None
+
+        return checkpoint
+
+    @staticmethod
+    def save_checkpoint(filename: pathlib.Path, checkpoint: Dict) -> None:
+        """
+        Atomically replace the checkpoint of the export into the file
+        :param filename: name of the exported file
+        :param checkpoint: checkpoint
+        """
+        checkpoint_filename: pathlib.Path = ExportCorpusJob.get_checkpoint_filename(
+            filename
+        )
+        tmp_filename: pathlib.Path = checkpoint_filename.with_name(
+            checkpoint_filename.name + ".tmp"
         )
 
+        with open(tmp_filename, "w", encoding="utf-8") as fp:
+            json.dump(checkpoint, fp, ensure_ascii=False, cls=DjangoJSONEncoder)
 
-class TagWithUDPipeJob(BaseCorpusTask):
-    """
-    Tag articles with UDPipe
-    """
+        os.replace(tmp_filename, checkpoint_filename)
 
     @staticmethod
-    def _get_mongo_filter(task) -> dict:
-        clause: Dict = {"processing_status": {"$in": ["nlp_uk"]}}
+    def remove_checkpoint(filename: pathlib.Path) -> None:
+        try:
+            os.remove(ExportCorpusJob.get_checkpoint_filename(filename))
+        except FileNotFoundError:
+            pass
 
-        if not task.force:
-            clause["processing_status"]["$nin"] = ["udpiped"]
+    @staticmethod
+    def export_parts(
+        task,
+        filename: pathlib.Path,
+        parts: List[Dict],
+        report_progress: Callable[[int], None],
+        database=None,
+    ) -> Dict:
+        """
+        Export parts (ranges of ids of the corpora) into one file. Articles are read in
+        the order of ids and written in independently compressed segments, after each
+        segment the checkpoint is saved, so the interrupted export is resumed from it.
+        The sparse offset index of the articles is written alongside, see SegmentedWriter
+        :param task: task instance
+        :param filename: name of the file to write to
+        :param parts: list of dicts with corpus, lower and upper bounds of ids and the
+            moment to export the changes since (None for the full export)
+        :param report_progress: callback to report the number of processed documents
+        :param database: database to use instead of the default one
+        :return: the final checkpoint with the stats of the export
+        """
+        PROGRESS_STEP: int = 1000
 
-        return clause
+        parameters: Dict = ExportCorpusJob.get_export_parameters(task)
+        checkpoint: Optional[Dict] = ExportCorpusJob.load_checkpoint(
+            filename, parameters
+        )
 
-    @staticmethod
-    def get_total_count(db, job, task) -> int:
-        total = 0
-        for corpus in task.corpora:
-            total += db[corpus].count_documents(
-                TagWithUDPipeJob._get_mongo_filter(task)
+        # Parquet file cannot be appended after the interruption, so it is always
+        # written from scratch
+        resumable: bool = task.file_format != "parquet"
+
+        if (
+            resumable
+            and checkpoint is not None
+            and checkpoint.get("parts") == parts
+            # Checkpoints of the older versions have no per-corpus counters and index
+            and "corpora" in checkpoint
+        ):
+            checkpoint["resumed"] = True
+            report_progress(checkpoint["processed_docs"])
+
+            if checkpoint["completed"]:
+                return checkpoint
+        else:
+            checkpoint = {
+                "parameters": parameters,
+                "parts": parts,
+                "last_ids": {},
+                "completed_parts": 0,
+                "bytes_written": 0,
+                "segments": 0,
+                "processed_docs": 0,
+                "stored_docs": 0,
+                "corpora": {
+                    part["corpus"]: {"processed_docs": 0, "stored_docs": 0, "tokens": 0}
+                    for part in parts
+                },
+                "index_size": 0,
+                "completed": False,
+                "resumed": False,
+            }
+
+        index_fp: Optional[TextIO] = None
+
+        def write_index() -> None:
+            for entry in fp.pop_index():
+                index_fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+            index_fp.flush()
+            os.fsync(index_fp.fileno())
+            checkpoint["index_size"] = index_fp.tell()
+
+        if resumable:
+            fp: SegmentedWriter = SegmentedWriter(
+                filename,
+                task.file_compression,
+                offset=checkpoint["bytes_written"],
+                level=task.compression_level,
+                threads=task.compression_threads,
             )
 
-        return total
+            index_filename: pathlib.Path = ExportCorpusJob.get_index_filename(filename)
+            if checkpoint["index_size"]:
+                index_fp = open(index_filename, "r+", encoding="utf-8")
+                index_fp.truncate(checkpoint["index_size"])
+                index_fp.seek(checkpoint["index_size"])
+            else:
+                index_fp = open(index_filename, "w", encoding="utf-8")
+        else:
+            fp = ParquetArticleWriter(
+                filename,
+                layer_names=ExportCorpusJob._task_to_layer.get(task.processing, []),
+                compression_level=task.compression_level,
+            )
+        unreported: int = 0
 
-    @staticmethod
-    def get_iter(db, job, task):
-        for corpus in task.corpora:
-            cursor = Corpus.get_articles_with_layers(
-                collection=corpus,
-                layer_names=["tokenized"],
-                match_clause=TagWithUDPipeJob._get_mongo_filter(task),
-                project_clause={"title": 0, "text": 0, "clean": 0, "nlp": 0},
+        for part_no, part in enumerate(parts):
+            if part_no < checkpoint["completed_parts"]:
+                continue
+
+            corpus: str = part["corpus"]
+            last_id: Optional[str] = checkpoint["last_ids"].get(corpus)
+            counters: Dict = checkpoint["corpora"][corpus]
+
+            cursor = ExportCorpusJob.get_cursor(
+                task,
+                corpus,
+                match_clause=ExportCorpusJob.merge_mongo_filters(
+                    Corpus.get_id_range_clause(part["lower"], part["upper"]),
+                    ExportCorpusJob.get_delta_clause(part["since"]),
+                    {"_id": {"$gt": last_id}} if last_id is not None else None,
+                ),
+                database=database,
             )
 
             for article in cursor:
-                yield corpus, article
+                if resumable:
+                    fp.mark({"corpus": corpus, "_id": article["_id"]})
+
+                if ExportCorpusJob.write_article(
+                    None, task, fp, article, corpus=corpus, counters=counters
+                ):
+                    checkpoint["stored_docs"] += 1
+                    counters["stored_docs"] += 1
+
+                checkpoint["processed_docs"] += 1
+                counters["processed_docs"] += 1
+                checkpoint["last_ids"][corpus] = article["_id"]
+
+                unreported += 1
+                if unreported == PROGRESS_STEP:
+                    report_progress(unreported)
+                    unreported = 0
+
+                if resumable and fp.segment_is_full:
+                    checkpoint["bytes_written"] = fp.flush_segment()
+                    checkpoint["segments"] += 1
+                    write_index()
+                    ExportCorpusJob.save_checkpoint(filename, checkpoint)
 
             cursor.close()
+            checkpoint["completed_parts"] = part_no + 1
 
-    @staticmethod
-    def execute(job, task):
-        assert (
-            settings.UDPIPE_MODEL_FILE
-        ), "You must set UDPIPE_MODEL_FILE setting to begin"
-        BULK_UPDATE_SIZE = 100  # how many articles and layers to insert/update at once
+        report_progress(unreported)
+
+        fp.close()
+        if index_fp is not None:
+            write_index()
+            index_fp.close()
+
+        checkpoint["bytes_written"] = filename.stat().st_size
+        checkpoint["segments"] += 1
+        checkpoint["completed"] = True
+        ExportCorpusJob.save_checkpoint(filename, checkpoint)
+
+        return checkpoint
 
+    @staticmethod
+    def export_shard(task, shard: Dict) -> Dict:
+        """
+        Export one shard (a range of ids of one corpus) into its own file.
+        Runs in the worker process of the pool
+        :param task: task instance
+        :param shard: shard description, see execute_sharded
+        :return: shard description, amended with the stats
+        """
         from .mongodb import get_db
-        from .udpipe_model import Model as UDPipeModel
-        from ufal.udpipe import Sentence  # type: ignore
 
+        # Connection of the parent process cannot be reused after the fork
         db = get_db()
 
-        layer_name = "udpiped"
-        # This is our bulky udpipe model which consumes a lot of time to load and RAM
-        model = UDPipeModel(settings.UDPIPE_MODEL_FILE)
-        total_docs = TagWithUDPipeJob.get_total_count(db, job, task)
+        checkpoint: Dict = ExportCorpusJob.export_parts(
+            task,
+            pathlib.Path(shard["filename"]),
+            parts=[
+                {
+                    "corpus": shard["corpus"],
+                    "lower": shard["lower"],
+                    "upper": shard["upper"],
+                    "since": shard["since"],
+                }
+            ],
+            report_progress=report_pool_progress,
+            database=db,
+        )
 
-        # Stats collector to review later
-        feat_categories = Counter()
-        poses = Counter()
-        feat_values = defaultdict(Counter)
+        return dict(
+            shard,
+            processed_docs=checkpoint["processed_docs"],
+            stored_docs=checkpoint["stored_docs"],
+            segments=checkpoint["segments"],
+            bytes_written=checkpoint["bytes_written"],
+            tokens=checkpoint["corpora"][shard["corpus"]]["tokens"],
+            resumed=checkpoint["resumed"],
+        )
 
-        def bulk_update(
-            layers: List[pymongo.ReplaceOne],
-            layer_refs: Dict[str, List[pymongo.UpdateOne]],
-        ) -> None:
-            # Bulk upsert!
-            try:
-                if layers:
-                    db.layers.bulk_write(layers)
-            except pymongo.errors.WriteError:
-                task.log(logging.WARNING, "Cannot add layers")
+    @staticmethod
+    def execute_sharded(
+        job, task, db, filename: pathlib.Path, since: Optional[str], total_docs: int
+    ) -> Dict:
+        """
+        Split every corpus into ranges of ids and export them in parallel into the
+        numbered shard files, optionally concatenating them in the end
+        :return: stats of the export for the manifest
+        """
+        parameters: Dict = ExportCorpusJob.get_export_parameters(task)
+        base_started_on: Optional[datetime] = (
+            datetime.fromisoformat(since) if since is not None else None
+        )
 
-            for corpus, updates in layer_refs.items():
-                try:
-                    if updates:
-                        db[corpus].bulk_write(updates)
-                except pymongo.errors.WriteError:
-                    task.log(
-                        logging.WARNING,
-                        "Cannot reference layers from the corpus document",
+        # Ranges of ids are drifting as the corpora grow, so the plan of the
+        # interrupted export is reused to resume its shards. Checkpoint of the
+        # interrupted serial export into the same file has no plan
+        plan: Optional[Dict] = ExportCorpusJob.load_checkpoint(filename, parameters)
+        if (
+            plan is not None
+            and "shards" in plan
+            # Small corpora might be split into fewer ranges, than requested, so the
+            # plan is checked against the number of the shards it was made for
+            and plan.get("shards_per_corpus") == task.shards_per_corpus
+            and all(shard["since"] == since for shard in plan["shards"])
+        ):
+            shards: List[Dict] = plan["shards"]
+            task.log(logging.INFO, f"Resuming the export of {len(shards)} shards")
+        else:
+            shards = []
+            for corpus in task.corpora:
+                for lower, upper in Corpus.get_id_ranges(
+                    collection=corpus,
+                    num_ranges=task.shards_per_corpus,
+                    match_clause=ExportCorpusJob._get_mongo_filter(task, since),
+                ):
+                    shards.append(
+                        {
+                            "corpus": corpus,
+                            "shard": len(shards),
+                            "lower": lower,
+                            "upper": upper,
+                            "since": since,
+                            "filename": str(
+                                ExportCorpusJob.generate_filename(
+                                    job,
+                                    task,
+                                    since=base_started_on,
+                                    shard=f"shard{len(shards):04d}",
+                                )
+                            ),
+                        }
                     )
-                    continue
 
-        # Here we will collect the list of layers to upsert into the layers collection
-        layers: List[pymongo.ReplaceOne] = []
+            ExportCorpusJob.save_checkpoint(
+                filename,
+                {
+                    "parameters": parameters,
+                    "shards_per_corpus": task.shards_per_corpus,
+                    "shards": shards,
+                },
+            )
 
-        # This is the list of update operations, to connect original documents,
-        # identified by corpus/id pair to the respective layers in bulk
-        layer_refs: Dict[str, List[pymongo.UpdateOne]] = defaultdict(list)
+        task.log(
+            logging.INFO,
+            f"About to export {total_docs} docs in {len(shards)} shards using {task.workers} workers",
+        )
+
+        results: List[Dict] = ExportCorpusJob.run_in_pool(
+            task,
+            ExportCorpusJob.export_shard,
+            [(task, shard) for shard in shards],
+            workers=task.workers,
+            total_docs=total_docs,
+        )
+
+        corpora: Dict[str, Dict] = {}
+        for shard in results:
+            counters: Dict = corpora.setdefault(
+                shard["corpus"], {"processed_docs": 0, "stored_docs": 0, "tokens": 0}
+            )
+            for key in counters:
+                counters[key] += shard[key]
+
+        stats: Dict = {
+            "stored_docs": sum(shard["stored_docs"] for shard in results),
+            "corpora": corpora,
+            "shards": results,
+            "concatenated_into": None,
+            "files": [],
+        }
+
+        if task.concatenate_shards and task.file_format == "parquet":
+            task.log(
+                logging.WARNING,
+                "Parquet files cannot be concatenated, keeping the shards as they are",
+            )
+        elif task.concatenate_shards:
+            index_filename: pathlib.Path = ExportCorpusJob.get_index_filename(filename)
+            checksum = sha256()
+
+            # Compressed streams can be simply glued together, bzip2 and xz
+            # decode such multi-stream files transparently. Blocks in the offset
+            # indices of the shards are shifted by the size of the preceding shards
+            with open(filename, "wb") as fp_out, open(
+                index_filename, "w", encoding="utf-8"
+            ) as index_out:
+                for shard in results:
+                    shard_offset: int = fp_out.tell()
+
+                    with open(shard["filename"], "rb") as fp_in:
+                        for chunk in iter(lambda: fp_in.read(1024 * 1024), b""):
+                            checksum.update(chunk)
+                            fp_out.write(chunk)
+
+                    with open(
+                        ExportCorpusJob.get_index_filename(
+                            pathlib.Path(shard["filename"])
+                        ),
+                        encoding="utf-8",
+                    ) as index_in:
+                        for line in index_in:
+                            entry: Dict = json.loads(line)
+                            entry["block_offset"] += shard_offset
+                            index_out.write(
+                                json.dumps(entry, ensure_ascii=False) + "\n"
+                            )
+
+            for shard in results:
+                os.remove(shard["filename"])
+                os.remove(
+                    ExportCorpusJob.get_index_filename(pathlib.Path(shard["filename"]))
+                )
+
+            stats["concatenated_into"] = str(filename)
+            stats["files"].append(
+                {
+                    "filename": str(filename),
+                    "size": filename.stat().st_size,
+                    "sha256": checksum.hexdigest(),
+                    "index": ExportCorpusJob.describe_file(index_filename),
+                }
+            )
+
+        if stats["concatenated_into"] is None:
+            for shard in results:
+                stats["files"].append(
+                    ExportCorpusJob.describe_export_file(
+                        pathlib.Path(shard["filename"])
+                    )
+                )
+
+        for shard in results:
+            ExportCorpusJob.remove_checkpoint(pathlib.Path(shard["filename"]))
+
+        return stats
+
+    @staticmethod
+    def execute_serial(
+        job, task, db, filename: pathlib.Path, since: Optional[str], total_docs: int
+    ) -> Dict:
+        """
+        Export all the corpora one by one into the single file
+        :return: stats of the export for the manifest
+        """
+        processed_articles: int = 0
+
+        task.log(
+            logging.INFO,
+            f"About to export {total_docs} to the file {filename}",
+        )
+
+        def report_progress(processed: int) -> None:
+            nonlocal processed_articles
+
+            processed_articles += processed
+            if total_docs:
+                task.set_progress(
+                    min(processed_articles, total_docs) * 100 // total_docs, step=1
+                )
+
+        checkpoint: Dict = ExportCorpusJob.export_parts(
+            task,
+            filename,
+            parts=[
+                {"corpus": corpus, "lower": None, "upper": None, "since": since}
+                for corpus in task.corpora
+            ],
+            report_progress=report_progress,
+        )
+
+        if checkpoint["resumed"]:
+            task.log(logging.INFO, "The export was resumed from the checkpoint")
+
+        return {
+            "stored_docs": checkpoint["stored_docs"],
+            "corpora": checkpoint["corpora"],
+            "segments": checkpoint["segments"],
+            "bytes_written": checkpoint["bytes_written"],
+            "files": [ExportCorpusJob.describe_export_file(filename)],
+        }
+
+    @staticmethod
+    def report_dry_run(db, task, since: Optional[str]) -> None:
+        """
+        Log the number of documents, matched by Mongo, per corpus, without exporting them.
+        Nothing is written, so the documents without the change marker, which the export
+        would stamp (see stamp_unmarked), are counted separately
+        """
+        match_clause: Dict = ExportCorpusJob._get_mongo_filter(task, since)
+        unmarked_clause: Dict = ExportCorpusJob.merge_mongo_filters(
+            ExportCorpusJob._get_mongo_filter(task), {"updated_at": {"$exists": False}}
+        )
+        expression: CompiledFilter = compile_filter(task.filter_expression)
+        total_docs: int = 0
+
+        task.log(
+            logging.INFO,
+            "Match clause is "
+            + json.dumps(match_clause, ensure_ascii=False, cls=DjangoJSONEncoder),
+        )
+
+        for corpus in task.corpora:
+            matched: int = db[corpus].count_documents(match_clause)
+            unmarked: int = db[corpus].count_documents(unmarked_clause)
+
+            # Stamped documents are newer than any previous export
+            if since is not None:
+                matched += unmarked
+
+            total_docs += matched
+            task.log(
+                logging.INFO,
+                f"{corpus}: {matched} docs match, {unmarked} of them have no change marker yet",
+            )
+
+        python_filters: List[str] = list(task.filtering)
+        if expression.remainder is not None:
+            python_filters.append(str(expression.remainder))
+
+        if python_filters:
+            task.log(
+                logging.INFO,
+                f"Up to {total_docs} docs would be exported, some of them might be "
+                + f"filtered out in Python by {python_filters}",
+            )
+        else:
+            task.log(logging.INFO, f"{total_docs} docs would be exported")
+
+    @staticmethod
+    def execute(job, task):
+        from .mongodb import get_db
+
+        db = get_db()
+
+        since: Optional[str] = None
+        base_task = None
+
+        if task.incremental:
+            base_task = ExportCorpusJob.get_base_task(task)
+
+            if base_task is None:
+                task.log(
+                    logging.WARNING,
+                    "Cannot find the previous export with the same parameters, exporting everything",
+                )
+            else:
+                since = base_task.started_on.isoformat()
+                task.log(
+                    logging.INFO,
+                    f"Exporting the changes since {since}, made after the export {base_task.pk}",
+                )
+
+        if task.dry_run:
+            ExportCorpusJob.report_dry_run(db, task, since)
+            return
+
+        ExportCorpusJob.stamp_unmarked(db, task)
+
+        total_docs: int = ExportCorpusJob.get_total_count(db, job, task, since)
+
+        filename: pathlib.Path = ExportCorpusJob.generate_filename(
+            job, task, since=base_task.started_on if base_task is not None else None
+        )
+
+        if task.workers > 1 or task.shards_per_corpus > 1:
+            stats: Dict = ExportCorpusJob.execute_sharded(
+                job, task, db, filename, since, total_docs
+            )
+        else:
+            stats = ExportCorpusJob.execute_serial(
+                job, task, db, filename, since, total_docs
+            )
+
+        ExportCorpusJob.remove_checkpoint(filename)
+
+        manifest: Dict = dict(
+            {
+                "task_id": task.pk,
+                "created_on": datetime.now(),
+                "parameters": ExportCorpusJob.get_export_parameters(task),
+                "total_docs": total_docs,
+                "base": None,
+                # Every n-th document and the first one of each compressed block are indexed
+                "index_interval": DEFAULT_INDEX_INTERVAL,
+            },
+            **stats,
+        )
+
+        if base_task is not None:
+            # Chaining the delta to the export it is based on
+            manifest["base"] = {
+                "task_id": base_task.pk,
+                "since": since,
+                "exported_file": base_task.exported_file,
+            }
+
+        manifest_filename: pathlib.Path = ExportCorpusJob.write_manifest(
+            filename, manifest
+        )
+
+        task.exported_file = str(filename)
+        task.save(update_fields=["exported_file"])
+
+        task.log(
+            logging.INFO,
+            f"Saved {stats['stored_docs']} out of {total_docs} docs to the {filename}, "
+            + f"see {manifest_filename} for details",
+        )
+
+
+class TagWithUDPipeJob(BaseCorpusTask):
+    """
+    Tag articles with UDPipe
+    """
+
+    layer_name: str = "udpiped"
+
+    @staticmethod
+    def _get_mongo_filter(task) -> dict:
+        clause: Dict = {"processing_status": {"$in": ["nlp_uk"]}}
+
+        if not task.force:
+            clause["processing_status"]["$nin"] = ["udpiped"]
+
+        return clause
+
+    @staticmethod
+    def get_total_count(db, job, task) -> int:
+        total = 0
+        for corpus in task.corpora:
+            total += db[corpus].count_documents(
+                TagWithUDPipeJob._get_mongo_filter(task)
+            )
+
+        return total
+
+    @staticmethod
+    def get_iter(db, job, task):
+        for corpus in task.corpora:
+            cursor = Corpus.get_articles_with_layers(
+                collection=corpus,
+                layer_names=["tokenized"],
+                match_clause=TagWithUDPipeJob._get_mongo_filter(task),
+                project_clause={"title": 0, "text": 0, "clean": 0, "nlp": 0},
+            )
+
+            for article in cursor:
+                yield corpus, article
+
+            cursor.close()
+
+    @staticmethod
+    def get_tag_cache() -> SentenceTagCache:
+        """
+        Get the cache of the tagged sentences of the current process
+        """
+        global _tag_cache
+
+        if (
+            _tag_cache is None
+            or _tag_cache.pid != os.getpid()
+            or _tag_cache.model_id != _udpipe_model_id
+        ):
+            from .mongodb import get_db
+
+            _tag_cache = SentenceTagCache(get_db(), _udpipe_model_id)
+
+        return _tag_cache
+
+    @staticmethod
+    def tag_batch(batch: List[Tuple[str, Dict]], model=None) -> Dict:
+        """
+        Tag the batch of articles with UDPipe. Runs in the worker process of the pool,
+        where the model, loaded by the parent before the fork, is shared copy-on-write
+        :param batch: list of (corpus, article with the tokenized layer)
+        :param model: UDPipe model, the one of the parent process is used by default
+        :return: dict with the layers of the articles and the stats of the batch
+        """
+        from ufal.udpipe import Sentence  # type: ignore
 
-        # One by one, let's iterate over the corpora pulling articles with tokenized layer
-        for i, (corpus, article) in enumerate(TagWithUDPipeJob.get_iter(db, job, task)):
+        model = model or _udpipe_model
+        cache: SentenceTagCache = TagWithUDPipeJob.get_tag_cache()
+        started: float = time.monotonic()
+
+        # Recurring sentences of the whole batch are fetched from the cache at once
+        cache.prefetch(
+            cache.get_key(s)
+            for _, article in batch
+            for f in ["title", "text"]
+            for s in article["tokenized"].get(f, [])
+        )
+
+        # Stats collector to review later
+        result: Dict = {
+            "pid": os.getpid(),
+            "layers": [],
+            "sentences": 0,
+            "feat_categories": Counter(),
+            "poses": Counter(),
+            "feat_values": defaultdict(Counter),
+            "warnings": [],
+        }
+
+        for corpus, article in batch:
             id_: str = article["_id"]
             layer_data = {
                 "corpus": corpus,
                 "parent_id": id_,
-                "layer_type": layer_name,
+                "layer_type": TagWithUDPipeJob.layer_name,
+                "updated_at": datetime.now(timezone.utc),
                 "text": defaultdict(list),
                 "title": defaultdict(list),
             }
 
-            # This is the layer we are about to create
-            layer_id: str = TagWithUDPipeJob.get_layer_id(
-                corpus=corpus, id_=id_, layer_name=layer_name
-            )
-
             # udpipe is applied to both, title and text
             for f in ["title", "text"]:
                 # sentence by sentence
                 for sent_no, s in enumerate(article["tokenized"].get(f, [])):
+                    key: str = cache.get_key(s)
+                    cached: Optional[Tuple[str, str, str]] = cache.get(key)
+
+                    if cached is not None:
+                        layer_data[f]["ud_lemmas"].append(cached[0])
+                        layer_data[f]["ud_postags"].append(cached[1])
+                        layer_data[f]["ud_features"].append(cached[2])
+                        continue
+
                     # ignoring default udpipe tokenizer as we already have our text tokenized
                     tok_sent = Sentence()
                     for w in s:
@@ -460,375 +1538,2770 @@ class TagWithUDPipeJob(BaseCorpusTask):
                     sent_features = []
 
                     model.tag(tok_sent)
+                    result["sentences"] += 1
+
                     if len(tok_sent.words) > 1:
                         for w in tok_sent.words[1:]:
-                            poses.update([w.upostag])
+                            result["poses"].update([w.upostag])
                             sent_lemmas.append(w.lemma)
                             # Again, not moving that to a separate function to
                             # reduce number of unnecessary calls
                             try:
                                 sent_postags.append(COMPRESS_UPOS_MAPPING[w.upostag])
                             except KeyError:
-                                task.log(
-                                    logging.WARNING,
+                                result["warnings"].append(
                                     f"Cannot find {w.upostag} in the COMPRESS_UPOS_MAPPING, skipping for now, "
                                     + f"sentence was '{s}', error happened at {corpus}.{id_}.{f}:{sent_no}",
                                 )
                                 sent_postags.append("Z")
 
-                            sent_features.append(compress_features(w.feats))
+                            sent_features.append(compress_features(w.feats))
+
+                            for pair in w.feats.split("|"):
+                                if not pair:
+                                    continue
+                                cat, val = pair.split("=")
+                                result["feat_categories"].update([cat])
+                                result["feat_values"][cat].update([val])
+
+                    # We don't need to have a separator for the postags as there is always one
+                    # pos tag (which is character) per word
+                    tagged: Tuple[str, str, str] = (
+                        " ".join(sent_lemmas),
+                        "".join(sent_postags),
+                        " ".join(sent_features),
+                    )
+                    cache.put(key, tagged)
+
+                    layer_data[f]["ud_lemmas"].append(tagged[0])
+                    layer_data[f]["ud_postags"].append(tagged[1])
+                    layer_data[f]["ud_features"].append(tagged[2])
+
+            result["layers"].append(layer_data)
+
+        cache.flush()
+        result["cache"] = cache.pop_stats()
+        result["elapsed"] = time.monotonic() - started
+
+        return result
+
+    @staticmethod
+    def tag_in_pool(batches: Iterable[List], workers: int) -> Iterable[Dict]:
+        """
+        Stream the batches of articles to the pool of forked workers and yield the
+        results in the order of the batches. Number of batches in flight is bounded,
+        so the articles are read from Mongo as fast as they are tagged
+        :param batches: batches of (corpus, article)
+        :param workers: number of worker processes
+        :return: results of tag_batch
+        """
+        from django.db import connections
+
+        ctx = multiprocessing.get_context("fork")
+
+        # Forked workers must not share the connection to the postgres with the parent
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+            pending: Deque = deque()
+
+            for batch in batches:
+                pending.append(executor.submit(TagWithUDPipeJob.tag_batch, batch))
+
+                while pending and (pending[0].done() or len(pending) > workers * 2):
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    @staticmethod
+    def execute(job, task):
+        assert (
+            settings.UDPIPE_MODEL_FILE
+        ), "You must set UDPIPE_MODEL_FILE setting to begin"
+        BULK_UPDATE_SIZE = 100  # how many articles and layers to insert/update at once
+
+        global _udpipe_model, _udpipe_model_id
+
+        from .mongodb import get_db
+        from .udpipe_model import Model as UDPipeModel
+
+        db = get_db()
+
+        layer_name = TagWithUDPipeJob.layer_name
+        workers: int = max(task.workers, 1)
+        # This is our bulky udpipe model which consumes a lot of time to load and RAM.
+        # It is loaded once, the forked workers share it with the parent
+        _udpipe_model = UDPipeModel(settings.UDPIPE_MODEL_FILE)
+        total_docs = TagWithUDPipeJob.get_total_count(db, job, task)
+
+        # Cached tags of the other models are useless and removed
+        _udpipe_model_id = get_model_id(settings.UDPIPE_MODEL_FILE)
+        purged: int = SentenceTagCache.purge_other_models(db, _udpipe_model_id)
+        if purged:
+            task.log(
+                logging.INFO,
+                f"Model has changed, removed {purged} cached sentences of the other models",
+            )
+        cache_stats: Counter = Counter()
+
+        # Stats collector to review later
+        feat_categories = Counter()
+        poses = Counter()
+        feat_values = defaultdict(Counter)
+
+        # Stats of the workers: pid -> [docs, sentences, seconds spent tagging]
+        throughput: Dict[int, List] = defaultdict(lambda: [0, 0, 0.0])
+
+        def bulk_update(
+            layers: List[pymongo.ReplaceOne],
+            layer_refs: Dict[str, List[pymongo.UpdateOne]],
+        ) -> None:
+            # Bulk upsert!
+            try:
+                if layers:
+                    db.layers.bulk_write(layers)
+            except (pymongo.errors.WriteError, pymongo.errors.OperationFailure):
+                task.log(logging.WARNING, "Cannot add layers")
+
+            for corpus, updates in layer_refs.items():
+                try:
+                    if updates:
+                        db[corpus].bulk_write(updates)
+                except (pymongo.errors.WriteError, pymongo.errors.OperationFailure):
+                    task.log(
+                        logging.WARNING,
+                        "Cannot reference layers from the corpus document",
+                    )
+                    continue
+
+        # Writes are done by the separate thread, so the tagging doesn't wait for Mongo
+        write_queue: queue.Queue = queue.Queue(maxsize=workers * 2)
+
+        # Set when the writer fails, so the tagging doesn't wait for it forever
+        stop: threading.Event = threading.Event()
+        errors: List[BaseException] = []
+
+        def put(item) -> None:
+            while not stop.is_set():
+                try:
+                    write_queue.put(item, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+        def writer() -> None:
+            from django.db import connection
+
+            try:
+                while True:
+                    item = write_queue.get()
+                    if item is None:
+                        break
+
+                    bulk_update(*item)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                connection.close()
+
+        batches: Iterable[List] = batch_iterator(
+            TagWithUDPipeJob.get_iter(db, job, task), BULK_UPDATE_SIZE
+        )
+
+        if workers > 1:
+            results: Iterable[Dict] = TagWithUDPipeJob.tag_in_pool(batches, workers)
+        else:
+            results = map(TagWithUDPipeJob.tag_batch, batches)
+
+        task.log(
+            logging.INFO,
+            f"About to tag {total_docs} docs using {workers} workers",
+        )
+
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        writer_thread.start()
+
+        processed_docs: int = 0
+
+        try:
+            for result in results:
+                if stop.is_set():
+                    break
+
+                for warning in result["warnings"]:
+                    task.log(logging.WARNING, warning)
+
+                poses.update(result["poses"])
+                feat_categories.update(result["feat_categories"])
+                for cat, values in result["feat_values"].items():
+                    feat_values[cat].update(values)
+
+                cache_stats.update(result["cache"])
+
+                stats = throughput[result["pid"]]
+                stats[0] += len(result["layers"])
+                stats[1] += result["sentences"]
+                stats[2] += result["elapsed"]
+
+                # Here we will collect the list of layers to upsert into the layers collection
+                layers: List[pymongo.ReplaceOne] = []
+                tagged_at: datetime = datetime.now(timezone.utc)
+
+                # This is the list of update operations, to connect original documents,
+                # identified by corpus/id pair to the respective layers in bulk
+                layer_refs: Dict[str, List[pymongo.UpdateOne]] = defaultdict(list)
+
+                for layer_data in result["layers"]:
+                    corpus: str = layer_data["corpus"]
+                    id_: str = layer_data["parent_id"]
+
+                    # This is the layer we are about to create
+                    layer_id: str = TagWithUDPipeJob.get_layer_id(
+                        corpus=corpus, id_=id_, layer_name=layer_name
+                    )
+
+                    layers.append(
+                        # layer will have a processed version of both fields, title and text
+                        pymongo.ReplaceOne(
+                            {"_id": layer_id},
+                            layer_data,
+                            upsert=True,
+                        )
+                    )
+
+                    # Collecting the update operations for the corpora collections
+                    layer_refs[corpus].append(
+                        pymongo.UpdateOne(
+                            {"_id": id_},
+                            {
+                                "$set": {f"layers.{layer_name}": layer_id},
+                                "$addToSet": {"processing_status": layer_name},
+                                "$currentDate": {"updated_at": True},
+                                # udpiped_at lets BuildFreqVocabJob count only the
+                                # documents, tagged since its previous run. It is the
+                                # moment of the first tagging, so the documents,
+                                # tagged once again, aren't counted twice
+                                "$min": {"udpiped_at": tagged_at},
+                            },
+                            upsert=True,
+                        )
+                    )
+
+                put((layers, layer_refs))
+
+                processed_docs += len(result["layers"])
+                task.set_progress(processed_docs * 100 // total_docs, step=1)
+        finally:
+            put(None)
+            writer_thread.join()
+
+        if errors:
+            raise errors[0]
+
+        for pid, (docs, sentences, elapsed) in sorted(throughput.items()):
+            task.log(
+                logging.INFO,
+                f"Worker {pid} tagged {docs} docs, {sentences} sentences "
+                + f"({sentences / max(elapsed, 1e-6):.1f} sentences/s)",
+            )
+
+        task.log(
+            logging.INFO,
+            f"Tagged {processed_docs} docs, parts of speech: {dict(poses)}",
+        )
+
+        lookups: int = cache_stats["hits"] + cache_stats["misses"]
+        task.log(
+            logging.INFO,
+            f"Sentence cache hit rate is {cache_stats['hits'] * 100 / max(lookups, 1):.1f}% "
+            + f"({cache_stats['hits']} of {lookups}, {cache_stats['loaded']} loaded "
+            + f"from Mongo, {cache_stats['stored']} stored to Mongo)",
+        )
+
+
+class BuildFreqVocabJob(BaseCorpusTask):
+    _filters = {
+        "short": _filter_short,
+        "rus_gcld": _filter_rus_gcld,
+        "dedup": _filter_dedup,
+    }
+
+    # Optional Mongo-side predicates of the filters above
+    _mongo_filters = {
+        "short": _mongo_filter_short,
+        "rus_gcld": _mongo_filter_rus_gcld,
+        "dedup": _mongo_filter_dedup,
+    }
+
+    @staticmethod
+    def apply_filter(job, task, article: Dict) -> bool:
+        # Separate implementation as different tasks might have different filters
+        for filt in task.filtering:
+            if not BuildFreqVocabJob._filters[filt](article):
+                return False
+
+        return True
+
+    @staticmethod
+    def _get_mongo_filter(
+        task, since: Optional[str] = None, until: Optional[str] = None
+    ) -> dict:
+        return BuildFreqVocabJob.merge_mongo_filters(
+            {"processing_status": {"$in": [TagWithUDPipeJob.layer_name]}},
+            BuildFreqVocabJob.get_delta_clause(since, until),
+            BuildFreqVocabJob.get_filtering_clause(
+                BuildFreqVocabJob._mongo_filters, task
+            ),
+        )
+
+    @staticmethod
+    def get_delta_clause(since: Optional[str], until: Optional[str]) -> Dict:
+        """
+        Match clause for the documents, tagged with UDPipe between the given moments.
+        Documents, tagged before the moment of tagging was recorded, are considered
+        to be tagged long ago
+        :param since: moment in iso format (exclusive) or None to count from the scratch
+        :param until: moment in iso format (inclusive) or None to count everything
+        """
+        if until is None:
+            return {}
+
+        if since is None:
+            return {
+                "$or": [
+                    {"udpiped_at": {"$exists": False}},
+                    {"udpiped_at": {"$lte": datetime.fromisoformat(until)}},
+                ]
+            }
+
+        return {
+            "udpiped_at": {
+                "$gt": datetime.fromisoformat(since),
+                "$lte": datetime.fromisoformat(until),
+            }
+        }
+
+    @staticmethod
+    def get_total_count(
+        db,
+        job,
+        task,
+        since: Optional[Dict[str, Optional[str]]] = None,
+        until: Optional[str] = None,
+    ) -> int:
+        total = 0
+        for corpus in task.corpora:
+            total += db[corpus].count_documents(
+                BuildFreqVocabJob._get_mongo_filter(
+                    task, (since or {}).get(corpus), until
+                )
+            )
+
+        return total
+
+    @staticmethod
+    def iter_doc_counts(
+        db,
+        task,
+        corpus: str,
+        lower: Optional[str],
+        upper: Optional[str],
+        stats: Dict,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Iterator[Dict[Tuple[str, str], int]]:
+        """
+        Count the lemmas in the udpiped layers of the documents in the range of ids
+        of the corpus, reporting the progress to the parent process
+        :param db: Mongo database of the worker process
+        :param task: task instance
+        :param corpus: corpus name
+        :param lower: lower bound of ids (inclusive) or None
+        :param upper: upper bound of ids (exclusive) or None
+        :param stats: dict with processed_articles, missing_layers and malformed_layers
+            to update
+        :param since: count only the documents, tagged after this moment, see get_delta_clause
+        :param until: count only the documents, tagged before this moment
+        :return: iterator of (pos, lemma) -> count of each document
+        """
+        PROGRESS_REPORT_SIZE = 100  # how often to report the progress to the parent
+
+        vocabulary: LemmaVocabulary = LemmaVocabulary(db)
+        layer_name: str = TagWithUDPipeJob.layer_name
+
+        project_clause: Dict = {layer_name: 1, "langid": 1, "dedup": 1}
+        if task.filtering:
+            # Python implementations of the filters look at the texts
+            project_clause.update({"title": 1, "text": 1})
+
+        unreported: int = 0
+
+        cursor = Corpus.get_articles_with_layers(
+            collection=corpus,
+            layer_names=[layer_name],
+            match_clause=BuildFreqVocabJob.merge_mongo_filters(
+                BuildFreqVocabJob._get_mongo_filter(task, since, until),
+                Corpus.get_id_range_clause(lower, upper),
+            ),
+            project_clause=project_clause,
+            database=db,
+        )
+
+        for article in cursor:
+            unreported += 1
+            if unreported == PROGRESS_REPORT_SIZE:
+                report_pool_progress(unreported)
+                unreported = 0
+
+            if not BuildFreqVocabJob.apply_filter(None, task, article):
+                continue
+
+            layer: Optional[Dict] = article.get(layer_name)
+            if not layer:
+                stats["missing_layers"] += 1
+                continue
+
+            try:
+                decoded: DecodedField = decode_batch(
+                    [layer.get("title"), layer.get("text")],
+                    encoding=layer.get("encoding"),
+                    vocabulary=vocabulary,
+                )
+            except MalformedLayerError as e:
+                # One broken layer shouldn't fail the whole vocabulary
+                stats["malformed_layers"] += 1
+                task.log(
+                    logging.WARNING,
+                    "Skipping malformed udpiped layer "
+                    + BuildFreqVocabJob.get_layer_id(corpus, article["_id"], layer_name)
+                    + f" of {corpus}.{article['_id']}: {e}",
+                )
+                continue
+
+            # Words are counted by the codes of the postags, which are decoded once per doc
+            doc_counts: Counter = Counter()
+            for (code, lemma), count in Counter(
+                zip(decoded.postags, decoded.lemmas)
+            ).items():
+                # Empty lemmas are of no use
+                if lemma:
+                    doc_counts[UPOS_NAMES[code], lemma] += count
+
+            stats["processed_articles"] += 1
+            yield doc_counts
+
+        cursor.close()
+        report_pool_progress(unreported)
+
+    @staticmethod
+    def count_range(
+        task,
+        corpus: str,
+        lower: Optional[str],
+        upper: Optional[str],
+        tmp_dir: pathlib.Path,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Dict:
+        """
+        Map stage of the exact counting: count the lemmas of the documents in the range
+        of ids of the corpus. Runs in the worker process of the pool
+        :param task: task instance
+        :param corpus: corpus name
+        :param lower: lower bound of ids (inclusive) or None
+        :param upper: upper bound of ids (exclusive) or None
+        :param tmp_dir: directory for the spilled counts
+        :param since: count only the documents, tagged after this moment
+        :param until: count only the documents, tagged before this moment
+        :return: run files with the partial counts and document counts of (pos, lemma),
+            totals by pos and stats of the range
+        """
+        from .mongodb import get_db
+
+        # Connection of the parent process cannot be reused after the fork
+        db = get_db()
+
+        # Each worker takes its share of the memory budget
+        counter: SpillingCounter = SpillingCounter(
+            memory_limit=task.memory_limit * 1024 * 1024 // max(task.workers, 1),
+            tmp_dir=tmp_dir,
+        )
+        totals_by_pos: Counter = Counter()
+        stats: Dict = {
+            "processed_articles": 0,
+            "missing_layers": 0,
+            "malformed_layers": 0,
+        }
+
+        for doc_counts in BuildFreqVocabJob.iter_doc_counts(
+            db, task, corpus, lower, upper, stats, since, until
+        ):
+            for key, count in doc_counts.items():
+                counter.add(key, count, 1)
+                totals_by_pos[key[0]] += count
+
+        return dict(
+            stats,
+            totals_by_pos=totals_by_pos,
+            runs=counter.pop_runs(),
+        )
+
+    @staticmethod
+    def sketch_ranges(
+        task,
+        ranges: List[Tuple[str, Optional[str], Optional[str]]],
+        tmp_dir: pathlib.Path,
+    ) -> Dict:
+        """
+        Map stage of the approximate counting: add the lemmas of the documents in the
+        ranges of ids to one sketch. Runs in the worker process of the pool
+        :param task: task instance
+        :param ranges: list of (corpus, lower bound, upper bound) of ids
+        :param tmp_dir: directory for the sketch
+        :return: file of the partial sketch and stats of the ranges
+        """
+        from .mongodb import get_db
+
+        # Connection of the parent process cannot be reused after the fork
+        db = get_db()
+
+        sketch: FrequencySketch = FrequencySketch(
+            width=task.sketch_width, depth=task.sketch_depth, top_k=task.top_k
+        )
+        stats: Dict = {
+            "processed_articles": 0,
+            "missing_layers": 0,
+            "malformed_layers": 0,
+        }
+
+        for corpus, lower, upper in ranges:
+            for doc_counts in BuildFreqVocabJob.iter_doc_counts(
+                db, task, corpus, lower, upper, stats
+            ):
+                sketch.add_document(doc_counts)
+
+        fd, name = tempfile.mkstemp(prefix="freq-", suffix=".sketch", dir=tmp_dir)
+        os.close(fd)
+        sketch.save(pathlib.Path(name))
+
+        return dict(stats, sketch=pathlib.Path(name))
+
+    @staticmethod
+    def get_ranges(
+        task,
+        workers: int,
+        since: Optional[Dict[str, Optional[str]]] = None,
+        until: Optional[str] = None,
+    ) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Split every corpus into several ranges per worker to balance the load
+        :param task: task instance
+        :param workers: number of the worker processes
+        :param since: corpus -> moment to count the documents, tagged after it, or None
+        :param until: moment to count the documents, tagged before it, or None
+        :return: list of (corpus, lower bound, upper bound) of ids
+        """
+        ranges: List[Tuple[str, Optional[str], Optional[str]]] = []
+
+        for corpus in task.corpora:
+            for lower, upper in Corpus.get_id_ranges(
+                collection=corpus,
+                num_ranges=workers * 4 if workers > 1 else 1,
+                match_clause=BuildFreqVocabJob._get_mongo_filter(
+                    task, (since or {}).get(corpus), until
+                ),
+            ):
+                ranges.append((corpus, lower, upper))
+
+        return ranges
+
+    @staticmethod
+    def open_vocab_writer(
+        job, task, header: Optional[List[str]] = None
+    ) -> Tuple[pathlib.Path, TextIO, csv.DictWriter]:
+        """
+        Open the file of the frequency vocabulary and write the header
+        :param job: job instance
+        :param task: task instance
+        :param header: lines of the comments to put before the header of the CSV
+        :return: name of the file, the file and the CSV writer
+        """
+        filename: pathlib.Path = BuildFreqVocabJob.generate_filename(job, task)
+        fp: TextIO = BuildFreqVocabJob.any_open(filename, task)
+
+        for line in header or []:
+            fp.write(f"# {line}\n")
+
+        w = csv.DictWriter(
+            fp,
+            fieldnames=[
+                "lemma",
+                "pos",
+                "count",
+                "doc_count",
+                "freq_by_pos",
+                "freq_in_corpus",
+                "doc_frequency",
+            ],
+        )
+        w.writeheader()
+
+        return filename, fp, w
+
+    @staticmethod
+    def execute(job, task):
+        from .mongodb import get_db
+
+        db = get_db()
+
+        workers: int = max(task.workers, 1)
+
+        with tempfile.TemporaryDirectory(
+            prefix="freq-", dir=settings.CORPUS_SPILL_PATH
+        ) as tmp_dir:
+            if task.counting == "approximate":
+                if task.incremental:
+                    task.log(
+                        logging.WARNING,
+                        "Incremental updates are supported for the exact counting only, counting everything",
+                    )
+
+                BuildFreqVocabJob.sketch_and_write(
+                    job,
+                    task,
+                    BuildFreqVocabJob.get_total_count(db, job, task),
+                    workers,
+                    pathlib.Path(tmp_dir),
+                )
+            else:
+                BuildFreqVocabJob.count_and_write(
+                    job, task, db, workers, pathlib.Path(tmp_dir)
+                )
+
+    @staticmethod
+    def sketch_and_write(
+        job, task, total_docs: int, workers: int, tmp_dir: pathlib.Path
+    ) -> None:
+        """
+        Estimate the frequencies of the most frequent lemmas on the pool of workers,
+        each building one sketch, merge the sketches and write them into the CSV file
+        with the error bounds in the header. Merged sketch is stored alongside, so it
+        can be merged with the sketches of the other corpora or runs later
+        :param job: job instance
+        :param task: task instance
+        :param total_docs: number of the documents to process
+        :param workers: number of the worker processes
+        :param tmp_dir: directory for the partial sketches
+        """
+        ranges: List[Tuple] = BuildFreqVocabJob.get_ranges(task, workers)
+
+        # Sketches take the fixed amount of memory and disk, so there is one per worker
+        jobs: List[Tuple] = [
+            (task, ranges[i::workers], tmp_dir)
+            for i in range(min(workers, len(ranges)))
+        ]
+
+        task.log(
+            logging.INFO,
+            f"About to estimate frequencies of lemmas of {total_docs} docs in {len(ranges)} ranges using {len(jobs)} workers",
+        )
+
+        results: List[Dict] = BuildFreqVocabJob.run_in_pool(
+            task,
+            BuildFreqVocabJob.sketch_ranges,
+            jobs,
+            workers=workers,
+            total_docs=total_docs,
+        )
+
+        # Reduce stage: merge the partial sketches
+        sketch: Optional[FrequencySketch] = None
+        missing_layers: int = 0
+        malformed_layers: int = 0
+
+        for result in results:
+            partial: FrequencySketch = FrequencySketch.load(result["sketch"])
+            result["sketch"].unlink()
+
+            if sketch is None:
+                sketch = partial
+            else:
+                sketch.merge(partial)
+
+            missing_layers += result["missing_layers"]
+            malformed_layers += result["malformed_layers"]
+
+        if missing_layers:
+            task.log(
+                logging.WARNING,
+                f"Cannot find udpiped layer of {missing_layers} documents",
+            )
+
+        if malformed_layers:
+            task.log(
+                logging.WARNING,
+                f"Skipped {malformed_layers} documents with malformed udpiped layers",
+            )
+
+        filename, fp, w = BuildFreqVocabJob.open_vocab_writer(
+            job, task, header=sketch.get_header()
+        )
+
+        for row in sketch.get_rows():
+            if row["count"] >= task.min_count:
+                w.writerow(row)
+
+        fp.close()
+
+        sketch.save(get_sketch_filename(filename))
+
+        for line in sketch.get_header():
+            task.log(logging.INFO, line)
+
+        task.log(
+            logging.INFO,
+            f"Saved estimates on {sketch.counts.total} occurences from {sketch.processed_articles} filtered out of {total_docs} into the {filename}",
+        )
+
+    @staticmethod
+    def was_retagged(corpus: str, since: str) -> bool:
+        """
+        Check, if the texts of the corpus might have been tagged once again after the given
+        moment. Moment of the first tagging is kept, so such texts aren't picked up by the
+        incremental counting and their counts are stale
+        :param corpus: corpus name
+        :param since: moment in iso format
+        :return: True if the forced tagging of the corpus was started after the moment
+        """
+        from .models import TagWithUDPipeTask
+
+        return TagWithUDPipeTask.objects.filter(
+            force=True,
+            corpora__contains=[corpus],
+            started_on__gt=datetime.fromisoformat(since),
+        ).exists()
+
+    @staticmethod
+    def get_base_counts(
+        task, store: CountsStore
+    ) -> Dict[str, Optional[CountsArtifact]]:
+        """
+        Find the stored counts of every corpus to update them incrementally
+        :param task: task instance
+        :param store: storage of the counts
+        :return: corpus -> latest counts with the same filters, or None to count from the scratch
+        """
+        bases: Dict[str, Optional[CountsArtifact]] = {}
+
+        for corpus in task.corpora:
+            bases[corpus] = (
+                store.get_latest(corpus, task.filtering) if task.incremental else None
+            )
+
+            if bases[corpus] is not None and BuildFreqVocabJob.was_retagged(
+                corpus, bases[corpus].counted_until
+            ):
+                task.log(
+                    logging.WARNING,
+                    f"Texts of {corpus} were tagged once again since {bases[corpus].counted_until}, "
+                    + "counting everything",
+                )
+                bases[corpus] = None
+            elif bases[corpus] is not None:
+                task.log(
+                    logging.INFO,
+                    f"Counting the documents of {corpus}, tagged since {bases[corpus].counted_until}, "
+                    + f"on top of the version {bases[corpus].version} of the counts",
+                )
+            elif task.incremental:
+                task.log(
+                    logging.WARNING,
+                    f"Cannot find the previous counts of {corpus} with the same filters, counting everything",
+                )
+
+        return bases
+
+    @staticmethod
+    def count_and_write(job, task, db, workers: int, tmp_dir: pathlib.Path) -> None:
+        """
+        Count the lemmas on the pool of workers, merge the spilled counts with the
+        stored counts of the previous run, when updating incrementally, and store them
+        as the new version of the counts of each corpus. Merged counts of all corpora
+        are written into the CSV file, sorted by pos and count.
+
+        Documents are picked by the moment of their first tagging, the corpora, that were
+        tagged once again since the previous run, are counted from the scratch. Documents,
+        that became filtered out since the previous run, are still counted, counting from
+        the scratch fixes that.
+        :param job: job instance
+        :param task: task instance
+        :param db: Mongo database
+        :param workers: number of the worker processes
+        :param tmp_dir: directory for the spilled counts
+        """
+        store: CountsStore = CountsStore(settings.CORPUS_FREQ_COUNTS_PATH)
+        bases: Dict[str, Optional[CountsArtifact]] = BuildFreqVocabJob.get_base_counts(
+            task, store
+        )
+        since: Dict[str, Optional[str]] = {
+            corpus: base.counted_until if base is not None else None
+            for corpus, base in bases.items()
+        }
+
+        # Documents, tagged while the task runs, are left for the next run
+        until: str = (task.started_on or datetime.now(timezone.utc)).isoformat()
+
+        for corpus in task.corpora:
+            db[corpus].create_index("udpiped_at")
+
+        total_docs: int = BuildFreqVocabJob.get_total_count(db, job, task, since, until)
+        ranges: List[Tuple] = [
+            (task, corpus, lower, upper, tmp_dir, since[corpus], until)
+            for corpus, lower, upper in BuildFreqVocabJob.get_ranges(
+                task, workers, since, until
+            )
+        ]
+
+        task.log(
+            logging.INFO,
+            f"About to count lemmas of {total_docs} docs in {len(ranges)} ranges using {workers} workers",
+        )
+
+        results: List[Dict] = BuildFreqVocabJob.run_in_pool(
+            task,
+            BuildFreqVocabJob.count_range,
+            ranges,
+            workers=workers,
+            total_docs=total_docs,
+        )
+
+        missing_layers: int = sum(result["missing_layers"] for result in results)
+        if missing_layers:
+            task.log(
+                logging.WARNING,
+                f"Cannot find udpiped layer of {missing_layers} documents",
+            )
+
+        malformed_layers: int = sum(result["malformed_layers"] for result in results)
+        if malformed_layers:
+            task.log(
+                logging.WARNING,
+                f"Skipped {malformed_layers} documents with malformed udpiped layers",
+            )
+
+        # Reduce stage: merge the partial counts of the ranges with the previous counts
+        # of each corpus and store them
+        artifacts: List[CountsArtifact] = []
+
+        for corpus, base in bases.items():
+            totals_by_pos: Counter = Counter(
+                base.manifest["totals_by_pos"] if base is not None else {}
+            )
+            processed_articles: int = (
+                base.manifest["processed_articles"] if base is not None else 0
+            )
+            runs: List[pathlib.Path] = []
+
+            for (_, range_corpus, *_), result in zip(ranges, results):
+                if range_corpus == corpus:
+                    totals_by_pos.update(result["totals_by_pos"])
+                    processed_articles += result["processed_articles"]
+                    runs += result["runs"]
+
+            task.log(
+                logging.INFO,
+                f"Merging {len(runs)} runs of the spilled counts of {corpus}"
+                + ("" if base is None else f" into the version {base.version}"),
+            )
+
+            artifacts.append(
+                store.write(
+                    corpus,
+                    task.filtering,
+                    merge_runs(runs + (base.runs if base is not None else [])),
+                    {
+                        "task": str(task.pk),
+                        "base_version": base.version if base is not None else None,
+                        "counted_since": since[corpus],
+                        "counted_until": until,
+                        "processed_articles": processed_articles,
+                        "totals_by_pos": dict(totals_by_pos),
+                    },
+                )
+            )
+
+            for run in runs:
+                run.unlink()
+
+            task.log(
+                logging.INFO,
+                f"Stored the version {artifacts[-1].version} of the counts of {corpus} in {artifacts[-1].path}",
+            )
+
+        total_lemmas_by_pos: Counter = Counter()
+        processed_articles = 0
+
+        for artifact in artifacts:
+            total_lemmas_by_pos.update(artifact.manifest["totals_by_pos"])
+            processed_articles += artifact.manifest["processed_articles"]
+
+        total_lemmas: int = sum(total_lemmas_by_pos.values())
+        pruned: int = 0
+
+        filename, fp, w = BuildFreqVocabJob.open_vocab_writer(job, task)
+
+        # Merged counts come sorted by (pos, lemma), so they are sorted once again by
+        # the count within the pos, spilling to the disk as well
+        with ExternalSorter(
+            key=lambda r: (r[0], -r[2], r[1]),
+            max_records=task.memory_limit * 1024 * 1024 // ENTRY_OVERHEAD,
+            tmp_dir=tmp_dir,
+        ) as by_count:
+            for (pos, lemma), (count, doc_count) in merge_runs(
+                run for artifact in artifacts for run in artifact.runs
+            ):
+                if count < task.min_count:
+                    pruned += 1
+                    continue
+
+                by_count.add((pos, lemma, count, doc_count))
+
+            for pos, lemma, count, doc_count in by_count:
+                w.writerow(
+                    {
+                        "lemma": lemma,
+                        "pos": pos,
+                        "count": count,
+                        "doc_count": doc_count,
+                        "freq_by_pos": count / total_lemmas_by_pos[pos],
+                        "freq_in_corpus": count / total_lemmas,
+                        "doc_frequency": doc_count / processed_articles,
+                    }
+                )
+
+        fp.close()
+
+        if pruned:
+            task.log(
+                logging.INFO,
+                f"Skipped {pruned} lemmas with less than {task.min_count} occurences",
+            )
+
+        task.log(
+            logging.INFO,
+            f"Saved information on {total_lemmas} occurences from {processed_articles} docs, {total_docs} of them counted by this run, into the {filename}",
+        )
+
+
+class ProcessWithNlpUKJob(BaseCorpusTask):
+    @staticmethod
+    def _get_mongo_filter(task) -> dict:
+        if task.force or getattr(task, "skip_unchanged", False):
+            return {}  # {"_id": "44ca9029164a35c86a70469082770d9e8aa065b0"}
+        else:
+            # return {"processing_status": {"$nin": ["nlp_uk"]}, "_id": "44ca9029164a35c86a70469082770d9e8aa065b0"}
+            return {"processing_status": {"$nin": ["nlp_uk"]}}
+
+    @staticmethod
+    def get_total_count(db, job, task) -> int:
+        total = 0
+        for corpus in task.corpora:
+            total += db[corpus].count_documents(
+                ProcessWithNlpUKJob._get_mongo_filter(task)
+            )
+
+        return total
+
+    @staticmethod
+    def get_iter(db, job, task):
+        for corpus in task.corpora:
+            cursor = db[corpus].find(
+                ProcessWithNlpUKJob._get_mongo_filter(task),
+                {"title": 1, "text": 1},
+                no_cursor_timeout=True,
+            )
+            for article in cursor:
+                yield corpus, article
+            cursor.close()
+
+    # Maximal number of the documents in the batch, the size of the batch is limited
+    # by the number of characters, see AdaptiveBudget
+    MAX_BATCH_SIZE: int = 500
+
+    # Layers of the texts above that size are checked against the limit of Mongo
+    LARGE_TEXT_CHARS: int = 1000000
+
+    # Mongo doesn't store documents above 16MB, some room is left for the _id
+    MAX_LAYER_BYTES: int = 16 * 1024 * 1024 - 64 * 1024
+
+    # Documents, that cannot be processed, along with the errors, see record_failures
+    DEAD_LETTER_COLLECTION: str = "nlp_uk_dead_letters"
+
+    # Fields of the response of the nlp_uk_api and the layers they are stored in
+    LAYERS: Dict[str, str] = {
+        "cleanText": "cleansed",
+        "tokens": "tokenized",
+        "lemmas": "lemmatized",
+        "sentences": "sentenced",
+    }
+
+    # Number of the documents, whose layers are checked at once by iter_changed
+    CHECK_BATCH_SIZE: int = 1000
+
+    # Delay before the first retry of the failed request in seconds, doubled on each
+    # next one up to the maximum
+    RETRY_BACKOFF: float = 2.0
+    MAX_RETRY_BACKOFF: float = 120.0
+
+    @staticmethod
+    def remove_spaces(tokenized: List[List[str]]) -> List[List[str]]:
+        # Temproray solution until char modifiers tokenization will be fixed in LT
+        return [
+            [w for w in s if w.strip().strip(chr(65039) + "\u200b")] for s in tokenized
+        ]
+
+    @staticmethod
+    def get_source_hash(doc: Dict) -> str:
+        """
+        Hash of the title and the text of the document, as they are stored in the corpus,
+        recorded in the layers to tell whether the document was edited since
+        """
+        return sha1(
+            f"{doc.get('title', '')}\x00{doc.get('text', '')}".encode(
+                "utf-8", "surrogatepass"
+            )
+        ).hexdigest()
+
+    @staticmethod
+    def iter_changed(
+        db, task, docs: Iterable[Tuple[str, Dict]], skipped: Counter
+    ) -> Iterator[Tuple[str, Dict]]:
+        """
+        Skip the documents, which have all the layers built from the same title and text
+        by the same version of the nlp_uk_api (see NLP_UK_VERSION setting)
+        :param db: Mongo database
+        :param task: task instance
+        :param docs: iterator of (corpus, article)
+        :param skipped: counter of the skipped documents, updated as they are skipped
+        :return: iterator of (corpus, article) to process
+        """
+        for chunk in batch_iterator(docs, ProcessWithNlpUKJob.CHECK_BATCH_SIZE):
+            # layer id -> hash of the source of the document it belongs to
+            expected: Dict[str, str] = {}
+            for corpus, doc in chunk:
+                source_hash: str = ProcessWithNlpUKJob.get_source_hash(doc)
+
+                for layer_name in ProcessWithNlpUKJob.LAYERS.values():
+                    layer_id: str = ProcessWithNlpUKJob.get_layer_id(
+                        corpus, doc["_id"], layer_name
+                    )
+                    expected[layer_id] = source_hash
+
+            up_to_date: set = {
+                layer["_id"]
+                for layer in db.layers.find(
+                    {
+                        "_id": {"$in": list(expected)},
+                        "nlp_uk_version": settings.NLP_UK_VERSION,
+                    },
+                    {"source_hash": 1},
+                )
+                if layer.get("source_hash") == expected[layer["_id"]]
+            }
+
+            for corpus, doc in chunk:
+                if all(
+                    ProcessWithNlpUKJob.get_layer_id(corpus, doc["_id"], layer_name)
+                    in up_to_date
+                    for layer_name in ProcessWithNlpUKJob.LAYERS.values()
+                ):
+                    skipped["docs"] += 1
+                else:
+                    yield corpus, doc
+
+    @staticmethod
+    def iter_batches(
+        docs: Iterable[Tuple[str, Dict]], budget: AdaptiveBudget
+    ) -> Iterator[Tuple[List[str], List[Tuple[str, str]], Dict[Tuple[str, str], str]]]:
+        """
+        Strip the markdown of the titles and texts of the documents and group them
+        into the batches of about the current budget of characters
+        :param docs: iterator of (corpus, article)
+        :param budget: budget of the requests to the nlp_uk_api
+        :return: iterator of the texts to send to the nlp_uk_api, title and text of each
+            document, corpus/id identifiers of the documents and the hashes of their
+            sources by the identifiers
+        """
+        texts: List[str] = []
+        ids: List[Tuple[str, str]] = []
+        source_hashes: Dict[Tuple[str, str], str] = {}
+        size: int = 0
+
+        for corpus, doc in docs:
+            doc_texts: List[str] = [
+                md_to_text2(doc.get("title", "")),
+                md_to_text2(doc.get("text", "")),
+            ]
+            doc_size: int = sum(map(len, doc_texts))
+
+            if ids and (
+                size + doc_size > budget.current
+                or len(ids) >= ProcessWithNlpUKJob.MAX_BATCH_SIZE
+            ):
+                yield texts, ids, source_hashes
+                texts, ids, source_hashes, size = [], [], {}, 0
+
+            # Stacking up all the titles and texts of the documents
+            texts += doc_texts
+            # and preserving their corpus/id identifiers to use later
+            ids.append((corpus, doc["_id"]))
+            source_hashes[corpus, doc["_id"]] = ProcessWithNlpUKJob.get_source_hash(doc)
+            size += doc_size
+
+        if ids:
+            yield texts, ids, source_hashes
+
+    @staticmethod
+    def process_texts(
+        task, client: NlpUkClient, texts: List[str], budget: AdaptiveBudget
+    ) -> List[Dict]:
+        """
+        Send the texts to the nlp_uk_api in the requests of at most the current budget
+        of characters. Long texts are split into the chunks of paragraphs, results
+        of the chunks are stitched back. Outcome of every request adapts the budget.
+        Requests, failed with the transient errors, are retried up to max_retries
+        times of the task with the exponential backoff
+        :param task: task instance
+        :param client: client of the nlp_uk_api
+        :param texts: texts to process
+        :param budget: budget of the requests
+        :return: results of the processing of every text
+        """
+        chunks: List[List[Tuple[str, str]]] = [split_text(text) for text in texts]
+        flat: List[str] = [chunk for text_chunks in chunks for chunk, _ in text_chunks]
+        results: List[Dict] = []
+
+        for start, end in iter_slices(flat, budget.current):
+            chars: int = sum(map(len, flat[start:end]))
+
+            for attempt in range(task.max_retries + 1):
+                started: float = time.monotonic()
+
+                try:
+                    results += client.batch(flat[start:end])
+                    break
+                except NlpUkApiException as e:
+                    budget.observe(chars, time.monotonic() - started, failed=True)
+
+                    if not e.is_transient or attempt == task.max_retries:
+                        raise
+
+                    # Jitter keeps the concurrent requests from retrying all at once
+                    delay: float = min(
+                        ProcessWithNlpUKJob.RETRY_BACKOFF * 2**attempt,
+                        ProcessWithNlpUKJob.MAX_RETRY_BACKOFF,
+                    ) * random.uniform(0.5, 1.0)
+                    task.log(
+                        logging.WARNING,
+                        f"Request of {end - start} texts failed: {e}, retrying in {delay:.1f}s",
+                    )
+                    time.sleep(delay)
+
+            budget.observe(chars, time.monotonic() - started)
+
+        res: List[Dict] = []
+        offset: int = 0
+        for text_chunks in chunks:
+            res.append(
+                stitch_results(results[offset : offset + len(text_chunks)], text_chunks)
+            )
+            offset += len(text_chunks)
+
+        return res
+
+    @staticmethod
+    def process_bisecting(
+        task,
+        client: NlpUkClient,
+        texts: List[str],
+        ids: List[Tuple[str, str]],
+        budget: AdaptiveBudget,
+    ) -> Tuple[
+        List[Tuple[str, str]],
+        List[Dict],
+        List[Tuple[Tuple[str, str], NlpUkApiException]],
+    ]:
+        """
+        Process the batch, and if it fails, process its halves recursively, until the
+        documents, that cause the failure, are isolated. Transient errors, that persist
+        after the retries, fail the whole batch, as splitting it won't help
+        :param task: task instance
+        :param client: client of the nlp_uk_api
+        :param texts: titles and texts of the documents
+        :param ids: corpus/id identifiers of the documents
+        :param budget: budget of the requests
+        :return: ids of the processed documents, results of their titles and texts,
+            and the failed documents along with the errors
+        """
+        try:
+            return (
+                ids,
+                ProcessWithNlpUKJob.process_texts(task, client, texts, budget),
+                [],
+            )
+        except NlpUkApiException as e:
+            if e.is_transient or len(ids) == 1:
+                return [], [], [(id_, e) for id_ in ids]
+
+            middle: int = len(ids) // 2
+            task.log(
+                logging.INFO,
+                f"Batch of {len(ids)} docs failed: {e}, bisecting it",
+            )
+
+            left_ids, left_batch, left_failures = ProcessWithNlpUKJob.process_bisecting(
+                task, client, texts[: middle * 2], ids[:middle], budget
+            )
+            right_ids, right_batch, right_failures = (
+                ProcessWithNlpUKJob.process_bisecting(
+                    task, client, texts[middle * 2 :], ids[middle:], budget
+                )
+            )
+
+            return (
+                left_ids + right_ids,
+                left_batch + right_batch,
+                left_failures + right_failures,
+            )
+
+    @staticmethod
+    def record_failures(
+        db, task, failures: List[Tuple[Tuple[str, str], NlpUkApiException]]
+    ) -> None:
+        """
+        Store the documents, that cannot be processed, in the dead-letter collection,
+        so they can be processed again with ReprocessNlpUkDeadLettersJob
+        :param db: Mongo database
+        :param task: task instance
+        :param failures: corpus/id identifiers of the documents and the errors
+        """
+        if not failures:
+            return
+
+        task.log(
+            logging.ERROR,
+            f"Cannot process {len(failures)} docs, storing them in the {ProcessWithNlpUKJob.DEAD_LETTER_COLLECTION}: "
+            + ", ".join(f"{corpus}.{id_}: {e}" for (corpus, id_), e in failures)[:2000],
+        )
+
+        db[ProcessWithNlpUKJob.DEAD_LETTER_COLLECTION].bulk_write(
+            [
+                pymongo.UpdateOne(
+                    {"_id": f"{corpus}.{id_}"},
+                    {
+                        "$set": {
+                            "corpus": corpus,
+                            "parent_id": id_,
+                            "error": str(e)[:10000],
+                            "status_code": e.status_code,
+                            "task": str(task.pk),
+                        },
+                        "$inc": {"failures": 1},
+                        "$currentDate": {"failed_at": True},
+                    },
+                    upsert=True,
+                )
+                for (corpus, id_), e in failures
+            ]
+        )
+
+    @staticmethod
+    def get_client(pool_size: int = 0) -> NlpUkClient:
+        """
+        Client of the nlp_uk_api instances, configured in the settings
+        :param pool_size: number of the connections to keep to each instance, at least
+            NLP_UK_POOL_SIZE
+        """
+        return NlpUkClient(
+            base_url=settings.NLP_UK_BASE_URL,
+            balancing=settings.NLP_UK_BALANCING,
+            pool_size=max(pool_size, settings.NLP_UK_POOL_SIZE),
+            timeout=(settings.NLP_UK_CONNECT_TIMEOUT, settings.NLP_UK_READ_TIMEOUT),
+            compress_requests=settings.NLP_UK_COMPRESS_REQUESTS,
+        )
+
+    @staticmethod
+    def log_budget(task, budget: AdaptiveBudget) -> None:
+        task.log(
+            logging.INFO,
+            f"Sent {budget.stats['requests']} requests of {budget.stats['chars']} chars "
+            + f"({budget.stats['failed']} failed), budget was increased {budget.stats['increases']} "
+            + f"and decreased {budget.stats['decreases']} times and ended at {budget.current} chars",
+        )
+
+    @staticmethod
+    def get_updates(
+        task,
+        ids: List[Tuple[str, str]],
+        batch: List[Dict],
+        source_hashes: Dict[Tuple[str, str], str],
+    ) -> Tuple[
+        List[pymongo.ReplaceOne],
+        Dict[str, List[pymongo.UpdateOne]],
+        List[str],
+        List[Tuple[Tuple[str, str], NlpUkApiException]],
+    ]:
+        """
+        Turn the response of the nlp_uk_api into the write operations. Documents with
+        the layers, that are too large for Mongo, are returned as the failures
+        :param task: task instance
+        :param ids: corpus/id identifiers of the documents
+        :param batch: processed titles and texts of the documents
+        :param source_hashes: hashes of the titles and texts of the documents, recorded
+            in the layers along with the version of the nlp_uk_api
+        :return: layers to upsert, updates of the corpus documents by corpus, the ids
+            of the stored documents and the documents, that cannot be stored, with the errors
+        """
+        # Here we will collect the list of layers to upsert into the layers collection
+        layers: List[pymongo.ReplaceOne] = []
+
+        # This is the list of update operations, to connect original documents,
+        # identified by corpus/id pair to the respective layers in bulk
+        layer_refs: Dict[str, List[pymongo.UpdateOne]] = defaultdict(list)
+        ids_: List[str] = []
+        too_large: List[Tuple[Tuple[str, str], NlpUkApiException]] = []
+
+        # Batch 2 here means, that we are grouping back the results of processing
+        # of title and texts, as they'll live in the same layer document
+        for (corpus, id_), (title, text) in zip(ids, batch_iterator(batch, 2)):
+            update_clause: Dict = {}
+            doc_layers: List[pymongo.ReplaceOne] = []
+            is_large: bool = (
+                len(title["cleanText"]) + len(text["cleanText"])
+                > ProcessWithNlpUKJob.LARGE_TEXT_CHARS
+            )
+
+            # Remapping the fieldnames in the API response to something more suitable
+            for field_name, layer_name in ProcessWithNlpUKJob.LAYERS.items():
+                # ids for the layers are being made from hashing of the corpus/document id and
+                # the layer name
+                layer_id: str = ProcessWithNlpUKJob.get_layer_id(
+                    corpus, id_, layer_name
+                )
+                update_clause[f"layers.{layer_name}"] = layer_id
+
+                if field_name == "tokens":
+                    title[field_name] = ProcessWithNlpUKJob.remove_spaces(
+                        title[field_name]
+                    )
+                    text[field_name] = ProcessWithNlpUKJob.remove_spaces(
+                        text[field_name]
+                    )
+
+                layer_data: Dict = {
+                    "corpus": corpus,
+                    "parent_id": id_,
+                    "layer_type": layer_name,
+                    "updated_at": datetime.now(timezone.utc),
+                    "source_hash": source_hashes[corpus, id_],
+                    "nlp_uk_version": settings.NLP_UK_VERSION,
+                    "title": title[field_name],
+                    "text": text[field_name],
+                }
+
+                max_size: int = ProcessWithNlpUKJob.MAX_LAYER_BYTES
+                if is_large and len(bson.encode(layer_data)) > max_size:
+                    too_large.append(
+                        (
+                            (corpus, id_),
+                            NlpUkApiException(
+                                f"Layer {layer_name} is too large to store"
+                            ),
+                        )
+                    )
+                    break
+
+                doc_layers.append(
+                    # layer will have a processed version of both fields, title and text
+                    pymongo.ReplaceOne({"_id": layer_id}, layer_data, upsert=True)
+                )
+            else:
+                ids_.append(f"{corpus}.{id_}")
+                layers += doc_layers
+
+                # Collecting the update operations
+                layer_refs[corpus].append(
+                    pymongo.UpdateOne(
+                        {"_id": id_},
+                        {
+                            "$set": update_clause,
+                            "$addToSet": {"processing_status": "nlp_uk"},
+                            "$currentDate": {"updated_at": True},
+                        },
+                        upsert=True,
+                    )
+                )
+
+        return layers, layer_refs, ids_, too_large
+
+    @staticmethod
+    def bulk_update(
+        db,
+        task,
+        layers: List[pymongo.ReplaceOne],
+        layer_refs: Dict[str, List[pymongo.UpdateOne]],
+        ids_: List[str],
+        failures: Optional[List[Tuple[Tuple[str, str], NlpUkApiException]]] = None,
+    ) -> None:
+        ProcessWithNlpUKJob.record_failures(db, task, failures or [])
+
+        # Bulk upsert!
+        try:
+            if layers:
+                db.layers.bulk_write(layers)
+        except (pymongo.errors.WriteError, pymongo.errors.OperationFailure) as e:
+            task.log(
+                logging.WARNING,
+                f"Cannot add layers: {e}, batch ids looks like {ids_}",
+            )
+
+        for corpus, updates in layer_refs.items():
+            try:
+                db[corpus].bulk_write(updates)
+            except (
+                pymongo.errors.WriteError,
+                pymongo.errors.OperationFailure,
+            ) as e:
+                task.log(
+                    logging.WARNING,
+                    f"Cannot reference layers from the corpus document: {e}",
+                )
+
+        # Documents, that were processed at last, are no longer dead
+        if ids_:
+            db[ProcessWithNlpUKJob.DEAD_LETTER_COLLECTION].delete_many(
+                {"_id": {"$in": ids_}}
+            )
+
+    @staticmethod
+    def execute(job, task):
+        assert settings.NLP_UK_BASE_URL, "You must set NLP_UK_BASE_URL setting to begin"
+
+        from .mongodb import get_db
+
+        db = get_db()
+
+        ProcessWithNlpUKJob.process(
+            job,
+            task,
+            db,
+            ProcessWithNlpUKJob.get_iter(db, job, task),
+            ProcessWithNlpUKJob.get_total_count(db, job, task),
+        )
+
+    @staticmethod
+    def process(
+        job, task, db, docs: Iterable[Tuple[str, Dict]], total_docs: int
+    ) -> None:
+        """
+        Process the documents with the nlp_uk_api and store the layers
+        :param job: job instance
+        :param task: task instance
+        :param db: Mongo database
+        :param docs: iterator of (corpus, article)
+        :param total_docs: number of the documents to process
+        """
+        # Skipped documents count towards the progress
+        skipped: Counter = Counter()
+        if getattr(task, "skip_unchanged", False):
+            docs = ProcessWithNlpUKJob.iter_changed(db, task, docs, skipped)
+
+        if getattr(task, "pipelined", False):
+            ProcessWithNlpUKJob.execute_pipelined(
+                job, task, db, docs, total_docs, skipped
+            )
+        else:
+            ProcessWithNlpUKJob.execute_sequential(
+                job, task, db, docs, total_docs, skipped
+            )
+
+        if getattr(task, "skip_unchanged", False):
+            task.log(
+                logging.INFO,
+                f"Skipped {skipped['docs']} docs, that didn't change since they were processed "
+                + f"by the nlp_uk_api version '{settings.NLP_UK_VERSION}'",
+            )
+
+    @staticmethod
+    def execute_sequential(
+        job,
+        task,
+        db,
+        docs: Iterable[Tuple[str, Dict]],
+        total_docs: int,
+        skipped: Counter,
+    ) -> None:
+        """
+        Process the batches of the documents one by one
+        :param job: job instance
+        :param task: task instance
+        :param db: Mongo database
+        :param docs: iterator of (corpus, article)
+        :param total_docs: number of the documents to process
+        :param skipped: counter of the documents, skipped as unchanged
+        """
+        client: NlpUkClient = ProcessWithNlpUKJob.get_client()
+        budget: AdaptiveBudget = AdaptiveBudget(
+            initial=task.batch_chars, target_latency=task.target_latency
+        )
+        processed_docs: int = 0
+
+        # First we iterate over the batches of the documents found.
+        # Each document has title and text fields that has to be processed, so the
+        # batch of 500 documents makes 1000 texts to be sent to the nlp_uk_api
+        for texts, ids, source_hashes in ProcessWithNlpUKJob.iter_batches(docs, budget):
+            processed_docs += len(ids)
+
+            # Sending texts for the processing, failed documents are isolated
+            ok_ids, batch, failures = ProcessWithNlpUKJob.process_bisecting(
+                task, client, texts, ids, budget
+            )
+
+            layers, layer_refs, ids_, too_large = ProcessWithNlpUKJob.get_updates(
+                task, ok_ids, batch, source_hashes
+            )
+
+            ProcessWithNlpUKJob.bulk_update(
+                db, task, layers, layer_refs, ids_, failures + too_large
+            )
+
+            task.set_progress(
+                (processed_docs + skipped["docs"]) * 100 // total_docs, step=1
+            )
+
+        ProcessWithNlpUKJob.log_budget(task, budget)
+
+    @staticmethod
+    def execute_pipelined(
+        job,
+        task,
+        db,
+        docs: Iterable[Tuple[str, Dict]],
+        total_docs: int,
+        skipped: Counter,
+    ) -> None:
+        """
+        Process the documents in three overlapping stages, connected by the bounded
+        queues: reading of the documents and stripping of the markdown (this thread),
+        inflight_requests threads, sending the batches to the nlp_uk_api, and the writer
+        thread, storing the layers. Stage that runs ahead blocks on the full queue, so
+        only a couple of batches per request are kept in memory. Time each stage spent
+        working, waiting for the input and blocked by the next stage is logged in the
+        end to find the bottleneck
+        :param job: job instance
+        :param task: task instance
+        :param db: Mongo database
+        :param docs: iterator of (corpus, article)
+        :param total_docs: number of the documents to process
+        :param skipped: counter of the documents, skipped as unchanged
+        """
+        inflight: int = max(task.inflight_requests, 1)
+        budget: AdaptiveBudget = AdaptiveBudget(
+            initial=task.batch_chars, target_latency=task.target_latency
+        )
+        # Shared by the requesters, so the requests are balanced between the instances
+        client: NlpUkClient = ProcessWithNlpUKJob.get_client(pool_size=inflight)
+
+        request_queue: queue.Queue = queue.Queue(maxsize=inflight * 2)
+        write_queue: queue.Queue = queue.Queue(maxsize=inflight * 2)
+
+        # Set when any of the stages fails, so the others don't wait for it forever
+        stop: threading.Event = threading.Event()
+        errors: List[BaseException] = []
+
+        # stage -> batches, docs and seconds spent working, waiting and blocked
+        timings: Dict[str, Counter] = defaultdict(Counter)
+        timings_lock: threading.Lock = threading.Lock()
+
+        def record(stage: str, **stats: float) -> None:
+            with timings_lock:
+                timings[stage].update(stats)
+
+        def put(q: queue.Queue, item) -> float:
+            started: float = time.monotonic()
+
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+            return time.monotonic() - started
+
+        def get(q: queue.Queue) -> Tuple[Any, float]:
+            started: float = time.monotonic()
+
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=1), time.monotonic() - started
+                except queue.Empty:
+                    continue
+
+            return None, time.monotonic() - started
+
+        def requester() -> None:
+            from django.db import connection
+
+            try:
+                while True:
+                    item, waited = get(request_queue)
+                    if item is None:
+                        break
+
+                    texts, ids, source_hashes = item
+                    started: float = time.monotonic()
+
+                    ok_ids, batch, failures = ProcessWithNlpUKJob.process_bisecting(
+                        task, client, texts, ids, budget
+                    )
+                    *updates, too_large = ProcessWithNlpUKJob.get_updates(
+                        task, ok_ids, batch, source_hashes
+                    )
+                    failures += too_large
+                    busy: float = time.monotonic() - started
+
+                    record(
+                        "nlp",
+                        waiting=waited,
+                        busy=busy,
+                        blocked=put(write_queue, (*updates, failures)),
+                        batches=1,
+                        docs=len(ok_ids) - len(too_large),
+                        failed=len(failures),
+                    )
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                connection.close()
+
+        def writer() -> None:
+            from django.db import connection
+
+            processed_docs: int = 0
+
+            try:
+                while True:
+                    item, waited = get(write_queue)
+                    if item is None:
+                        break
+
+                    started: float = time.monotonic()
+                    ProcessWithNlpUKJob.bulk_update(db, task, *item)
+
+                    processed_docs += len(item[2]) + len(item[3])
+                    task.set_progress(
+                        (processed_docs + skipped["docs"]) * 100 // total_docs, step=1
+                    )
+
+                    record(
+                        "write",
+                        waiting=waited,
+                        busy=time.monotonic() - started,
+                        batches=1,
+                        docs=len(item[2]),
+                    )
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                connection.close()
+
+        requesters: List[threading.Thread] = [
+            threading.Thread(target=requester, daemon=True) for _ in range(inflight)
+        ]
+        writer_thread: threading.Thread = threading.Thread(target=writer, daemon=True)
+
+        for thread in requesters + [writer_thread]:
+            thread.start()
+
+        task.log(
+            logging.INFO,
+            f"About to process {total_docs} docs with {inflight} requests in flight",
+        )
+
+        started: float = time.monotonic()
+        batches: Iterator[Tuple] = ProcessWithNlpUKJob.iter_batches(docs, budget)
+
+        try:
+            while not stop.is_set():
+                read_started: float = time.monotonic()
+                item: Optional[Tuple] = next(batches, None)
+                if item is None:
+                    break
+
+                _, ids, _ = item
+
+                record(
+                    "read",
+                    busy=time.monotonic() - read_started,
+                    blocked=put(request_queue, item),
+                    batches=1,
+                    docs=len(ids),
+                )
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            for _ in requesters:
+                put(request_queue, None)
+
+            for thread in requesters:
+                thread.join()
+
+            put(write_queue, None)
+            writer_thread.join()
+
+        if errors:
+            raise errors[0]
+
+        elapsed: float = time.monotonic() - started
+
+        for stage, threads in [("read", 1), ("nlp", inflight), ("write", 1)]:
+            stats: Counter = timings[stage]
+
+            task.log(
+                logging.INFO,
+                f"Stage {stage}: {stats['batches']} batches, {stats['docs']} docs, "
+                + f"busy {stats['busy']:.1f}s ({stats['busy'] * 100 / max(elapsed * threads, 1e-6):.0f}% "
+                + f"of {threads} thread(s)), waited for input {stats['waiting']:.1f}s, "
+                + f"blocked by the next stage {stats['blocked']:.1f}s",
+            )
+
+        if timings["nlp"]["failed"]:
+            task.log(
+                logging.WARNING,
+                f"{timings['nlp']['failed']} docs failed and were stored in the {ProcessWithNlpUKJob.DEAD_LETTER_COLLECTION}",
+            )
+
+        ProcessWithNlpUKJob.log_budget(task, budget)
+
+        task.log(
+            logging.INFO,
+            f"Processed {timings['write']['docs']} docs in {elapsed:.1f}s "
+            + f"({timings['write']['docs'] / max(elapsed, 1e-6):.1f} docs/s)",
+        )
+
+
+class ReprocessNlpUkDeadLettersJob(BaseCorpusTask):
+    """
+    Process once again the documents, that failed the processing with nlp_uk_api
+    and were stored in the dead-letter collection by ProcessWithNlpUKJob
+    """
+
+    @staticmethod
+    def _get_mongo_filter(task) -> dict:
+        return {"corpus": {"$in": task.corpora}}
+
+    @staticmethod
+    def get_total_count(db, job, task) -> int:
+        return db[ProcessWithNlpUKJob.DEAD_LETTER_COLLECTION].count_documents(
+            ReprocessNlpUkDeadLettersJob._get_mongo_filter(task)
+        )
+
+    @staticmethod
+    def get_iter(db, job, task):
+        BATCH_SIZE = 1000  # how many articles to fetch at once
+
+        dead_letters = db[ProcessWithNlpUKJob.DEAD_LETTER_COLLECTION]
+        for corpus in task.corpora:
+            # Ids are fetched beforehand, as the entries are removed while processing
+            ids: List[str] = [
+                doc["parent_id"]
+                for doc in dead_letters.find({"corpus": corpus}, {"parent_id": 1})
+            ]
+
+            for chunk in batch_iterator(ids, BATCH_SIZE):
+                found: int = 0
+                for article in db[corpus].find(
+                    {"_id": {"$in": chunk}}, {"title": 1, "text": 1}
+                ):
+                    found += 1
+                    yield corpus, article
+
+                if found < len(chunk):
+                    task.log(
+                        logging.WARNING,
+                        f"{len(chunk) - found} documents of the dead letters are missing in the {corpus}",
+                    )
+
+    @staticmethod
+    def execute(job, task):
+        assert settings.NLP_UK_BASE_URL, "You must set NLP_UK_BASE_URL setting to begin"
+
+        from .mongodb import get_db
+
+        db = get_db()
+
+        total_docs: int = ReprocessNlpUkDeadLettersJob.get_total_count(db, job, task)
+        task.log(logging.INFO, f"About to reprocess {total_docs} dead letters")
+
+        ProcessWithNlpUKJob.process(
+            job,
+            task,
+            db,
+            ReprocessNlpUkDeadLettersJob.get_iter(db, job, task),
+            total_docs,
+        )
+
+        task.log(
+            logging.INFO,
+            f"{ReprocessNlpUkDeadLettersJob.get_total_count(db, job, task)} dead letters are left",
+        )
+
+
+class DetectLanguageJob(BaseCorpusTask):
+    """
+    Identify languages of the cleansed texts paragraph by paragraph and store them
+    in the langid layer, with the summary in the corpus document, so the filters
+    don't have to run the classifier on every export
+    """
+
+    layer_name: str = "langid"
+
+    # gcld3 looks only at the beginning of the text, longer paragraphs are truncated
+    MAX_PARAGRAPH_BYTES: int = 10000
+
+    @staticmethod
+    def _get_mongo_filter(task) -> dict:
+        clause: Dict = {"processing_status": {"$in": ["nlp_uk"]}}
+
+        if not task.force:
+            clause["processing_status"]["$nin"] = [DetectLanguageJob.layer_name]
+
+        return clause
+
+    @staticmethod
+    def get_total_count(db, job, task) -> int:
+        total = 0
+        for corpus in task.corpora:
+            total += db[corpus].count_documents(
+                DetectLanguageJob._get_mongo_filter(task)
+            )
+
+        return total
+
+    @staticmethod
+    def detect_paragraphs(lang_detector, text: str) -> List[Dict]:
+        """
+        Identify the language of every non-empty paragraph of the text
+        :param lang_detector: gcld3.NNetLanguageIdentifier instance
+        :param text: cleansed text
+        :return: list of dicts with the language, probability, reliability and length
+        """
+        paragraphs: List[Dict] = []
+
+        for paragraph in (text or "").split("\n"):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+
+            result = lang_detector.FindLanguage(text=paragraph)
+            paragraphs.append(
+                {
+                    "lang": result.language,
+                    "prob": round(result.probability, 4),
+                    "reliable": result.is_reliable,
+                    "length": len(paragraph),
+                }
+            )
+
+        return paragraphs
+
+    @staticmethod
+    def summarize(paragraphs: List[Dict]) -> Dict:
+        """
+        Summarize the languages of the paragraphs, weighting them by the length
+        :param paragraphs: paragraphs, as returned by detect_paragraphs
+        :return: dict with the prevailing language, share of the characters in the
+            Ukrainian paragraphs and the reliability of the identification
+        """
+        by_lang: Counter = Counter()
+        reliable_length: int = 0
+
+        for paragraph in paragraphs:
+            by_lang[paragraph["lang"]] += paragraph["length"]
+            if paragraph["reliable"]:
+                reliable_length += paragraph["length"]
+
+        total_length: int = sum(by_lang.values())
+        if not total_length:
+            return {"lang": "und", "uk_rate": 0.0, "reliable": False}
+
+        return {
+            "lang": by_lang.most_common(1)[0][0],
+            "uk_rate": round(by_lang["uk"] / total_length, 4),
+            # Most of the text was identified reliably
+            "reliable": reliable_length * 2 >= total_length,
+        }
+
+    @staticmethod
+    def detect_range(
+        task, corpus: str, lower: Optional[str], upper: Optional[str]
+    ) -> Dict:
+        """
+        Identify the languages of the documents in the range of ids of the corpus.
+        Runs in the worker process of the pool
+        :param task: task instance
+        :param corpus: corpus name
+        :param lower: lower bound of ids (inclusive) or None
+        :param upper: upper bound of ids (exclusive) or None
+        :return: stats of the processed range
+        """
+        BULK_UPDATE_SIZE = 100  # how many articles and layers to insert/update at once
+
+        from .mongodb import get_db
+
+        # Connection of the parent process cannot be reused after the fork
+        db = get_db()
+        layer_name: str = DetectLanguageJob.layer_name
+
+        lang_detector = gcld3.NNetLanguageIdentifier(
+            min_num_bytes=0, max_num_bytes=DetectLanguageJob.MAX_PARAGRAPH_BYTES
+        )
+
+        stats: Dict = {"corpus": corpus, "processed_docs": 0, "languages": Counter()}
+        layers: List[pymongo.ReplaceOne] = []
+        updates: List[pymongo.UpdateOne] = []
+
+        def bulk_update() -> None:
+            try:
+                if layers:
+                    db.layers.bulk_write(layers)
+                if updates:
+                    db[corpus].bulk_write(updates)
+            except (pymongo.errors.WriteError, pymongo.errors.OperationFailure) as e:
+                task.log(logging.WARNING, f"Cannot store language layers: {e}")
+
+            report_pool_progress(len(updates))
+            layers.clear()
+            updates.clear()
+
+        cursor = Corpus.get_articles_with_layers(
+            collection=corpus,
+            layer_names=["cleansed"],
+            match_clause=DetectLanguageJob.merge_mongo_filters(
+                DetectLanguageJob._get_mongo_filter(task),
+                Corpus.get_id_range_clause(lower, upper),
+            ),
+            project_clause={"title": 0, "text": 0, "clean": 0, "nlp": 0},
+            database=db,
+        )
+
+        for article in cursor:
+            id_: str = article["_id"]
+            cleansed: Dict = article.get("cleansed") or {}
+
+            layer_data: Dict = {
+                "corpus": corpus,
+                "parent_id": id_,
+                "layer_type": layer_name,
+                "updated_at": datetime.now(timezone.utc),
+            }
+
+            for f in ["title", "text"]:
+                layer_data[f] = DetectLanguageJob.detect_paragraphs(
+                    lang_detector, cleansed.get(f, "")
+                )
+
+            summary: Dict = DetectLanguageJob.summarize(
+                layer_data["title"] + layer_data["text"]
+            )
+            layer_data["summary"] = summary
+            stats["languages"][summary["lang"]] += 1
+
+            layer_id: str = DetectLanguageJob.get_layer_id(
+                corpus=corpus, id_=id_, layer_name=layer_name
+            )
+            layers.append(
+                pymongo.ReplaceOne({"_id": layer_id}, layer_data, upsert=True)
+            )
+
+            # Summary is duplicated in the corpus document for the Mongo-side filtering
+            updates.append(
+                pymongo.UpdateOne(
+                    {"_id": id_},
+                    {
+                        "$set": {f"layers.{layer_name}": layer_id, "langid": summary},
+                        "$addToSet": {"processing_status": layer_name},
+                        # updated_at is left alone, language alone doesn't call for
+                        # the reexport of the document
+                        "$currentDate": {"langid_at": True},
+                    },
+                )
+            )
+            stats["processed_docs"] += 1
+
+            if len(updates) == BULK_UPDATE_SIZE:
+                bulk_update()
+
+        cursor.close()
+
+        # Leftovers
+        bulk_update()
+
+        return stats
+
+    @staticmethod
+    def execute(job, task):
+        from .mongodb import get_db
+
+        db = get_db()
+
+        total_docs: int = DetectLanguageJob.get_total_count(db, job, task)
+        workers: int = max(task.workers, 1)
+
+        # Every corpus is split into several ranges per worker to balance the load
+        ranges: List[Tuple] = []
+        for corpus in task.corpora:
+            for lower, upper in Corpus.get_id_ranges(
+                collection=corpus,
+                num_ranges=workers * 4 if workers > 1 else 1,
+                match_clause=DetectLanguageJob._get_mongo_filter(task),
+            ):
+                ranges.append((task, corpus, lower, upper))
+
+        task.log(
+            logging.INFO,
+            f"About to detect languages of {total_docs} docs in {len(ranges)} ranges using {workers} workers",
+        )
+
+        results: List[Dict] = DetectLanguageJob.run_in_pool(
+            task,
+            DetectLanguageJob.detect_range,
+            ranges,
+            workers=workers,
+            total_docs=total_docs,
+        )
+
+        languages: Counter = Counter()
+        for result in results:
+            languages.update(result["languages"])
+
+        task.log(
+            logging.INFO,
+            f"Processed {sum(r['processed_docs'] for r in results)} docs, "
+            + f"prevailing languages: {dict(languages.most_common(10))}",
+        )
+
+
+class DeduplicateJob(BaseCorpusTask):
+    """
+    Find near-duplicate texts across the corpora. MinHash signatures of the tokenized
+    texts are calculated in parallel and stored in the minhash layer, then the documents
+    are added one by one to the LSH index on disk and assigned to the clusters of
+    near-duplicates. The index is kept between the runs, so only the new documents
+    are processed next time
+    """
+
+    layer_name: str = "minhash"
+
+    @staticmethod
+    def _get_signature_filter(task) -> dict:
+        clause: Dict = {"processing_status": {"$in": ["nlp_uk"]}}
+
+        if not task.force:
+            clause["processing_status"]["$nin"] = [DeduplicateJob.layer_name]
+
+        return clause
+
+    @staticmethod
+    def _get_mongo_filter(task) -> dict:
+        clause: Dict = {"processing_status": {"$in": [DeduplicateJob.layer_name]}}
+
+        if not task.force:
+            clause["processing_status"]["$nin"] = ["dedup"]
+
+        return clause
+
+    @staticmethod
+    def get_total_count(db, job, task) -> int:
+        total = 0
+        for corpus in task.corpora:
+            total += db[corpus].count_documents(DeduplicateJob._get_mongo_filter(task))
+
+        return total
+
+    @staticmethod
+    def sign_range(
+        task, corpus: str, lower: Optional[str], upper: Optional[str]
+    ) -> int:
+        """
+        Calculate signatures of the documents in the range of ids of the corpus.
+        Runs in the worker process of the pool
+        :param task: task instance
+        :param corpus: corpus name
+        :param lower: lower bound of ids (inclusive) or None
+        :param upper: upper bound of ids (exclusive) or None
+        :return: number of processed documents
+        """
+        BULK_UPDATE_SIZE = 100  # how many articles and layers to insert/update at once
+
+        from .mongodb import get_db
+
+        # Connection of the parent process cannot be reused after the fork
+        db = get_db()
+        layer_name: str = DeduplicateJob.layer_name
+
+        processed: int = 0
+        layers: List[pymongo.ReplaceOne] = []
+        updates: List[pymongo.UpdateOne] = []
+
+        def bulk_update() -> None:
+            try:
+                if layers:
+                    db.layers.bulk_write(layers)
+                if updates:
+                    db[corpus].bulk_write(updates)
+            except (pymongo.errors.WriteError, pymongo.errors.OperationFailure) as e:
+                task.log(logging.WARNING, f"Cannot store minhash layers: {e}")
+
+            report_pool_progress(len(updates))
+            layers.clear()
+            updates.clear()
+
+        cursor = Corpus.get_articles_with_layers(
+            collection=corpus,
+            layer_names=["tokenized"],
+            match_clause=DeduplicateJob.merge_mongo_filters(
+                DeduplicateJob._get_signature_filter(task),
+                Corpus.get_id_range_clause(lower, upper),
+            ),
+            project_clause={"title": 0, "text": 0, "clean": 0, "nlp": 0},
+            database=db,
+        )
+
+        for article in cursor:
+            id_: str = article["_id"]
+            tokenized: Dict = article.get("tokenized") or {}
+
+            # Punctuation is ignored, so the reformatted reposts are still matched
+            words: List[str] = [
+                w
+                for f in ["title", "text"]
+                for sentence in tokenized.get(f, [])
+                for w in sentence
+                if word_pattern.search(w)
+            ]
+            shingles: List[int] = get_shingles(words)
+            signature: Optional[List[int]] = get_signature(shingles)
+
+            layer_id: str = DeduplicateJob.get_layer_id(
+                corpus=corpus, id_=id_, layer_name=layer_name
+            )
+            layers.append(
+                pymongo.ReplaceOne(
+                    {"_id": layer_id},
+                    {
+                        "corpus": corpus,
+                        "parent_id": id_,
+                        "layer_type": layer_name,
+                        "updated_at": datetime.now(timezone.utc),
+                        "shingles": len(set(shingles)),
+                        "signature": (
+                            pack_signature(signature) if signature is not None else None
+                        ),
+                    },
+                    upsert=True,
+                )
+            )
+            updates.append(
+                pymongo.UpdateOne(
+                    {"_id": id_},
+                    {
+                        "$set": {f"layers.{layer_name}": layer_id},
+                        "$addToSet": {"processing_status": layer_name},
+                    },
+                )
+            )
+            processed += 1
+
+            if len(updates) == BULK_UPDATE_SIZE:
+                bulk_update()
+
+        cursor.close()
+
+        # Leftovers
+        bulk_update()
+
+        return processed
+
+    @staticmethod
+    def execute(job, task):
+        BULK_UPDATE_SIZE = 1000  # how many articles to update at once
+
+        from .mongodb import get_db
+
+        db = get_db()
+        workers: int = max(task.workers, 1)
+
+        # Stage 1: signatures of the new documents
+        total_docs: int = sum(
+            db[corpus].count_documents(DeduplicateJob._get_signature_filter(task))
+            for corpus in task.corpora
+        )
+
+        ranges: List[Tuple] = []
+        for corpus in task.corpora:
+            for lower, upper in Corpus.get_id_ranges(
+                collection=corpus,
+                num_ranges=workers * 4 if workers > 1 else 1,
+                match_clause=DeduplicateJob._get_signature_filter(task),
+            ):
+                ranges.append((task, corpus, lower, upper))
+
+        task.log(
+            logging.INFO,
+            f"About to calculate signatures of {total_docs} docs using {workers} workers",
+        )
+
+        DeduplicateJob.run_in_pool(
+            task,
+            DeduplicateJob.sign_range,
+            ranges,
+            workers=workers,
+            total_docs=total_docs,
+        )
+
+        # Stage 2: clustering in the order of corpora and ids, so the first document
+        # of the cluster is the one to keep
+        index_filename: pathlib.Path = pathlib.Path(settings.CORPUS_LSH_INDEX_FILE)
+        index: LSHIndex = LSHIndex(index_filename)
+
+        if task.force:
+            # Index is shared by all the corpora, the documents of the others are kept
+            # there, as they are not going to be added back by this run
+            for corpus in task.corpora:
+                removed: int = index.remove_corpus(corpus)
+                task.log(
+                    logging.INFO,
+                    f"Removed {removed} docs of {corpus} from the index {index_filename}",
+                )
+
+        total_docs = DeduplicateJob.get_total_count(db, job, task)
+        processed: int = 0
+        duplicates: int = 0
+
+        task.log(
+            logging.INFO,
+            f"About to cluster {total_docs} docs, {len(index)} docs are already in the index",
+        )
+
+        for corpus in task.corpora:
+            updates: List[pymongo.UpdateOne] = []
+
+            def bulk_update() -> None:
+                # Index goes first, documents, that are already there, keep their
+                # clusters when the interrupted job is restarted
+                index.commit()
+
+                try:
+                    if updates:
+                        db[corpus].bulk_write(updates)
+                except (
+                    pymongo.errors.WriteError,
+                    pymongo.errors.OperationFailure,
+                ) as e:
+                    task.log(logging.WARNING, f"Cannot store clusters: {e}")
+
+                updates.clear()
 
-                            for pair in w.feats.split("|"):
-                                if not pair:
-                                    continue
-                                cat, val = pair.split("=")
-                                feat_categories.update([cat])
-                                feat_values[cat].update([val])
+            cursor = Corpus.get_articles_with_layers(
+                collection=corpus,
+                layer_names=[DeduplicateJob.layer_name],
+                match_clause=DeduplicateJob._get_mongo_filter(task),
+                project_clause={"minhash.signature": 1},
+                sort_clause={"_id": 1},
+            )
 
-                    layer_data[f]["ud_lemmas"].append(" ".join(sent_lemmas))
+            for article in cursor:
+                doc: str = f"{corpus}/{article['_id']}"
+                packed: Optional[bytes] = (article.get("minhash") or {}).get(
+                    "signature"
+                )
 
-                    # We don't need to have a separator for the postags as there is always one
-                    # pos tag (which is character) per word
-                    layer_data[f]["ud_postags"].append("".join(sent_postags))
-                    layer_data[f]["ud_features"].append(" ".join(sent_features))
+                if packed is None:
+                    # Empty texts have no signatures and no duplicates
+                    cluster, found = doc, 0
+                else:
+                    cluster, found = index.add(
+                        doc, unpack_signature(packed), task.threshold
+                    )
 
-            layers.append(
-                # layer will have a processed version of both fields, title and text
-                pymongo.ReplaceOne(
-                    {"_id": layer_id},
-                    layer_data,
-                    upsert=True,
+                updates.append(
+                    pymongo.UpdateOne(
+                        {"_id": article["_id"]},
+                        {
+                            "$set": {
+                                "dedup": {
+                                    "cluster": cluster,
+                                    "duplicate": cluster != doc,
+                                    "near_duplicates": found,
+                                }
+                            },
+                            "$addToSet": {"processing_status": "dedup"},
+                            # Not updated_at, clustering alone doesn't call for the
+                            # reexport of the document
+                            "$currentDate": {"dedup_at": True},
+                        },
+                    )
                 )
-            )
 
-            # Collecting the update operations for the corpora collections
-            layer_refs[corpus].append(
-                pymongo.UpdateOne(
-                    {"_id": id_},
-                    {
-                        "$set": {f"layers.{layer_name}": layer_id},
-                        "$addToSet": {"processing_status": layer_name},
-                    },
-                    upsert=True,
-                )
-            )
+                processed += 1
+                duplicates += cluster != doc
 
-            if len(layers) == BULK_UPDATE_SIZE:
-                # Time to flush it to the db
-                bulk_update(layers, layer_refs)
+                if len(updates) == BULK_UPDATE_SIZE:
+                    bulk_update()
 
-                layers = []
-                layer_refs = defaultdict(list)
+                if total_docs:
+                    task.set_progress(processed * 100 // total_docs, step=1)
 
-            task.set_progress((i + 1) * 100 // total_docs, step=1)
+            cursor.close()
 
-        # Leftovers
-        bulk_update(layers, layer_refs)
+            # Leftovers
+            bulk_update()
 
+        index.close()
 
-class BuildFreqVocabJob(BaseCorpusTask):
-    _filters = {
-        "short": _filter_short,
-        "rus_gcld": _filter_rus_gcld,
-    }
+        task.log(
+            logging.INFO,
+            f"Clustered {processed} docs, {duplicates} of them are near-duplicates",
+        )
 
-    @staticmethod
-    def apply_filter(job, task, article: Dict) -> bool:
-        # Separate implementation as different tasks might have different filters
-        for filt in task.filtering:
-            if not BuildFreqVocabJob._filters[filt](article):
-                return False
 
-        return True
+class ConvertUDPipedLayersJob(BaseCorpusTask):
+    """
+    Convert udpiped layers into the compact binary encoding (or back to the strings).
+    Lemmas are replaced with the ids from the shared vocabulary, postags and features
+    are packed into the byte arrays, see ud_converter.BINARY_ENCODING
+    """
+
+    layer_name: str = TagWithUDPipeJob.layer_name
 
     @staticmethod
-    def _get_mongo_filter(task) -> dict:
-        return {"processing_status": {"$in": ["udpipe_tagged"]}}
+    def _get_layer_filter(task, corpus: str) -> dict:
+        clause: Dict = {
+            "corpus": corpus,
+            "layer_type": ConvertUDPipedLayersJob.layer_name,
+        }
+
+        if task.encoding == "binary":
+            clause["encoding"] = {"$ne": BINARY_ENCODING}
+        else:
+            clause["encoding"] = BINARY_ENCODING
+
+        return clause
 
     @staticmethod
     def get_total_count(db, job, task) -> int:
         total = 0
         for corpus in task.corpora:
-            total += db[corpus].count_documents(
-                BuildFreqVocabJob._get_mongo_filter(task)
+            total += db.layers.count_documents(
+                ConvertUDPipedLayersJob._get_layer_filter(task, corpus)
             )
 
         return total
 
     @staticmethod
-    def get_iter(db, job, task):
-        for corpus in task.corpora:
-            for article in db[corpus].find(BuildFreqVocabJob._get_mongo_filter(task)):
-                yield corpus, article
+    def convert_range(
+        task, corpus: str, lower: Optional[str], upper: Optional[str]
+    ) -> Dict:
+        """
+        Convert the udpiped layers in the range of ids. Runs in the worker process of the pool
+        :param task: task instance
+        :param corpus: corpus name
+        :param lower: lower bound of layer ids (inclusive) or None
+        :param upper: upper bound of layer ids (exclusive) or None
+        :return: stats of the processed range
+        """
+        BULK_UPDATE_SIZE = 100  # how many layers to replace at once
 
-    @staticmethod
-    def execute(job, task):
         from .mongodb import get_db
 
+        # Connection of the parent process cannot be reused after the fork
         db = get_db()
+        vocabulary: LemmaVocabulary = LemmaVocabulary(db)
+
+        stats: Dict = {
+            "processed_docs": 0,
+            "malformed_layers": 0,
+            "size_before": 0,
+            "size_after": 0,
+        }
+        layers: List[pymongo.ReplaceOne] = []
 
-        total_docs: int = BuildFreqVocabJob.get_total_count(db, job, task)
-        processed_articles: int = 0
+        def bulk_update() -> None:
+            try:
+                if layers:
+                    db.layers.bulk_write(layers)
+            except (pymongo.errors.WriteError, pymongo.errors.OperationFailure) as e:
+                task.log(logging.WARNING, f"Cannot store udpiped layers: {e}")
 
-        count_by_pos = defaultdict(Counter)
-        document_frequency = defaultdict(Counter)
+            report_pool_progress(len(layers))
+            layers.clear()
 
-        for i, (corpus, article) in enumerate(
-            BuildFreqVocabJob.get_iter(db, job, task)
-        ):
-            if BuildFreqVocabJob.apply_filter(job, task, article):
-                processed_articles += 1
-                lemmas_in_doc: set = set()
+        cursor = db.layers.find(
+            ConvertUDPipedLayersJob.merge_mongo_filters(
+                ConvertUDPipedLayersJob._get_layer_filter(task, corpus),
+                Corpus.get_id_range_clause(lower, upper),
+            )
+        )
+
+        for layer in cursor:
+            size_before: int = len(bson.encode(layer))
 
+            try:
                 for f in ["title", "text"]:
-                    if "nlp" not in article:
-                        task.log(
-                            logging.WARNING,
-                            f"Cannot find field 'nlp' in the document {article['_id']}",
-                        )
+                    if not layer.get(f):
                         continue
 
-                    if f not in article["nlp"]:
-                        task.log(
-                            logging.WARNING,
-                            f"Cannot find field {f} in the document {article['_id']}",
-                        )
-                        continue
+                    if task.encoding == "binary":
+                        layer[f] = {
+                            k: bson.Binary(v)
+                            for k, v in encode_binary(layer[f], vocabulary).items()
+                        }
+                    else:
+                        layer[f] = decode_binary(layer[f], vocabulary)
+            except MalformedLayerError as e:
+                # Layer stays in the string encoding, the rest are converted
+                stats["malformed_layers"] += 1
+                task.log(
+                    logging.WARNING,
+                    f"Skipping malformed udpiped layer {layer['_id']}: {e}",
+                )
+                report_pool_progress(1)
+                continue
 
-                    if "ud_lemmas" not in article["nlp"][f]:
-                        task.log(
-                            logging.WARNING,
-                            f"Cannot find lemmatized version of field {f} in the document {article['_id']}",
-                        )
-                        continue
-                    if "ud_postags" not in article["nlp"][f]:
-                        task.log(
-                            logging.WARNING,
-                            f"Cannot find udpipe postags of field {f} in the document {article['_id']}",
-                        )
-                        continue
+            stats["size_before"] += size_before
 
-                    decompressed_result = decompress(
-                        ud_lemmas=article["nlp"][f]["ud_lemmas"],
-                        ud_postags=article["nlp"][f]["ud_postags"],
-                    )
+            if task.encoding == "binary":
+                layer["encoding"] = BINARY_ENCODING
+            else:
+                layer.pop("encoding", None)
 
-                    for s in decompressed_result:
-                        for w in s:
-                            if w["ud_lemmas"]:
-                                lemmas_in_doc.add((w["ud_postags"], w["ud_lemmas"]))
-                                count_by_pos[w["ud_postags"]].update([w["ud_lemmas"]])
+            stats["size_after"] += len(bson.encode(layer))
+            stats["processed_docs"] += 1
 
-                for pos, lemma in lemmas_in_doc:
-                    document_frequency[pos].update([lemma])
+            layers.append(pymongo.ReplaceOne({"_id": layer["_id"]}, layer))
 
-            task.set_progress((i + 1) * 100 // total_docs, step=1)
+            if len(layers) == BULK_UPDATE_SIZE:
+                bulk_update()
 
-        total_lemmas_by_pos = defaultdict(int)
-        total_lemmas: int = 0
+        cursor.close()
 
-        for pos, counts in count_by_pos.items():
-            total_lemmas_by_pos[pos] += sum(counts.values())
-            total_lemmas += sum(counts.values())
+        # Leftovers
+        bulk_update()
 
-        filename: pathlib.Path = BuildFreqVocabJob.generate_filename(job, task)
-        fp: TextIO = BuildFreqVocabJob.any_open(filename)
+        return stats
 
-        w = csv.DictWriter(
-            fp,
-            fieldnames=[
-                "lemma",
-                "pos",
-                "count",
-                "doc_count",
-                "freq_by_pos",
-                "freq_in_corpus",
-                "doc_frequency",
-            ],
+    @staticmethod
+    def execute(job, task):
+        from .mongodb import get_db
+
+        db = get_db()
+        LemmaVocabulary(db).ensure_indexes()
+
+        total_docs: int = ConvertUDPipedLayersJob.get_total_count(db, job, task)
+        workers: int = max(task.workers, 1)
+
+        ranges: List[Tuple] = []
+        for corpus in task.corpora:
+            for lower, upper in Corpus.get_id_ranges(
+                collection="layers",
+                num_ranges=workers * 4 if workers > 1 else 1,
+                match_clause=ConvertUDPipedLayersJob._get_layer_filter(task, corpus),
+            ):
+                ranges.append((task, corpus, lower, upper))
+
+        task.log(
+            logging.INFO,
+            f"About to convert {total_docs} udpiped layers to {task.encoding} in {len(ranges)} ranges using {workers} workers",
         )
-        w.writeheader()
 
-        for pos, counts in count_by_pos.items():
-            for lemma, count in counts.most_common():
-                w.writerow(
-                    {
-                        "lemma": lemma,
-                        "pos": pos,
-                        "count": count,
-                        "doc_count": document_frequency[pos][lemma],
-                        "freq_by_pos": count / total_lemmas_by_pos[pos],
-                        "freq_in_corpus": count / total_lemmas,
-                        "doc_frequency": document_frequency[pos][lemma]
-                        / processed_articles,
-                    }
-                )
+        results: List[Dict] = ConvertUDPipedLayersJob.run_in_pool(
+            task,
+            ConvertUDPipedLayersJob.convert_range,
+            ranges,
+            workers=workers,
+            total_docs=total_docs,
+        )
 
-        fp.close()
+        size_before: int = sum(r["size_before"] for r in results)
+        size_after: int = sum(r["size_after"] for r in results)
 
         task.log(
             logging.INFO,
-            f"Saved information on {total_lemmas} occurences from {processed_articles} filtered out of {total_docs} into the {filename}",
+            f"Converted {sum(r['processed_docs'] for r in results)} layers, "
+            + f"size of the documents went from {size_before} to {size_after} bytes",
         )
 
+        malformed_layers: int = sum(r["malformed_layers"] for r in results)
+        if malformed_layers:
+            task.log(
+                logging.WARNING,
+                f"Skipped {malformed_layers} malformed layers, they are left as they were",
+            )
+
+
+class BuildNgramsJob(BaseCorpusTask):
+    """
+    Count n-grams of the word forms or lemmas. Counting is sharded by the ranges of
+    ids across the pool of workers, which spill the sorted counts to the disk. Merged
+    counts come out sorted, so they are written as is into the compressed table with
+    the sparse offset index, that can be queried by prefix with ngrams.NgramTable
+    """
+
+    _filters = {
+        "short": _filter_short,
+        "rus_gcld": _filter_rus_gcld,
+        "dedup": _filter_dedup,
+    }
+
+    # Optional Mongo-side predicates of the filters above
+    _mongo_filters = {
+        "short": _mongo_filter_short,
+        "rus_gcld": _mongo_filter_rus_gcld,
+        "dedup": _mongo_filter_dedup,
+    }
+
+    _units_to_layer = {
+        "forms": "tokenized",
+        "lemmas": "lemmatized",
+    }
+
+    @staticmethod
+    def apply_filter(task, article: Dict) -> bool:
+        for filt in task.filtering:
+            if not BuildNgramsJob._filters[filt](article):
+                return False
+
+        return True
 
-class ProcessWithNlpUKJob(BaseCorpusTask):
     @staticmethod
     def _get_mongo_filter(task) -> dict:
-        if task.force:
-            return {}  # {"_id": "44ca9029164a35c86a70469082770d9e8aa065b0"}
-        else:
-            # return {"processing_status": {"$nin": ["nlp_uk"]}, "_id": "44ca9029164a35c86a70469082770d9e8aa065b0"}
-            return {"processing_status": {"$nin": ["nlp_uk"]}}
+        return BuildNgramsJob.merge_mongo_filters(
+            {"processing_status": {"$in": ["nlp_uk"]}},
+            BuildNgramsJob.get_filtering_clause(BuildNgramsJob._mongo_filters, task),
+        )
 
     @staticmethod
     def get_total_count(db, job, task) -> int:
         total = 0
         for corpus in task.corpora:
-            total += db[corpus].count_documents(
-                ProcessWithNlpUKJob._get_mongo_filter(task)
-            )
+            total += db[corpus].count_documents(BuildNgramsJob._get_mongo_filter(task))
 
         return total
 
     @staticmethod
-    def get_iter(db, job, task):
-        for corpus in task.corpora:
-            cursor = db[corpus].find(
-                ProcessWithNlpUKJob._get_mongo_filter(task),
-                {"title": 1, "text": 1},
-                no_cursor_timeout=True,
-            )
-            for article in cursor:
-                yield corpus, article
-            cursor.close()
-
-    @staticmethod
-    def remove_spaces(tokenized: List[List[str]]) -> List[List[str]]:
-        # Temproray solution until char modifiers tokenization will be fixed in LT
-        return [
-            [w for w in s if w.strip().strip(chr(65039) + "\u200b")] for s in tokenized
-        ]
-
-    @staticmethod
-    def execute(job, task):
-        assert settings.NLP_UK_BASE_URL, "You must set NLP_UK_BASE_URL setting to begin"
+    def count_range(
+        task,
+        corpus: str,
+        lower: Optional[str],
+        upper: Optional[str],
+        tmp_dir: pathlib.Path,
+    ) -> Dict:
+        """
+        Count the n-grams of the documents in the range of ids of the corpus. Runs in
+        the worker process of the pool
+        :param task: task instance
+        :param corpus: corpus name
+        :param lower: lower bound of ids (inclusive) or None
+        :param upper: upper bound of ids (exclusive) or None
+        :param tmp_dir: directory for the spilled counts
+        :return: run files with the partial counts and stats of the range
+        """
+        PROGRESS_REPORT_SIZE = 100  # how often to report the progress to the parent
 
-        client: NlpUkClient = NlpUkClient(base_url=settings.NLP_UK_BASE_URL)
         from .mongodb import get_db
 
+        # Connection of the parent process cannot be reused after the fork
         db = get_db()
+        layer_name: str = BuildNgramsJob._units_to_layer[task.units]
 
-        total_docs = ProcessWithNlpUKJob.get_total_count(db, job, task)
-        # TODO: this probably needs to be corrected according to the size of the texts
-        MAX_BATCH_SIZE: int = 500
+        project_clause: Dict = {layer_name: 1, "langid": 1, "dedup": 1}
+        if task.filtering:
+            # Python implementations of the filters look at the texts
+            project_clause.update({"title": 1, "text": 1})
 
-        # First we iterate over the batches of the documents found.
-        # Batches has size of 500 documents, and each document has title and text fields that
-        # has to be processed, which makes 1000 texts to be sent to the nlp_uk_api
-        for i, chunk_of_docs in enumerate(
-            batch_iterator(ProcessWithNlpUKJob.get_iter(db, job, task), MAX_BATCH_SIZE)
-        ):
-            texts: List[str] = []
-            ids: List[Tuple[str, str]] = []
-
-            for corpus, doc in chunk_of_docs:
-                # Stacking up all the titles and texts of the documents
-                texts += [
-                    md_to_text2(doc.get("title", "")),
-                    md_to_text2(doc.get("text", "")),
-                ]
-                # and preserving their corpus/id identifiers to use later
-                ids.append((corpus, doc["_id"]))
+        # Each worker takes its share of the memory budget
+        counter: SpillingCounter = SpillingCounter(
+            memory_limit=task.memory_limit * 1024 * 1024 // max(task.workers, 1),
+            tmp_dir=tmp_dir,
+        )
+        stats: Dict = {"processed_articles": 0, "total_ngrams": 0}
+        unreported: int = 0
+
+        cursor = Corpus.get_articles_with_layers(
+            collection=corpus,
+            layer_names=[layer_name],
+            match_clause=BuildNgramsJob.merge_mongo_filters(
+                BuildNgramsJob._get_mongo_filter(task),
+                Corpus.get_id_range_clause(lower, upper),
+            ),
+            project_clause=project_clause,
+            database=db,
+        )
 
-            # Sending texts for the processing
-            try:
-                batch = client.batch(texts)
-            except NlpUkApiException as e:
-                task.log(
-                    logging.ERROR,
-                    f"Cannot process some of texts below: {ids}, error was {e}, skipping this batch",
-                )
+        for article in cursor:
+            unreported += 1
+            if unreported == PROGRESS_REPORT_SIZE:
+                report_pool_progress(unreported)
+                unreported = 0
+
+            if not BuildNgramsJob.apply_filter(task, article):
                 continue
 
-            # Here we will collect the list of layers to upsert into the layers collection
-            layers: List[pymongo.ReplaceOne] = []
+            layer: Dict = article.get(layer_name) or {}
+            doc_counts: Counter = Counter()
+
+            for f in ["title", "text"]:
+                # Same filtering of the punctuation as in the tokens_wo_punct export
+                sentences: List[List[str]] = [
+                    [
+                        w
+                        for w in sentence
+                        if w and (task.keep_punctuation or word_pattern.search(w))
+                    ]
+                    for sentence in layer.get(f, [])
+                ]
 
-            # This is the list of update operations, to connect original documents,
-            # identified by corpus/id pair to the respective layers in bulk
-            layer_refs: Dict[str, List[pymongo.UpdateOne]] = defaultdict(list)
-            ids_: List[str] = []
+                doc_counts.update(get_ngrams(sentences, task.n))
 
-            # Batch 2 here means, that we are grouping back the results of processing
-            # of title and texts, as they'll live in the same layer document
-            for (corpus, id_), (title, text) in zip(ids, batch_iterator(batch, 2)):
-                ids_.append(f"{corpus}.{id_}")
-                update_clause: Dict = {}
-
-                # Remapping the fieldnames in the API response to something more suitable
-                for field_name, layer_name in {
-                    "cleanText": "cleansed",
-                    "tokens": "tokenized",
-                    "lemmas": "lemmatized",
-                    "sentences": "sentenced",
-                }.items():
-                    # ids for the layers are being made from hashing of the corpus/document id and
-                    # the layer name
-                    layer_id: str = ProcessWithNlpUKJob.get_layer_id(
-                        corpus, id_, layer_name
-                    )
-                    update_clause[f"layers.{layer_name}"] = layer_id
+            for ngram, count in doc_counts.items():
+                counter.add((ngram,), count)
 
-                    if field_name == "tokens":
-                        title[field_name] = ProcessWithNlpUKJob.remove_spaces(
-                            title[field_name]
-                        )
-                        text[field_name] = ProcessWithNlpUKJob.remove_spaces(
-                            text[field_name]
-                        )
+            stats["total_ngrams"] += sum(doc_counts.values())
+            stats["processed_articles"] += 1
 
-                    layers.append(
-                        # layer will have a processed version of both fields, title and text
-                        pymongo.ReplaceOne(
-                            {"_id": layer_id},
-                            {
-                                "corpus": corpus,
-                                "parent_id": id_,
-                                "layer_type": layer_name,
-                                "title": title[field_name],
-                                "text": text[field_name],
-                            },
-                            upsert=True,
-                        )
-                    )
+        cursor.close()
+        report_pool_progress(unreported)
 
-                # Collecting the update operations
-                layer_refs[corpus].append(
-                    pymongo.UpdateOne(
-                        {"_id": id_},
-                        {
-                            "$set": update_clause,
-                            "$addToSet": {"processing_status": "nlp_uk"},
-                        },
-                        upsert=True,
-                    )
-                )
+        return dict(stats, runs=counter.pop_runs())
 
-            # Bulk upsert!
-            try:
-                db.layers.bulk_write(layers)
-            except (pymongo.errors.WriteError, pymongo.errors.OperationFailure) as e:
-                task.log(logging.WARNING, f"Cannot add layers: {e}, batch ids looks like {ids_}")
+    @staticmethod
+    def execute(job, task):
+        from .mongodb import get_db
 
-            for corpus, updates in layer_refs.items():
-                try:
-                    db[corpus].bulk_write(updates)
-                except (
-                    pymongo.errors.WriteError,
-                    pymongo.errors.OperationFailure,
-                ) as e:
-                    task.log(
-                        logging.WARNING,
-                        f"Cannot reference layers from the corpus document: {e}",
-                    )
+        db = get_db()
+
+        total_docs: int = BuildNgramsJob.get_total_count(db, job, task)
+        workers: int = max(task.workers, 1)
+
+        with tempfile.TemporaryDirectory(
+            prefix="ngrams-", dir=settings.CORPUS_SPILL_PATH
+        ) as tmp_dir:
+            # Every corpus is split into several ranges per worker to balance the load
+            ranges: List[Tuple] = []
+            for corpus in task.corpora:
+                for lower, upper in Corpus.get_id_ranges(
+                    collection=corpus,
+                    num_ranges=workers * 4 if workers > 1 else 1,
+                    match_clause=BuildNgramsJob._get_mongo_filter(task),
+                ):
+                    ranges.append((task, corpus, lower, upper, pathlib.Path(tmp_dir)))
+
+            task.log(
+                logging.INFO,
+                f"About to count {task.n}-grams of {task.units} of {total_docs} docs in {len(ranges)} ranges using {workers} workers",
+            )
+
+            results: List[Dict] = BuildNgramsJob.run_in_pool(
+                task,
+                BuildNgramsJob.count_range,
+                ranges,
+                workers=workers,
+                total_docs=total_docs,
+            )
+
+            runs: List[pathlib.Path] = [run for r in results for run in r["runs"]]
+            total_ngrams: int = sum(r["total_ngrams"] for r in results)
+            processed_articles: int = sum(r["processed_articles"] for r in results)
+
+            filename: pathlib.Path = BuildNgramsJob.generate_filename(
+                job,
+                task,
+                file_prefix=f"ubertext.ngrams_{task.n}_{task.units}"
+                + ("" if task.keep_punctuation else "_wo_punct"),
+            )
+            task.log(
+                logging.INFO,
+                f"Merging {len(runs)} runs of the spilled counts into the {filename}",
+            )
 
-            task.set_progress((i * MAX_BATCH_SIZE + 1) * 100 // total_docs, step=1)
+            fp: SegmentedWriter = SegmentedWriter(
+                filename,
+                task.file_compression,
+                segment_size=NGRAM_SEGMENT_SIZE,
+                level=task.compression_level,
+                threads=task.compression_threads,
+                index_interval=NGRAM_INDEX_INTERVAL,
+            )
+            distinct_ngrams: int = 0
+            pruned: int = 0
+
+            with open(get_index_filename(filename), "w", encoding="utf-8") as index_fp:
+                # Counts are merged in the order of n-grams, so they are written as is
+                for (ngram,), (count,) in merge_runs(runs):
+                    if count < task.min_count:
+                        pruned += 1
+                        continue
+
+                    fp.mark({"ngram": ngram})
+                    fp.write(f"{ngram}\t{count}\n")
+                    distinct_ngrams += 1
+
+                    if fp.segment_is_full:
+                        fp.flush_segment()
+
+                        for entry in fp.pop_index():
+                            index_fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+                fp.close()
+
+                for entry in fp.pop_index():
+                    index_fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        with open(
+            get_manifest_filename(filename), "w", encoding="utf-8"
+        ) as manifest_fp:
+            json.dump(
+                {
+                    "n": task.n,
+                    "units": task.units,
+                    "keep_punctuation": task.keep_punctuation,
+                    "corpora": sorted(task.corpora),
+                    "filtering": sorted(task.filtering),
+                    "min_count": task.min_count,
+                    "compression": task.file_compression,
+                    "processed_articles": processed_articles,
+                    "total_ngrams": total_ngrams,
+                    "distinct_ngrams": distinct_ngrams,
+                    "pruned_ngrams": pruned,
+                    "files": [
+                        BuildNgramsJob.describe_file(filename),
+                        BuildNgramsJob.describe_file(get_index_filename(filename)),
+                    ],
+                },
+                manifest_fp,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+        task.log(
+            logging.INFO,
+            f"Saved {distinct_ngrams} distinct {task.n}-grams out of {total_ngrams} from {processed_articles} docs into the {filename}, "
+            + f"skipped {pruned} ones with less than {task.min_count} occurences",
+        )
@@ -0,0 +1,102 @@
+import json
+import pathlib
+
+from django.core.management.base import BaseCommand, CommandError
+
+from corpus import ud_benchmark
+
+
+DEFAULT_BASELINE: pathlib.Path = (
+    pathlib.Path(__file__).resolve().parents[2]
+    / "benchmarks"
+    / "ud_converter_baseline.json"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the codec of the udpiped layers (ud_converter) on the synthetic "
+        "sentences and compare throughput, allocations and encoded size with the "
+        "stored baseline. Exits with an error when any of them regressed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sentences",
+            type=int,
+            default=ud_benchmark.DEFAULT_NUM_SENTENCES,
+            help="Number of the synthetic sentences",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=ud_benchmark.DEFAULT_REPEAT,
+            help="Number of the runs of each benchmark, the best one is taken",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=ud_benchmark.DEFAULT_SEED,
+            help="Seed of the generator of the sentences",
+        )
+        parser.add_argument(
+            "--baseline",
+            type=pathlib.Path,
+            default=DEFAULT_BASELINE,
+            help="JSON file with the baseline results",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=ud_benchmark.DEFAULT_THRESHOLD,
+            help="Allowed relative degradation of any metric",
+        )
+        parser.add_argument(
+            "--output",
+            type=pathlib.Path,
+            help="Write the results as JSON into the file",
+        )
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Store the results as the new baseline instead of comparing with it",
+        )
+
+    def handle(self, *args, **options):
+        results = ud_benchmark.run(
+            num_sentences=options["sentences"],
+            repeat=options["repeat"],
+            seed=options["seed"],
+        )
+
+        for name, metrics in results["results"].items():
+            self.stdout.write(
+                f"{name:<24}"
+                + "  ".join(f"{metric}={value}" for metric, value in metrics.items())
+            )
+
+        if options["output"]:
+            options["output"].write_text(json.dumps(results, indent=2) + "\n")
+
+        if options["update_baseline"]:
+            options["baseline"].write_text(json.dumps(results, indent=2) + "\n")
+            self.stdout.write(
+                self.style.SUCCESS(f"Baseline is stored in {options['baseline']}")
+            )
+            return
+
+        if not options["baseline"].exists():
+            raise CommandError(
+                f"Baseline {options['baseline']} is missing, run with --update-baseline"
+            )
+
+        regressions = ud_benchmark.compare(
+            results,
+            json.loads(options["baseline"].read_text()),
+            threshold=options["threshold"],
+        )
+
+        if regressions:
+            raise CommandError("Regressions found:\n" + "\n".join(regressions))
+
+        self.stdout.write(self.style.SUCCESS("No regressions found"))
@@ -0,0 +1,75 @@
+import csv
+import pathlib
+
+from django.core.management.base import BaseCommand, CommandError
+
+from corpus.sketch import FrequencySketch, get_sketch_filename
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge the sketches of the approximate frequency vocabularies (i.e. of the "
+        "different corpora or runs) and write the merged vocabulary as CSV, with the "
+        "merged sketch stored alongside."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output", type=pathlib.Path, help="CSV file of the merged vocabulary"
+        )
+        parser.add_argument(
+            "sketches",
+            type=pathlib.Path,
+            nargs="+",
+            help="Sketches (.sketch files) to merge",
+        )
+        parser.add_argument(
+            "--min-count",
+            type=int,
+            default=1,
+            help="Skip lemmas with fewer occurences",
+        )
+
+    def handle(self, *args, **options):
+        sketch = None
+
+        for filename in options["sketches"]:
+            try:
+                partial = FrequencySketch.load(filename)
+
+                if sketch is None:
+                    sketch = partial
+                else:
+                    sketch.merge(partial)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot merge sketch {filename}: {e}")
+
+        with open(options["output"], "w", encoding="utf-8") as fp:
+            for line in sketch.get_header():
+                fp.write(f"# {line}\n")
+
+            w = csv.DictWriter(
+                fp,
+                fieldnames=[
+                    "lemma",
+                    "pos",
+                    "count",
+                    "doc_count",
+                    "freq_by_pos",
+                    "freq_in_corpus",
+                    "doc_frequency",
+                ],
+            )
+            w.writeheader()
+
+            for row in sketch.get_rows():
+                if row["count"] >= options["min_count"]:
+                    w.writerow(row)
+
+        sketch.save(get_sketch_filename(options["output"]))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Merged {len(options['sketches'])} sketches into {options['output']}"
+            )
+        )
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.6 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0013_alter_buildfreqvocabtask_filtering_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="workers",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                verbose_name="Number of worker processes, 1 to export serially",
+            ),
+        ),
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="shards_per_corpus",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                verbose_name="Number of shards (ranges of ids) to split each corpus into",
+            ),
+        ),
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="concatenate_shards",
+            field=models.BooleanField(
+                default=True,
+                verbose_name="Concatenate the shards into one file when the export is done",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.6 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0014_exportcorpustask_workers_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="incremental",
+            field=models.BooleanField(
+                default=False,
+                verbose_name="Export only texts added or reprocessed since the previous export with the same parameters",
+            ),
+        ),
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="exported_file",
+            field=models.CharField(blank=True, editable=False, max_length=512),
+        ),
+    ]
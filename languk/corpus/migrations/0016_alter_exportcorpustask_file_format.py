@@ -0,0 +1,25 @@
+# Generated by Django 6.0.6 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0015_exportcorpustask_incremental_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="exportcorpustask",
+            name="file_format",
+            field=models.CharField(
+                choices=[
+                    ("txt", "Text File"),
+                    ("jsonl", "JSONLines File"),
+                    ("parquet", "Parquet File (zstd-compressed columns)"),
+                ],
+                default="txt",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 6.0.6 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0016_alter_exportcorpustask_file_format"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="compression_level",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                null=True,
+                verbose_name="Compression level, leave empty for the default one",
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="compression_threads",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                verbose_name="Number of compression threads (for zstd and parallel compressions)",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="buildfreqvocabtask",
+            name="file_compression",
+            field=models.CharField(
+                choices=[
+                    ("none", "No compression"),
+                    ("bz2", "Bzip2"),
+                    ("lzma", "LZMA"),
+                    ("zstd", "Zstandard"),
+                    ("pbz2", "Bzip2, compressed in parallel blocks"),
+                    ("pxz", "LZMA, compressed in parallel blocks"),
+                    ("pgz", "Gzip, compressed in parallel blocks"),
+                ],
+                default="none",
+                max_length=5,
+            ),
+        ),
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="compression_level",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                null=True,
+                verbose_name="Compression level, leave empty for the default one",
+            ),
+        ),
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="compression_threads",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                verbose_name="Number of compression threads (for zstd and parallel compressions)",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="exportcorpustask",
+            name="file_compression",
+            field=models.CharField(
+                choices=[
+                    ("none", "No compression"),
+                    ("bz2", "Bzip2"),
+                    ("lzma", "LZMA"),
+                    ("zstd", "Zstandard"),
+                    ("pbz2", "Bzip2, compressed in parallel blocks"),
+                    ("pxz", "LZMA, compressed in parallel blocks"),
+                    ("pgz", "Gzip, compressed in parallel blocks"),
+                ],
+                default="none",
+                max_length=5,
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.6 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0018_detectlanguagetask"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="dry_run",
+            field=models.BooleanField(
+                default=False,
+                verbose_name="Only estimate the number of matching texts, without exporting them",
+            ),
+        ),
+        migrations.AddField(
+            model_name="exportcorpustask",
+            name="filter_expression",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text='I.e. date_of_publish >= 2020-01-01 and source in (12, 15) and not tags contains "реклама" and uk_rate >= 0.8 and length > 500 and has tokenized and words > 100',
+                verbose_name="Filter expression",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.6 on 2026-10-18 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0020_deduplicatetask_alter_filtering"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tagwithudpipetask",
+            name="workers",
+            field=models.PositiveSmallIntegerField(
+                default=1, verbose_name="Number of worker processes"
+            ),
+        ),
+    ]
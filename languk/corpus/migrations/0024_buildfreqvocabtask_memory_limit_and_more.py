@@ -0,0 +1,27 @@
+# Generated by Django 6.0.6 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0023_buildfreqvocabtask_workers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="memory_limit",
+            field=models.PositiveIntegerField(
+                default=1024,
+                verbose_name="Memory budget of the counters in megabytes, counts are spilled to the disk above it",
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="min_count",
+            field=models.PositiveIntegerField(
+                default=1, verbose_name="Skip lemmas with fewer occurences"
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.6 on 2026-10-18 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0024_buildfreqvocabtask_memory_limit_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="counting",
+            field=models.CharField(
+                choices=[
+                    ("exact", "Exact counts of all lemmas"),
+                    (
+                        "approximate",
+                        "Estimated counts of the most frequent lemmas in the fixed memory",
+                    ),
+                ],
+                default="exact",
+                max_length=11,
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="sketch_width",
+            field=models.PositiveIntegerField(
+                default=2097152,
+                verbose_name="Width of the count-min sketch for the approximate counting",
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="sketch_depth",
+            field=models.PositiveSmallIntegerField(
+                default=4,
+                verbose_name="Depth of the count-min sketch for the approximate counting",
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="top_k",
+            field=models.PositiveIntegerField(
+                default=200000,
+                verbose_name="Number of the most frequent lemmas of each pos for the approximate counting",
+            ),
+        ),
+    ]
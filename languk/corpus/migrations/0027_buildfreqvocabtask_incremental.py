@@ -0,0 +1,20 @@
+# Generated by Django 6.0.6 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0026_buildngramstask"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildfreqvocabtask",
+            name="incremental",
+            field=models.BooleanField(
+                default=False,
+                verbose_name="Count only texts tagged since the previous run and merge them into its stored counts",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.6 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0027_buildfreqvocabtask_incremental"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processwithnlpuktask",
+            name="pipelined",
+            field=models.BooleanField(
+                default=False,
+                verbose_name="Overlap reading, NLP requests and writing of the batches",
+            ),
+        ),
+        migrations.AddField(
+            model_name="processwithnlpuktask",
+            name="inflight_requests",
+            field=models.PositiveSmallIntegerField(
+                default=4,
+                verbose_name="Number of concurrent requests to the NLP-UK API in the pipelined mode",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.6 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0028_processwithnlpuktask_pipelined_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processwithnlpuktask",
+            name="batch_chars",
+            field=models.PositiveIntegerField(
+                default=1000000,
+                verbose_name="Initial number of characters per request to the NLP-UK API, adapted to the latency and errors",
+            ),
+        ),
+        migrations.AddField(
+            model_name="processwithnlpuktask",
+            name="target_latency",
+            field=models.PositiveSmallIntegerField(
+                default=30,
+                verbose_name="Requests to the NLP-UK API slower than that (in seconds) decrease the batch size",
+            ),
+        ),
+    ]
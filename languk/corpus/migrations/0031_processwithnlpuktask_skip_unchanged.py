@@ -0,0 +1,20 @@
+# Generated by Django 6.0.6 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0030_processwithnlpuktask_max_retries_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processwithnlpuktask",
+            name="skip_unchanged",
+            field=models.BooleanField(
+                default=False,
+                verbose_name="Check all texts, but skip the ones processed from the same title and text by the same NLP-UK version",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.6 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("corpus", "0031_processwithnlpuktask_skip_unchanged"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="deduplicatetask",
+            name="force",
+            field=models.BooleanField(
+                default=False,
+                verbose_name="Cluster all texts of the selected corpora from scratch",
+            ),
+        ),
+    ]
@@ -0,0 +1,228 @@
+import random
+import sqlite3
+import struct
+import pathlib
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+
+# Number of the hash functions in the signature
+NUM_PERM: int = 128
+
+# Signature is split into the bands, documents with at least one equal band are the
+# candidates for the near-duplicates. 32 bands of 4 rows catch the pairs with the
+# Jaccard similarity above ~0.6 almost surely, candidates are then verified by signatures
+NUM_BANDS: int = 32
+
+# Number of the words in a shingle
+SHINGLE_SIZE: int = 5
+
+_MERSENNE_PRIME: int = (1 << 61) - 1
+_MAX_HASH: int = (1 << 32) - 1
+_SEED: int = 42
+
+_rnd = random.Random(_SEED)
+_PERMUTATIONS: List[Tuple[int, int]] = [
+    (_rnd.randint(1, _MERSENNE_PRIME - 1), _rnd.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(NUM_PERM)
+]
+
+
+def get_shingles(tokens: Iterable[str], size: int = SHINGLE_SIZE) -> List[int]:
+    """
+    Hash the overlapping word n-grams of the text. Hashes are stable between the
+    runs, so the signatures can be stored and compared with the new documents later
+    :param tokens: words of the text, punctuation is expected to be removed
+    :param size: number of the words in a shingle
+    :return: list of 32-bit hashes of the shingles
+    """
+    words: List[str] = [w.lower() for w in tokens]
+
+    if len(words) < size:
+        return [zlib.crc32(" ".join(words).encode("utf-8"))] if words else []
+
+    return [
+        zlib.crc32(" ".join(words[i : i + size]).encode("utf-8"))
+        for i in range(len(words) - size + 1)
+    ]
+
+
+def get_signature(shingles: Iterable[int]) -> Optional[List[int]]:
+    """
+    Calculate MinHash signature of the set of shingles
+    :param shingles: hashes of the shingles
+    :return: list of NUM_PERM minimal hash values or None for the empty document
+    """
+    hashes: List[int] = list(set(shingles))
+
+    if not hashes:
+        return None
+
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def pack_signature(signature: List[int]) -> bytes:
+    return struct.pack(f"<{NUM_PERM}I", *signature)
+
+
+def unpack_signature(packed: bytes) -> List[int]:
+    return list(struct.unpack(f"<{NUM_PERM}I", packed))
+
+
+def estimate_similarity(left: List[int], right: List[int]) -> float:
+    """
+    Estimate Jaccard similarity of two documents by their signatures
+    """
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+def get_bands(signature: List[int]) -> List[bytes]:
+    rows: int = NUM_PERM // NUM_BANDS
+
+    return [
+        struct.pack(f"<{rows}I", *signature[band * rows : (band + 1) * rows])
+        for band in range(NUM_BANDS)
+    ]
+
+
+class LSHIndex:
+    """
+    Locality-sensitive hashing index of the MinHash signatures, stored in sqlite, so
+    it survives between the runs and is extended incrementally with the new documents.
+    Each document is assigned to the cluster of its first near-duplicate in the index,
+    or starts a new cluster, named after itself
+    """
+
+    def __init__(self, filename: pathlib.Path) -> None:
+        self.conn: sqlite3.Connection = sqlite3.connect(str(filename))
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+            CREATE TABLE IF NOT EXISTS docs (
+                doc TEXT PRIMARY KEY, cluster TEXT NOT NULL, signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL, bucket BLOB NOT NULL, doc TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+            """
+        )
+
+        for key, value in [
+            ("num_perm", NUM_PERM),
+            ("num_bands", NUM_BANDS),
+            ("shingle_size", SHINGLE_SIZE),
+            ("seed", _SEED),
+        ]:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)", (key, value)
+            )
+            (stored,) = self.conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+
+            if stored != value:
+                raise ValueError(
+                    f"Index {filename} was built with {key}={stored}, rebuild it from scratch"
+                )
+
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def get_cluster(self, doc: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT cluster FROM docs WHERE doc = ?", (doc,)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def query(
+        self, signature: List[int], threshold: float
+    ) -> List[Tuple[str, str, float]]:
+        """
+        Find near-duplicates of the document in the index
+        :param signature: signature of the document
+        :param threshold: minimal estimated Jaccard similarity
+        :return: list of (doc, cluster, similarity) of the matching documents,
+            the most similar first
+        """
+        candidates: set = set()
+
+        for band, bucket in enumerate(get_bands(signature)):
+            candidates.update(
+                doc
+                for (doc,) in self.conn.execute(
+                    "SELECT doc FROM bands WHERE band = ? AND bucket = ?",
+                    (band, bucket),
+                )
+            )
+
+        matches: List[Tuple[str, str, float]] = []
+        for doc in candidates:
+            cluster, packed = self.conn.execute(
+                "SELECT cluster, signature FROM docs WHERE doc = ?", (doc,)
+            ).fetchone()
+            similarity: float = estimate_similarity(signature, unpack_signature(packed))
+
+            if similarity >= threshold:
+                matches.append((doc, cluster, similarity))
+
+        return sorted(matches, key=lambda m: (-m[2], m[0]))
+
+    def add(self, doc: str, signature: List[int], threshold: float) -> Tuple[str, int]:
+        """
+        Add the document to the index and assign it to the cluster. Documents that are
+        already in the index keep their cluster
+        :param doc: id of the document
+        :param signature: signature of the document
+        :param threshold: minimal estimated Jaccard similarity of the near-duplicates
+        :return: cluster id and the number of the near-duplicates found
+        """
+        cluster: Optional[str] = self.get_cluster(doc)
+        if cluster is not None:
+            return cluster, 0
+
+        matches: List[Tuple[str, str, float]] = self.query(signature, threshold)
+        cluster = matches[0][1] if matches else doc
+
+        self.conn.execute(
+            "INSERT INTO docs (doc, cluster, signature) VALUES (?, ?, ?)",
+            (doc, cluster, pack_signature(signature)),
+        )
+        self.conn.executemany(
+            "INSERT INTO bands (band, bucket, doc) VALUES (?, ?, ?)",
+            [(band, bucket, doc) for band, bucket in enumerate(get_bands(signature))],
+        )
+
+        return cluster, len(matches)
+
+    def remove_corpus(self, corpus: str) -> int:
+        """
+        Remove the documents of the corpus from the index, so they are added anew. Clusters
+        of the documents of the other corpora are kept as they are
+        :param corpus: name of the corpus
+        :return: number of the removed documents
+        """
+        prefix: str = f"{corpus}/"
+        # Not LIKE, as the names of the corpora might contain the wildcards
+        condition: str = "substr(doc, 1, ?) = ?"
+
+        self.conn.execute(f"DELETE FROM bands WHERE {condition}", (len(prefix), prefix))
+        removed: int = self.conn.execute(
+            f"DELETE FROM docs WHERE {condition}", (len(prefix), prefix)
+        ).rowcount
+        self.conn.commit()
+
+        return removed
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
@@ -9,6 +9,7 @@ from django.conf import settings
 from django_task.models import TaskRQ
 
 from .mongodb import db
+from .filter_dsl import compile_filter, FilterExpressionError
 from pymongo.cursor import Cursor as MongoCursor
 
 _CORPORA_CHOICES: Tuple[Tuple[str, str], ...] = (
@@ -24,6 +25,20 @@ _CORPORA_CHOICES: Tuple[Tuple[str, str], ...] = (
 _FILTERING_CHOICES: Tuple[Tuple[str, str], ...] = (
     ("rus_gcld", "Filter out texts where gcld says it's NOT ukrainian"),
     ("short", "Filter out texts, where title and body combined are too short"),
+    (
+        "dedup",
+        "Filter out near-duplicates of the other texts, found by DeduplicateTask",
+    ),
+)
+
+_COMPRESSION_CHOICES: Tuple[Tuple[str, str], ...] = (
+    ("none", "No compression"),
+    ("bz2", "Bzip2"),
+    ("lzma", "LZMA"),
+    ("zstd", "Zstandard"),
+    ("pbz2", "Bzip2, compressed in parallel blocks"),
+    ("pxz", "LZMA, compressed in parallel blocks"),
+    ("pgz", "Gzip, compressed in parallel blocks"),
 )
 
 
@@ -134,6 +149,8 @@ class Corpus:
         layer_names: List[str],
         match_clause: Optional[Dict] = None,
         project_clause: Optional[Dict] = None,
+        database=None,
+        sort_clause: Optional[Dict] = None,
     ) -> MongoCursor:
         """
         Get articles with layers.
@@ -141,9 +158,11 @@ class Corpus:
         :layer_names: List of layer names.
         :match_clause: Match clause.
         :project_clause: Project clause.
+        :database: Database to use instead of the default one (i.e. in the forked workers).
+        :sort_clause: Sort clause, applied before the lookups.
         :return: Cursor.
         """
-        coll = db[collection]
+        coll = (database or db)[collection]
 
         pipeline: List[Dict] = []
         if match_clause is not None:
@@ -153,6 +172,9 @@ class Corpus:
                 }
             )
 
+        if sort_clause is not None:
+            pipeline.append({"$sort": sort_clause})
+
         for layer_name in layer_names:
             pipeline.append(
                 {
@@ -181,6 +203,61 @@ class Corpus:
         cursor: MongoCursor = coll.aggregate(pipeline)
         return cursor
 
+    @staticmethod
+    def get_id_ranges(
+        collection: str,
+        num_ranges: int,
+        match_clause: Optional[Dict] = None,
+    ) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Split the collection into roughly equal ranges of _id.
+        :param collection: Collection name.
+        :param num_ranges: Desired number of ranges.
+        :param match_clause: Match clause.
+        :return: List of (lower bound inclusive, upper bound exclusive) pairs,
+            None means the range is open from that side.
+        """
+        if num_ranges <= 1:
+            return [(None, None)]
+
+        pipeline: List[Dict] = []
+        if match_clause:
+            pipeline.append({"$match": match_clause})
+
+        pipeline += [
+            {"$project": {"_id": 1}},
+            {"$bucketAuto": {"groupBy": "$_id", "buckets": num_ranges}},
+        ]
+
+        # Upper bounds of all buckets but the last one are exclusive, so they are
+        # used as the boundaries between the ranges. Outer ranges are left open
+        # to catch the documents that were added after the split.
+        boundaries: List[str] = [
+            bucket["_id"]["max"]
+            for bucket in db[collection].aggregate(pipeline, allowDiskUse=True)
+        ][:-1]
+
+        lower_bounds: List[Optional[str]] = [None] + boundaries
+        upper_bounds: List[Optional[str]] = boundaries + [None]
+
+        return list(zip(lower_bounds, upper_bounds))
+
+    @staticmethod
+    def get_id_range_clause(lower: Optional[str], upper: Optional[str]) -> Dict:
+        """
+        Get match clause for the range of _id.
+        :param lower: Lower bound (inclusive) or None.
+        :param upper: Upper bound (exclusive) or None.
+        :return: Match clause.
+        """
+        clause: Dict = {}
+        if lower is not None:
+            clause["$gte"] = lower
+        if upper is not None:
+            clause["$lt"] = upper
+
+        return {"_id": clause} if clause else {}
+
 
 class ExportCorpusTask(TaskRQ):
     """
@@ -188,13 +265,14 @@ class ExportCorpusTask(TaskRQ):
     """
 
     file_format = models.CharField(
-        max_length=5,
+        max_length=10,
         null=False,
         blank=False,
         default="txt",
         choices=(
             ("txt", "Text File"),
             ("jsonl", "JSONLines File"),
+            ("parquet", "Parquet File (zstd-compressed columns)"),
         ),
     )
 
@@ -203,11 +281,18 @@ class ExportCorpusTask(TaskRQ):
         null=False,
         blank=False,
         default="none",
-        choices=(
-            ("none", "No compression"),
-            ("bz2", "Bzip2"),
-            ("lzma", "LZMA"),
-        ),
+        choices=_COMPRESSION_CHOICES,
+    )
+
+    compression_level = models.PositiveSmallIntegerField(
+        "Compression level, leave empty for the default one",
+        null=True,
+        blank=True,
+    )
+
+    compression_threads = models.PositiveSmallIntegerField(
+        "Number of compression threads (for zstd and parallel compressions)",
+        default=1,
     )
 
     corpora = ChoiceArrayField(
@@ -245,6 +330,46 @@ class ExportCorpusTask(TaskRQ):
         ),
     )
 
+    workers = models.PositiveSmallIntegerField(
+        "Number of worker processes, 1 to export serially",
+        default=1,
+    )
+
+    shards_per_corpus = models.PositiveSmallIntegerField(
+        "Number of shards (ranges of ids) to split each corpus into",
+        default=1,
+    )
+
+    concatenate_shards = models.BooleanField(
+        "Concatenate the shards into one file when the export is done",
+        default=True,
+    )
+
+    incremental = models.BooleanField(
+        "Export only texts added or reprocessed since the previous export with the same parameters",
+        default=False,
+    )
+
+    exported_file = models.CharField(
+        max_length=512,
+        blank=True,
+        editable=False,
+    )
+
+    filter_expression = models.TextField(
+        "Filter expression",
+        blank=True,
+        default="",
+        help_text="I.e. date_of_publish >= 2020-01-01 and source in (12, 15) "
+        + 'and not tags contains "реклама" and uk_rate >= 0.8 and length > 500 '
+        + "and has tokenized and words > 100",
+    )
+
+    dry_run = models.BooleanField(
+        "Only estimate the number of matching texts, without exporting them",
+        default=False,
+    )
+
     TASK_QUEUE = settings.QUEUE_DEFAULT
 
     DEFAULT_VERBOSITY = 2
@@ -252,6 +377,14 @@ class ExportCorpusTask(TaskRQ):
     LOG_TO_FIELD = True
     LOG_TO_FILE = False
 
+    def clean(self):
+        super().clean()
+
+        try:
+            compile_filter(self.filter_expression)
+        except FilterExpressionError as e:
+            raise exceptions.ValidationError({"filter_expression": str(e)})
+
     @staticmethod
     def get_jobclass():
         """
@@ -282,6 +415,11 @@ class TagWithUDPipeTask(TaskRQ):
         default=False,
     )
 
+    workers = models.PositiveSmallIntegerField(
+        "Number of worker processes",
+        default=1,
+    )
+
     TASK_QUEUE = settings.QUEUE_DEFAULT
 
     DEFAULT_VERBOSITY = 2
@@ -337,12 +475,69 @@ class BuildFreqVocabTask(TaskRQ):
         null=False,
         blank=False,
         default="none",
+        choices=_COMPRESSION_CHOICES,
+    )
+
+    compression_level = models.PositiveSmallIntegerField(
+        "Compression level, leave empty for the default one",
+        null=True,
+        blank=True,
+    )
+
+    compression_threads = models.PositiveSmallIntegerField(
+        "Number of compression threads (for zstd and parallel compressions)",
+        default=1,
+    )
+
+    workers = models.PositiveSmallIntegerField(
+        "Number of worker processes",
+        default=1,
+    )
+
+    memory_limit = models.PositiveIntegerField(
+        "Memory budget of the counters in megabytes, counts are spilled to the disk above it",
+        default=1024,
+    )
+
+    min_count = models.PositiveIntegerField(
+        "Skip lemmas with fewer occurences",
+        default=1,
+    )
+
+    counting = models.CharField(
+        max_length=11,
+        null=False,
+        blank=False,
+        default="exact",
         choices=(
-            ("none", "No compression"),
-            ("bz2", "Bzip2"),
-            ("lzma", "LZMA"),
+            ("exact", "Exact counts of all lemmas"),
+            (
+                "approximate",
+                "Estimated counts of the most frequent lemmas in the fixed memory",
+            ),
         ),
     )
+
+    sketch_width = models.PositiveIntegerField(
+        "Width of the count-min sketch for the approximate counting",
+        default=2**21,
+    )
+
+    sketch_depth = models.PositiveSmallIntegerField(
+        "Depth of the count-min sketch for the approximate counting",
+        default=4,
+    )
+
+    top_k = models.PositiveIntegerField(
+        "Number of the most frequent lemmas of each pos for the approximate counting",
+        default=200000,
+    )
+
+    incremental = models.BooleanField(
+        "Count only texts tagged since the previous run and merge them into its stored counts",
+        default=False,
+    )
+
     TASK_QUEUE = settings.QUEUE_DEFAULT
 
     DEFAULT_VERBOSITY = 2
@@ -376,6 +571,36 @@ class ProcessWithNlpUKTask(TaskRQ):
         default=False,
     )
 
+    skip_unchanged = models.BooleanField(
+        "Check all texts, but skip the ones processed from the same title and text by the same NLP-UK version",
+        default=False,
+    )
+
+    pipelined = models.BooleanField(
+        "Overlap reading, NLP requests and writing of the batches",
+        default=False,
+    )
+
+    inflight_requests = models.PositiveSmallIntegerField(
+        "Number of concurrent requests to the NLP-UK API in the pipelined mode",
+        default=4,
+    )
+
+    batch_chars = models.PositiveIntegerField(
+        "Initial number of characters per request to the NLP-UK API, adapted to the latency and errors",
+        default=1000000,
+    )
+
+    target_latency = models.PositiveSmallIntegerField(
+        "Requests to the NLP-UK API slower than that (in seconds) decrease the batch size",
+        default=30,
+    )
+
+    max_retries = models.PositiveSmallIntegerField(
+        "Number of retries of the requests to the NLP-UK API, failed with transient errors",
+        default=3,
+    )
+
     TASK_QUEUE = settings.QUEUE_DEFAULT
 
     DEFAULT_VERBOSITY = 2
@@ -391,3 +616,293 @@ class ProcessWithNlpUKTask(TaskRQ):
         from .jobs import ProcessWithNlpUKJob
 
         return ProcessWithNlpUKJob
+
+
+class ReprocessNlpUkDeadLettersTask(TaskRQ):
+    """
+    Task for the processing of the documents, that failed in the ProcessWithNlpUKTask.
+    """
+
+    corpora = ChoiceArrayField(
+        models.CharField(
+            max_length=10,
+            null=False,
+            blank=False,
+            choices=_CORPORA_CHOICES,
+        ),
+        blank=False,
+    )
+
+    batch_chars = models.PositiveIntegerField(
+        "Initial number of characters per request to the NLP-UK API, adapted to the latency and errors",
+        default=1000000,
+    )
+
+    target_latency = models.PositiveSmallIntegerField(
+        "Requests to the NLP-UK API slower than that (in seconds) decrease the batch size",
+        default=30,
+    )
+
+    max_retries = models.PositiveSmallIntegerField(
+        "Number of retries of the requests to the NLP-UK API, failed with transient errors",
+        default=3,
+    )
+
+    TASK_QUEUE = settings.QUEUE_DEFAULT
+
+    DEFAULT_VERBOSITY = 2
+    TASK_TIMEOUT = 0
+    LOG_TO_FIELD = True
+    LOG_TO_FILE = False
+
+    @staticmethod
+    def get_jobclass():
+        """
+        Get django-tasks job class.
+        """
+        from .jobs import ReprocessNlpUkDeadLettersJob
+
+        return ReprocessNlpUkDeadLettersJob
+
+
+class DetectLanguageTask(TaskRQ):
+    """
+    Task for the paragraph-level language identification of the cleansed texts.
+    """
+
+    corpora = ChoiceArrayField(
+        models.CharField(
+            max_length=10,
+            null=False,
+            blank=False,
+            choices=_CORPORA_CHOICES,
+        ),
+        blank=False,
+    )
+
+    force = models.BooleanField(
+        "Detect languages of all texts, including already processed",
+        default=False,
+    )
+
+    workers = models.PositiveSmallIntegerField(
+        "Number of worker processes",
+        default=1,
+    )
+
+    TASK_QUEUE = settings.QUEUE_DEFAULT
+
+    DEFAULT_VERBOSITY = 2
+    TASK_TIMEOUT = 0
+    LOG_TO_FIELD = True
+    LOG_TO_FILE = False
+
+    @staticmethod
+    def get_jobclass():
+        """
+        Get django-tasks job class.
+        """
+        from .jobs import DetectLanguageJob
+
+        return DetectLanguageJob
+
+
+class DeduplicateTask(TaskRQ):
+    """
+    Task for finding near-duplicate texts with MinHash and LSH.
+    """
+
+    corpora = ChoiceArrayField(
+        models.CharField(
+            max_length=10,
+            null=False,
+            blank=False,
+            choices=_CORPORA_CHOICES,
+        ),
+        blank=False,
+    )
+
+    force = models.BooleanField(
+        "Cluster all texts of the selected corpora from scratch",
+        default=False,
+    )
+
+    workers = models.PositiveSmallIntegerField(
+        "Number of worker processes to calculate signatures",
+        default=1,
+    )
+
+    threshold = models.FloatField(
+        "Minimal estimated Jaccard similarity of the near-duplicates",
+        default=0.8,
+    )
+
+    TASK_QUEUE = settings.QUEUE_DEFAULT
+
+    DEFAULT_VERBOSITY = 2
+    TASK_TIMEOUT = 0
+    LOG_TO_FIELD = True
+    LOG_TO_FILE = False
+
+    @staticmethod
+    def get_jobclass():
+        """
+        Get django-tasks job class.
+        """
+        from .jobs import DeduplicateJob
+
+        return DeduplicateJob
+
+
+class ConvertUDPipedLayersTask(TaskRQ):
+    """
+    Task for converting udpiped layers between the string and the binary encodings.
+    """
+
+    corpora = ChoiceArrayField(
+        models.CharField(
+            max_length=10,
+            null=False,
+            blank=False,
+            choices=_CORPORA_CHOICES,
+        ),
+        blank=False,
+    )
+
+    encoding = models.CharField(
+        "Target encoding",
+        max_length=10,
+        null=False,
+        blank=False,
+        choices=(
+            ("binary", "Lemma ids and packed postags/features as BSON binary"),
+            ("strings", "Space- and newline-joined strings"),
+        ),
+        default="binary",
+    )
+
+    workers = models.PositiveSmallIntegerField(
+        "Number of worker processes",
+        default=1,
+    )
+
+    TASK_QUEUE = settings.QUEUE_DEFAULT
+
+    DEFAULT_VERBOSITY = 2
+    TASK_TIMEOUT = 0
+    LOG_TO_FIELD = True
+    LOG_TO_FILE = False
+
+    @staticmethod
+    def get_jobclass():
+        """
+        Get django-tasks job class.
+        """
+        from .jobs import ConvertUDPipedLayersJob
+
+        return ConvertUDPipedLayersJob
+
+
+class BuildNgramsTask(TaskRQ):
+    """
+    Task for building n-gram frequency tables.
+    """
+
+    corpora = ChoiceArrayField(
+        models.CharField(
+            max_length=10,
+            null=False,
+            blank=False,
+            choices=_CORPORA_CHOICES,
+        ),
+        blank=False,
+    )
+
+    filtering = ChoiceArrayField(
+        models.CharField(
+            max_length=10,
+            null=False,
+            blank=False,
+            choices=_FILTERING_CHOICES,
+        ),
+        blank=True,
+        default=list,
+    )
+
+    n = models.PositiveSmallIntegerField(
+        "Number of the words in the n-gram",
+        default=2,
+    )
+
+    units = models.CharField(
+        max_length=6,
+        null=False,
+        blank=False,
+        default="forms",
+        choices=(
+            ("forms", "Word forms from the tokenized layer"),
+            ("lemmas", "Lemmas from the lemmatized layer"),
+        ),
+    )
+
+    keep_punctuation = models.BooleanField(
+        "Keep punctuation",
+        default=False,
+    )
+
+    min_count = models.PositiveIntegerField(
+        "Skip n-grams with fewer occurences",
+        default=2,
+    )
+
+    memory_limit = models.PositiveIntegerField(
+        "Memory budget of the counters in megabytes, counts are spilled to the disk above it",
+        default=1024,
+    )
+
+    workers = models.PositiveSmallIntegerField(
+        "Number of worker processes",
+        default=1,
+    )
+
+    file_format = models.CharField(
+        max_length=5,
+        null=False,
+        blank=False,
+        default="tsv",
+        choices=(("tsv", "Sorted TSV table with the offset index"),),
+    )
+    file_compression = models.CharField(
+        max_length=5,
+        null=False,
+        blank=False,
+        default="pgz",
+        choices=_COMPRESSION_CHOICES,
+    )
+
+    compression_level = models.PositiveSmallIntegerField(
+        "Compression level, leave empty for the default one",
+        null=True,
+        blank=True,
+    )
+
+    compression_threads = models.PositiveSmallIntegerField(
+        "Number of compression threads (for zstd and parallel compressions)",
+        default=1,
+    )
+
+    TASK_QUEUE = settings.QUEUE_DEFAULT
+
+    DEFAULT_VERBOSITY = 2
+    TASK_TIMEOUT = 0
+    LOG_TO_FIELD = True
+    LOG_TO_FILE = False
+
+    @staticmethod
+    def get_jobclass():
+        """
+        Get django-tasks job class.
+        """
+        from .jobs import BuildNgramsJob
+
+        return BuildNgramsJob
@@ -0,0 +1,107 @@
+import json
+import bisect
+import pathlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from corpus.compression import get_decompressor
+
+
+# N-gram tables are queried by the blocks, so the segments are kept small
+NGRAM_SEGMENT_SIZE: int = 1024 * 1024
+
+# Every n-th n-gram is added to the offset index, along with the first one in each block
+NGRAM_INDEX_INTERVAL: int = 256
+
+
+def get_ngrams(sentences: Iterable[List[str]], n: int) -> Iterator[str]:
+    """
+    Get n-grams of the sentences, n-grams never cross the sentence boundaries
+    :param sentences: sentences of the words
+    :param n: number of the words in the n-gram
+    :return: iterator of the n-grams, words are joined with spaces
+    """
+    for sentence in sentences:
+        for i in range(len(sentence) - n + 1):
+            yield " ".join(sentence[i : i + n])
+
+
+def get_index_filename(filename: pathlib.Path) -> pathlib.Path:
+    return filename.with_name(filename.name + ".index.jsonl")
+
+
+def get_manifest_filename(filename: pathlib.Path) -> pathlib.Path:
+    return filename.with_name(filename.name + ".manifest.json")
+
+
+class NgramTable:
+    """
+    Reader of the n-gram table, written by BuildNgramsJob: tab-separated n-grams and
+    their counts, sorted by n-gram and compressed in the blocks. The sparse offset index
+    of the blocks allows to find n-grams by prefix without reading the whole table
+    """
+
+    def __init__(self, filename: pathlib.Path) -> None:
+        """
+        :param filename: name of the table, the index and the manifest are expected alongside
+        """
+        self.filename: pathlib.Path = filename
+        self.manifest: Dict = json.loads(get_manifest_filename(filename).read_text())
+        self.decompress = get_decompressor(self.manifest["compression"])
+
+        with open(get_index_filename(filename), encoding="utf-8") as fp:
+            self.index: List[Dict] = [json.loads(line) for line in fp]
+
+        self.keys: List[str] = [entry["ngram"] for entry in self.index]
+
+        # Each block has at least one entry in the index, so this is the list of all blocks
+        self.blocks: List[Tuple[int, int]] = sorted(
+            {(entry["block_offset"], entry["block_size"]) for entry in self.index}
+        )
+
+    def _read_block(self, fp, block_no: int) -> bytes:
+        block_offset, block_size = self.blocks[block_no]
+        fp.seek(block_offset)
+
+        return self.decompress(fp.read(block_size))
+
+    def query(
+        self, prefix: str, limit: Optional[int] = None
+    ) -> Iterator[Tuple[str, int]]:
+        """
+        Find n-grams, starting with the prefix
+        :param prefix: prefix of the n-gram, i.e. the first word and the space
+        :param limit: maximal number of n-grams to return
+        :return: iterator of (n-gram, count) in the order of n-grams
+        """
+        if not self.index:
+            return
+
+        # Last indexed n-gram before the prefix, the matching ones can't be earlier
+        entry: Dict = self.index[max(bisect.bisect_left(self.keys, prefix) - 1, 0)]
+        block_no: int = self.blocks.index((entry["block_offset"], entry["block_size"]))
+        offset: int = entry["offset"]
+        found: int = 0
+
+        with open(self.filename, "rb") as fp:
+            while block_no < len(self.blocks):
+                data: bytes = self._read_block(fp, block_no)
+
+                # Records are terminated with "\n" only, while splitlines() also splits
+                # on the other separators, that might occur in the tokens
+                for line in data[offset:].decode("utf-8").split("\n")[:-1]:
+                    ngram, count = line.rsplit("\t", 1)
+
+                    if ngram < prefix:
+                        continue
+
+                    if not ngram.startswith(prefix):
+                        return
+
+                    yield ngram, int(count)
+
+                    found += 1
+                    if limit is not None and found >= limit:
+                        return
+
+                block_no += 1
+                offset = 0
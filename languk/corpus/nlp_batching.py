@@ -0,0 +1,161 @@
+import threading
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple, Union
+
+
+# Texts longer than that are split into the chunks of paragraphs, processed separately
+MAX_CHUNK_CHARS: int = 50000
+
+# Bounds of the number of characters, sent to the nlp_uk_api in one request. Budget
+# can't go below the size of one chunk, so any text can be sent
+MIN_BUDGET: int = MAX_CHUNK_CHARS
+MAX_BUDGET: int = 10000000
+DEFAULT_BUDGET: int = 1000000
+
+# Budget is increased only while the smoothed share of the failed requests is below that
+MAX_ERROR_RATE: float = 0.05
+
+# Weight of the latest request in the smoothed error rate
+ERROR_RATE_ALPHA: float = 0.1
+
+NlpResult = Dict[str, Union[List, str]]
+
+
+def split_text(text: str, max_chars: int = MAX_CHUNK_CHARS) -> List[Tuple[str, str]]:
+    """
+    Split the text into the chunks of whole paragraphs of at most max_chars characters.
+    Paragraphs that are too long by themselves are cut on the last space before the
+    limit, or right at the limit
+    :param text: text, paragraphs are separated by newlines
+    :param max_chars: maximal size of the chunk
+    :return: list of (chunk, separator), that joins the chunk with the next one,
+        the text itself when it is short enough
+    """
+    if len(text) <= max_chars:
+        return [(text, "")]
+
+    # Paragraphs and the cuts of the long ones, along with the separators after them
+    pieces: List[Tuple[str, str]] = []
+    for paragraph in text.split("\n"):
+        while len(paragraph) > max_chars:
+            cut: int = paragraph.rfind(" ", 0, max_chars + 1)
+
+            if cut <= 0:
+                pieces.append((paragraph[:max_chars], ""))
+                paragraph = paragraph[max_chars:]
+            else:
+                pieces.append((paragraph[:cut], " "))
+                paragraph = paragraph[cut + 1 :]
+
+        pieces.append((paragraph, "\n"))
+
+    chunks: List[Tuple[str, str]] = []
+    current: str = ""
+    current_sep: str = ""
+
+    for i, (piece, sep) in enumerate(pieces):
+        if i and len(current) + len(current_sep) + len(piece) > max_chars:
+            chunks.append((current, current_sep))
+            current = piece
+        else:
+            current += (current_sep if i else "") + piece
+
+        current_sep = sep
+
+    chunks.append((current, ""))
+
+    return chunks
+
+
+def stitch_results(parts: List[NlpResult], chunks: List[Tuple[str, str]]) -> NlpResult:
+    """
+    Join the results of the processing of the chunks of the text back into one
+    :param parts: results of the nlp_uk_api for every chunk
+    :param chunks: chunks and separators, as returned by split_text
+    :return: result for the whole text
+    """
+    if len(parts) == 1:
+        return parts[0]
+
+    return {
+        "cleanText": "".join(
+            part["cleanText"] + sep for part, (_, sep) in zip(parts, chunks)
+        ),
+        "tokens": [s for part in parts for s in part["tokens"]],
+        "lemmas": [s for part in parts for s in part["lemmas"]],
+        "sentences": [s for part in parts for s in part["sentences"]],
+    }
+
+
+class AdaptiveBudget:
+    """
+    Number of characters to send to the nlp_uk_api in one request, adapted to the
+    observed latency and errors (additive increase, multiplicative decrease): budget
+    grows by a step after each request, that was fast enough, and is halved after
+    each failed or slow one. Shared by the threads, that send the requests
+    """
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_BUDGET,
+        target_latency: float = 30.0,
+        minimum: int = MIN_BUDGET,
+        maximum: int = MAX_BUDGET,
+    ) -> None:
+        """
+        :param initial: budget to start with
+        :param target_latency: requests, that take longer (in seconds), decrease the budget
+        :param minimum: lower bound of the budget
+        :param maximum: upper bound of the budget
+        """
+        self.minimum: int = minimum
+        self.maximum: int = maximum
+        self.target_latency: float = target_latency
+        self.current: int = min(max(initial, minimum), maximum)
+
+        # Budget grows by the tenth of the initial one per request
+        self.step: int = max(self.current // 10, 1)
+        self.error_rate: float = 0.0
+        self.stats: Counter = Counter()
+        self.lock: threading.Lock = threading.Lock()
+
+    def observe(self, chars: int, latency: float, failed: bool = False) -> None:
+        """
+        Adapt the budget to the outcome of the request
+        :param chars: number of characters sent
+        :param latency: time of the request in seconds
+        :param failed: whether the request failed
+        """
+        with self.lock:
+            self.error_rate += ERROR_RATE_ALPHA * (float(failed) - self.error_rate)
+            self.stats["requests"] += 1
+            self.stats["chars"] += chars
+            self.stats["failed"] += int(failed)
+
+            if failed or latency > self.target_latency:
+                self.current = max(self.current // 2, self.minimum)
+                self.stats["decreases"] += 1
+            elif self.error_rate < MAX_ERROR_RATE and chars * 2 >= self.current:
+                # Small requests, i.e. at the end of the corpus, tell nothing about the limit
+                self.current = min(self.current + self.step, self.maximum)
+                self.stats["increases"] += 1
+
+
+def iter_slices(texts: List[str], budget: int) -> Iterator[Tuple[int, int]]:
+    """
+    Split the texts into the consecutive slices of at most budget characters each,
+    or of one text, when it is larger than the budget
+    :return: iterator of (start, end) of the slices
+    """
+    start: int = 0
+    size: int = 0
+
+    for i, text in enumerate(texts):
+        if i > start and size + len(text) > budget:
+            yield start, i
+            start, size = i, 0
+
+        size += len(text)
+
+    if start < len(texts):
+        yield start, len(texts)
@@ -1,47 +1,294 @@
-from typing import Union, List, Dict, Optional
+import gzip
+import json
+import time
+import codecs
+import asyncio
+import threading
+from typing import Any, Union, List, Dict, Iterable, Iterator, Optional, Tuple
 from urllib.parse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
+
+
+NlpResult = Dict[str, Union[List, str]]
+
+BALANCING_ROUND_ROBIN: str = "round_robin"
+BALANCING_LEAST_LOADED: str = "least_loaded"
+
+# Request bodies smaller than that are sent uncompressed, as gzip doesn't pay off for them
+MIN_COMPRESS_BYTES: int = 1024
+
+# Size of the chunks, in which the responses are read, when they are parsed incrementally
+RESPONSE_CHUNK_BYTES: int = 64 * 1024
+
+# Base url, that failed to respond, is skipped for that long (in seconds), unless all of them failed
+FAILURE_COOLDOWN: float = 30.0
+
+_WHITESPACE: str = " \t\n\r"
+_DELIMITERS: str = _WHITESPACE + ",]"
 
 
 class NlpUkApiException(Exception):
-    pass
+    # Statuses of the responses, that are worth retrying
+    TRANSIENT_STATUSES = {408, 429, 502, 503, 504}
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        """
+        :param message: description of the error
+        :param status_code: status of the response, None when there was no response at all
+        """
+        super().__init__(message)
+        self.status_code: Optional[int] = status_code
+
+    @property
+    def is_transient(self) -> bool:
+        """
+        Whether the same request might succeed later, i.e. the service was unavailable or
+        overloaded, as opposed to the errors, caused by the texts themselves
+        """
+        return self.status_code is None or self.status_code in self.TRANSIENT_STATUSES
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Parse the json array from the chunks of its utf-8 encoding, yielding the items as soon
+    as they are complete, so neither the whole body nor its text is kept in memory.
+    Incomplete item is retried only once the data available for it has doubled, so the
+    large items are parsed in the linear time
+    :param chunks: chunks of the body, i.e. response.iter_content()
+    :return: iterator of the items of the array
+    """
+    decoder: json.JSONDecoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    buf: str = ""
+    pos: int = 0
+    pending: List[str] = []
+    pending_chars: int = 0
+    retry_at: int = 0
+    started: bool = False
+
+    def iter_text() -> Iterator[Tuple[str, bool]]:
+        for chunk in chunks:
+            yield utf8.decode(chunk), False
+
+        yield utf8.decode(b"", final=True), True
+
+    for text, final in iter_text():
+        pending.append(text)
+        pending_chars += len(text)
+
+        if len(buf) - pos + pending_chars < retry_at and not final:
+            continue
+
+        buf = buf[pos:] + "".join(pending)
+        pos, pending, pending_chars = 0, [], 0
+
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+
+            if pos == len(buf):
+                break
+
+            if not started:
+                if buf[pos] != "[":
+                    raise NlpUkApiException(f"Expected json array in the response, got {buf[pos:pos + 100]!r}")
+
+                started = True
+                pos += 1
+            elif buf[pos] == "]":
+                return
+            elif buf[pos] == ",":
+                pos += 1
+            else:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if final:
+                        raise NlpUkApiException(f"Malformed json in the response: {e}")
+
+                    retry_at = 2 * (len(buf) - pos)
+                    break
+
+                # Number, cut by the end of the data, i.e. "-1500." is parsed as -1500, so the
+                # item counts only when it is followed by the delimiter
+                if not final and (end == len(buf) or buf[end] not in _DELIMITERS):
+                    retry_at = len(buf) - pos + 1
+                    break
+
+                yield item
+                pos, retry_at = end, 0
+
+    raise NlpUkApiException("Response ended before the end of the json array")
 
 
 class NlpUkClient:
-    def __init__(self, base_url: str) -> None:
+    """
+    Client of the nlp_uk_api, balancing the requests between one or more instances of it.
+    Connections to each instance are kept in the pool, so the client is meant to be
+    created once and shared, also between the threads
+    """
+
+    def __init__(
+        self,
+        base_url: Union[str, List[str]],
+        balancing: str = BALANCING_LEAST_LOADED,
+        pool_size: int = 10,
+        timeout: Tuple[float, float] = (10.0, 600.0),
+        compress_requests: bool = False,
+        stream_responses: bool = True,
+    ) -> None:
+        """
+        :param base_url: base url of the nlp_uk_api, or the list of them, or the string of
+            the urls, separated by spaces
+        :param balancing: round_robin to take the urls in turn, or least_loaded to take the one
+            with the fewest requests in flight
+        :param pool_size: maximal number of the connections, kept open to each of the urls
+        :param timeout: connect and read timeouts in seconds
+        :param compress_requests: gzip the request bodies, the service (or the proxy in front of it)
+            must accept Content-Encoding: gzip
+        :param stream_responses: parse the responses incrementally, as they arrive
+        """
+        self.base_urls: List[str] = base_url.split() if isinstance(base_url, str) else list(base_url)
+
+        if not self.base_urls:
+            raise ValueError("No base url of the nlp_uk_api is given")
+
+        if balancing not in [BALANCING_ROUND_ROBIN, BALANCING_LEAST_LOADED]:
+            raise ValueError(f"Unknown balancing {balancing}")
+
+        self.balancing: str = balancing
+        self.timeout: Tuple[float, float] = timeout
+        self.compress_requests: bool = compress_requests
+        self.stream_responses: bool = stream_responses
+
+        # Session isn't modified after that, so the threads can send the requests through it
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=len(self.base_urls), pool_maxsize=pool_size)
         self.session = requests.Session()
-        self.base_url = base_url
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock: threading.Lock = threading.Lock()
+        self._next: int = 0
+        self._inflight: Dict[str, int] = dict.fromkeys(self.base_urls, 0)
+        self._failed_at: Dict[str, float] = {}
+
+    @property
+    def base_url(self) -> str:
+        return self.base_urls[0]
+
+    def _acquire_url(self) -> str:
+        """
+        Pick the base url for the next request, urls that failed recently are skipped
+        """
+        with self._lock:
+            now: float = time.monotonic()
+            # Starting point rotates, so the ties are broken in turn
+            urls: List[str] = self.base_urls[self._next :] + self.base_urls[: self._next]
+            self._next = (self._next + 1) % len(self.base_urls)
+
+            urls = [
+                url for url in urls if url not in self._failed_at or now - self._failed_at[url] >= FAILURE_COOLDOWN
+            ] or urls
+
+            if self.balancing == BALANCING_LEAST_LOADED:
+                url: str = min(urls, key=self._inflight.__getitem__)
+            else:
+                url = urls[0]
+
+            self._inflight[url] += 1
+
+            return url
+
+    def _release_url(self, url: str, failed: bool) -> None:
+        with self._lock:
+            self._inflight[url] -= 1
+
+            if failed:
+                self._failed_at[url] = time.monotonic()
+            else:
+                self._failed_at.pop(url, None)
 
     def _request(
         self,
         method: str,
         url: str,
         params: Optional[Dict] = None,
-        data: Optional[Dict] = None,
-        json: Optional[Dict] = None,
-    ) -> requests.models.Response:
+        json_data: Optional[Dict] = None,
+    ) -> Any:
         """
         Make request to NLP-UK API
         :param method: HTTP method
         :param url: relative url
         :param params: params
-        :param data: data
-        :param json: json
-        :return: response
+        :param json_data: body of the request, sent as json
+        :return: decoded json of the response
         """
-        full_url: str = urljoin(self.base_url, url)
-        headers = {"Content-Type": "application/json"}
-        response = self.session.request(
-            method=method, url=full_url, params=params, data=data, json=json, headers=headers
-        )
+        headers: Dict[str, str] = {"Accept-Encoding": "gzip"}
+        body: Optional[bytes] = None
+
+        if json_data is not None:
+            # Escaped cyrillic takes three times more than utf-8
+            body = json.dumps(json_data, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+
+            if self.compress_requests and len(body) >= MIN_COMPRESS_BYTES:
+                body = gzip.compress(body, compresslevel=1)
+                headers["Content-Encoding"] = "gzip"
+
+        base_url: str = self._acquire_url()
+        failed: bool = True
+        try:
+            response = self.session.request(
+                method=method,
+                url=urljoin(base_url, url),
+                params=params,
+                data=body,
+                headers=headers,
+                timeout=self.timeout,
+                stream=self.stream_responses,
+            )
+        except requests.RequestException as e:
+            self._release_url(base_url, failed=True)
+            raise NlpUkApiException(f"Failed to connect to {base_url}: {e}")
 
-        if response.status_code >= 400:
-            raise NlpUkApiException(f"Failed with status {response.status_code}: {response.text}")
+        try:
+            if response.status_code >= 400:
+                failed = response.status_code in NlpUkApiException.TRANSIENT_STATUSES
+                raise NlpUkApiException(
+                    f"Failed with status {response.status_code}: {response.text}",
+                    status_code=response.status_code,
+                )
 
-        return response
+            try:
+                result = self._decode(response)
+            # Json errors of requests are RequestExceptions as well, so they go first
+            except ValueError as e:
+                failed = False
+                raise NlpUkApiException(f"Malformed json in the response: {e}", status_code=response.status_code)
+            except requests.RequestException as e:
+                raise NlpUkApiException(f"Failed to read the response of {base_url}: {e}")
 
-    def batch(self, texts: List[str]) -> List[Dict[str, Union[List, str]]]:
+            failed = False
+
+            return result
+        finally:
+            response.close()
+            self._release_url(base_url, failed)
+
+    def _decode(self, response: requests.models.Response) -> Any:
+        """
+        Decode the json of the response, incrementally when the responses are streamed,
+        in which case the response must be the json array
+        """
+        if self.stream_responses:
+            return list(iter_json_array(response.iter_content(RESPONSE_CHUNK_BYTES)))
+
+        return response.json()
+
+    def batch(self, texts: List[str]) -> List[NlpResult]:
         """
         Batch request to NLP-UK API
         :param texts: list of texts
@@ -50,13 +297,11 @@ class NlpUkClient:
         filtered_texts: List[str] = [text for text in texts if text.strip()]
 
         if filtered_texts:
-            response = self._request(method="POST", url="/batch", json={"texts": filtered_texts})
-
-            resp_iterator = iter(response.json())
+            resp_iterator = iter(self._request(method="POST", url="/batch", json_data={"texts": filtered_texts}))
         else:
             resp_iterator = iter([])
 
-        res: List[Dict[str, Union[List, str]]] = []
+        res: List[NlpResult] = []
 
         for text in texts:
             if text.strip():
@@ -65,3 +310,34 @@ class NlpUkClient:
                 res.append({"cleanText": "", "tokens": [], "lemmas": [], "sentences": []})
 
         return res
+
+
+class AsyncNlpUkClient:
+    """
+    asyncio interface of the NlpUkClient to send several batches concurrently. There is no
+    asyncio http library among the dependencies, so the requests are made through the pool
+    of the client in the threads of the default executor
+    """
+
+    def __init__(self, client: NlpUkClient, concurrency: int = 4) -> None:
+        """
+        :param client: client to send the requests through
+        :param concurrency: maximal number of the requests in flight
+        """
+        self.client: NlpUkClient = client
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+
+    async def batch(self, texts: List[str]) -> List[NlpResult]:
+        """
+        Batch request to NLP-UK API, see NlpUkClient.batch
+        """
+        async with self.semaphore:
+            return await asyncio.to_thread(self.client.batch, texts)
+
+    async def batches(self, batches: Iterable[List[str]]) -> List[List[NlpResult]]:
+        """
+        Send the batches concurrently
+        :param batches: lists of texts
+        :return: results of each batch, in the same order
+        """
+        return await asyncio.gather(*[self.batch(texts) for texts in batches])
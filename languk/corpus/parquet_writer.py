@@ -0,0 +1,125 @@
+import pathlib
+from datetime import date
+from typing import Dict, List, Optional
+
+
+# Rows to accumulate before writing them as one row group
+DEFAULT_ROW_GROUP_SIZE: int = 10000
+
+# Metadata of the documents to export alongside with the texts
+METADATA_FIELDS: List[str] = ["source", "author", "url", "date_of_publish", "tags"]
+
+# Columns with a lot of repeated values, which are dictionary-encoded
+DICTIONARY_COLUMNS: List[str] = ["corpus", "source", "author", "tags.list.element"]
+
+
+def _layer_type(layer_name: str):
+    import pyarrow as pa  # type: ignore
+
+    if layer_name == "cleansed":
+        return pa.string()
+    if layer_name == "sentenced":
+        return pa.list_(pa.string())
+
+    # tokenized and lemmatized layers are lists of sentences of tokens
+    return pa.list_(pa.list_(pa.string()))
+
+
+class ParquetArticleWriter:
+    """
+    Writer of the exported articles into the parquet file with zstd-compressed columns.
+    Rows are buffered and written in the row groups, so the consumers can memory-map the
+    file and read only the columns they need.
+    """
+
+    def __init__(
+        self,
+        filename: pathlib.Path,
+        layer_names: List[str],
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+        compression_level: Optional[int] = None,
+    ) -> None:
+        """
+        Open the file for writing
+        :param filename: name of the file
+        :param layer_names: names of the layers to store, each gets title and text columns
+        :param row_group_size: number of rows in the row group
+        :param compression_level: level of the zstd compression, None for the default one
+        """
+        import pyarrow as pa  # type: ignore
+        import pyarrow.parquet as pq  # type: ignore
+
+        self.pa = pa
+        self.row_group_size: int = row_group_size
+
+        fields: List = [
+            pa.field("corpus", pa.string()),
+            pa.field("_id", pa.string()),
+            pa.field("title", pa.string()),
+            pa.field("text", pa.string()),
+            pa.field("source", pa.string()),
+            pa.field("author", pa.string()),
+            pa.field("url", pa.string()),
+            pa.field("date_of_publish", pa.string()),
+            pa.field("tags", pa.list_(pa.string())),
+        ]
+
+        for layer_name in layer_names:
+            for f in ["title", "text"]:
+                fields.append(pa.field(f"{layer_name}_{f}", _layer_type(layer_name)))
+
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(
+            str(filename),
+            self.schema,
+            compression="zstd",
+            compression_level=compression_level,
+            use_dictionary=DICTIONARY_COLUMNS,
+        )
+
+        self.rows: List[Dict] = []
+
+    def write_row(self, row: Dict) -> None:
+        """
+        Buffer the row, the values that are missing in the row are stored as nulls
+        :param row: dict with the values of the columns
+        """
+        self.rows.append(row)
+
+        if len(self.rows) >= self.row_group_size:
+            self.flush_row_group()
+
+    @staticmethod
+    def get_metadata(article: Dict) -> Dict:
+        """
+        Extract the metadata columns from the article
+        :param article: article
+        :return: dict with the metadata columns
+        """
+        metadata: Dict = {}
+
+        for field in METADATA_FIELDS:
+            value = article.get(field)
+
+            if isinstance(value, date):
+                value = value.isoformat()
+            elif field == "tags":
+                value = [str(tag) for tag in value] if value else None
+            elif value is not None:
+                value = str(value)
+
+            metadata[field] = value
+
+        return metadata
+
+    def flush_row_group(self) -> None:
+        if self.rows:
+            self.writer.write_table(
+                self.pa.Table.from_pylist(self.rows, schema=self.schema),
+                row_group_size=self.row_group_size,
+            )
+            self.rows = []
+
+    def close(self) -> None:
+        self.flush_row_group()
+        self.writer.close()
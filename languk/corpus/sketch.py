@@ -0,0 +1,310 @@
+import json
+import math
+import operator
+import pathlib
+import sys
+from array import array
+from hashlib import blake2b
+from typing import Dict, Iterator, List, Tuple
+
+
+DEFAULT_WIDTH: int = 2**21
+DEFAULT_DEPTH: int = 4
+DEFAULT_TOP_K: int = 200000
+
+_MASK_64: int = (1 << 64) - 1
+
+
+def _hash_key(key: Tuple[str, ...]) -> Tuple[int, int]:
+    """
+    Two independent 64-bit hashes of the key, stable between the processes and the runs
+    """
+    digest: bytes = blake2b(
+        "\x1f".join(key).encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class CountMinSketch:
+    """
+    Count-min sketch: fixed-size table of the counters, depth rows of width cells. Each
+    key is added to one cell of each row, the estimate is the minimum of them, so it
+    never underestimates and overestimates by at most e / width * total with the
+    probability of 1 - e ** -depth
+    """
+
+    def __init__(self, width: int = DEFAULT_WIDTH, depth: int = DEFAULT_DEPTH) -> None:
+        self.width: int = width
+        self.depth: int = depth
+        self.total: int = 0
+        self.table = array("Q", bytes(8 * width * depth))
+
+    def _get_cells(self, key: Tuple[str, ...]) -> List[int]:
+        # Row hashes are derived from two hashes (Kirsch-Mitzenmacher)
+        h1, h2 = _hash_key(key)
+
+        return [
+            row * self.width + ((h1 + row * h2) & _MASK_64) % self.width
+            for row in range(self.depth)
+        ]
+
+    def add(self, key: Tuple[str, ...], count: int = 1) -> int:
+        """
+        Add the occurences of the key
+        :return: estimated count of the key after the update
+        """
+        cells: List[int] = self._get_cells(key)
+        table = self.table
+
+        for cell in cells:
+            table[cell] += count
+
+        self.total += count
+
+        return min(table[cell] for cell in cells)
+
+    def estimate(self, key: Tuple[str, ...]) -> int:
+        table = self.table
+
+        return min(table[cell] for cell in self._get_cells(key))
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    @property
+    def error_bound(self) -> float:
+        """
+        Maximal overestimation of the counts with the probability 1 - delta
+        """
+        return self.epsilon * self.total
+
+    def merge(self, other: "CountMinSketch") -> None:
+        """
+        Add the counts of the other sketch of the same shape
+        """
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError(
+                f"Cannot merge sketches of the different shapes: {self.width}x{self.depth}"
+                + f" and {other.width}x{other.depth}"
+            )
+
+        self.table = array("Q", map(operator.add, self.table, other.table))
+
+        self.total += other.total
+
+
+class HeavyHitters:
+    """
+    Top-k keys by the estimated counts. Candidates are accumulated up to 2k and then
+    pruned to k at once, so the admission threshold is updated in the amortized O(1)
+    """
+
+    def __init__(self, k: int = DEFAULT_TOP_K) -> None:
+        self.k: int = k
+        self.candidates: Dict[Tuple[str, ...], int] = {}
+        self.threshold: int = 0
+
+    def offer(self, key: Tuple[str, ...], estimate: int) -> None:
+        if key in self.candidates or estimate > self.threshold:
+            self.candidates[key] = estimate
+
+            if len(self.candidates) >= 2 * self.k:
+                self.prune()
+
+    def prune(self) -> None:
+        if len(self.candidates) <= self.k:
+            return
+
+        top: List[Tuple[Tuple[str, ...], int]] = sorted(
+            self.candidates.items(), key=lambda item: -item[1]
+        )[: self.k]
+        self.candidates = dict(top)
+        self.threshold = top[-1][1]
+
+
+class FrequencySketch:
+    """
+    Approximate frequency vocabulary in the fixed memory: count-min sketches of the
+    counts and document counts of (pos, lemma) and the top-k lemmas of each pos. Exact
+    totals are kept alongside. Sketches of the different corpora or runs can be merged
+    """
+
+    def __init__(
+        self,
+        width: int = DEFAULT_WIDTH,
+        depth: int = DEFAULT_DEPTH,
+        top_k: int = DEFAULT_TOP_K,
+    ) -> None:
+        """
+        :param width: number of the cells in each row of the sketches
+        :param depth: number of the rows of the sketches
+        :param top_k: number of the most frequent lemmas to keep for each pos
+        """
+        self.counts: CountMinSketch = CountMinSketch(width, depth)
+        self.doc_counts: CountMinSketch = CountMinSketch(width, depth)
+        self.top_k: int = top_k
+        self.heavy_hitters: Dict[str, HeavyHitters] = {}
+        self.totals_by_pos: Dict[str, int] = {}
+        self.processed_articles: int = 0
+
+    def add_document(self, doc_counts: Dict[Tuple[str, str], int]) -> None:
+        """
+        Add the counts of the lemmas of the document
+        :param doc_counts: (pos, lemma) -> number of the occurences in the document
+        """
+        for key, count in doc_counts.items():
+            pos: str = key[0]
+            estimate: int = self.counts.add(key, count)
+            self.doc_counts.add(key)
+
+            if pos not in self.heavy_hitters:
+                self.heavy_hitters[pos] = HeavyHitters(self.top_k)
+                self.totals_by_pos[pos] = 0
+
+            self.heavy_hitters[pos].offer(key, estimate)
+            self.totals_by_pos[pos] += count
+
+        self.processed_articles += 1
+
+    def merge(self, other: "FrequencySketch") -> None:
+        """
+        Add the counts of the other sketch, heavy hitters are reestimated on the
+        merged sketch
+        """
+        self.counts.merge(other.counts)
+        self.doc_counts.merge(other.doc_counts)
+        self.processed_articles += other.processed_articles
+
+        for pos, total in other.totals_by_pos.items():
+            self.totals_by_pos[pos] = self.totals_by_pos.get(pos, 0) + total
+
+        for pos in set(self.heavy_hitters) | set(other.heavy_hitters):
+            keys: set = set()
+            for sketch in [self, other]:
+                if pos in sketch.heavy_hitters:
+                    keys.update(sketch.heavy_hitters[pos].candidates)
+
+            heavy_hitters: HeavyHitters = HeavyHitters(self.top_k)
+            for key in keys:
+                heavy_hitters.offer(key, self.counts.estimate(key))
+            heavy_hitters.prune()
+
+            self.heavy_hitters[pos] = heavy_hitters
+
+    def get_rows(self) -> Iterator[Dict]:
+        """
+        Rows of the frequency vocabulary, sorted by pos and by the estimated count
+        """
+        total_lemmas: int = self.counts.total
+
+        for pos in sorted(self.heavy_hitters):
+            heavy_hitters: HeavyHitters = self.heavy_hitters[pos]
+            heavy_hitters.prune()
+
+            for (_, lemma), count in sorted(
+                heavy_hitters.candidates.items(), key=lambda item: (-item[1], item[0])
+            ):
+                doc_count: int = self.doc_counts.estimate((pos, lemma))
+
+                yield {
+                    "lemma": lemma,
+                    "pos": pos,
+                    "count": count,
+                    "doc_count": doc_count,
+                    "freq_by_pos": count / self.totals_by_pos[pos],
+                    "freq_in_corpus": count / total_lemmas,
+                    "doc_frequency": doc_count / self.processed_articles,
+                }
+
+    def get_header(self) -> List[str]:
+        """
+        Description of the error bounds of the estimates for the header of the output
+        """
+        confidence: float = 1 - self.counts.delta
+
+        return [
+            "approximate frequencies, estimated with count-min sketch "
+            + f"of {self.counts.width}x{self.counts.depth} cells, "
+            + f"top {self.top_k} lemmas of each pos",
+            f"count overestimates the true one by at most {self.counts.error_bound:.1f} "
+            + f"(epsilon={self.counts.epsilon:.3g} of {self.counts.total} occurences) "
+            + f"with probability {confidence:.4f}",
+            f"doc_count overestimates the true one by at most {self.doc_counts.error_bound:.1f} "
+            + f"(epsilon={self.doc_counts.epsilon:.3g} of {self.doc_counts.total} "
+            + f"document occurences) with probability {confidence:.4f}",
+            "totals (freq_by_pos, freq_in_corpus and doc_frequency denominators) are exact",
+        ]
+
+    def save(self, filename: pathlib.Path) -> None:
+        """
+        Store the sketch: json header line followed by the tables of the counters
+        """
+        header: Dict = {
+            "width": self.counts.width,
+            "depth": self.counts.depth,
+            "top_k": self.top_k,
+            "total": self.counts.total,
+            "doc_total": self.doc_counts.total,
+            "processed_articles": self.processed_articles,
+            "totals_by_pos": self.totals_by_pos,
+            "heavy_hitters": {
+                pos: [[lemma, count] for (_, lemma), count in hh.candidates.items()]
+                for pos, hh in self.heavy_hitters.items()
+            },
+        }
+
+        with open(filename, "wb") as fp:
+            fp.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+
+            for table in [self.counts.table, self.doc_counts.table]:
+                if sys.byteorder == "big":
+                    table = array("Q", table)
+                    table.byteswap()
+
+                table.tofile(fp)
+
+    @classmethod
+    def load(cls, filename: pathlib.Path) -> "FrequencySketch":
+        with open(filename, "rb") as fp:
+            header: Dict = json.loads(fp.readline().decode("utf-8"))
+            sketch: FrequencySketch = cls(
+                header["width"], header["depth"], header["top_k"]
+            )
+
+            for cms in [sketch.counts, sketch.doc_counts]:
+                data: bytes = fp.read(8 * len(cms.table))
+                if len(data) != 8 * len(cms.table):
+                    raise ValueError(f"Sketch {filename} is truncated")
+
+                cms.table = array("Q")
+                cms.table.frombytes(data)
+                if sys.byteorder == "big":
+                    cms.table.byteswap()
+
+        sketch.counts.total = header["total"]
+        sketch.doc_counts.total = header["doc_total"]
+        sketch.processed_articles = header["processed_articles"]
+        sketch.totals_by_pos = header["totals_by_pos"]
+
+        for pos, candidates in header["heavy_hitters"].items():
+            heavy_hitters: HeavyHitters = HeavyHitters(sketch.top_k)
+            heavy_hitters.candidates = {
+                (pos, lemma): count for lemma, count in candidates
+            }
+            heavy_hitters.prune()
+            sketch.heavy_hitters[pos] = heavy_hitters
+
+        return sketch
+
+
+def get_sketch_filename(filename: pathlib.Path) -> pathlib.Path:
+    """
+    Name of the sketch, stored alongside the frequency vocabulary
+    """
+    return filename.with_name(filename.name + ".sketch")
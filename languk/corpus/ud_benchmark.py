@@ -0,0 +1,374 @@
+import gc
+import sys
+import itertools
+import time
+import random
+import platform
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from corpus.ud_converter import (
+    BINARY_ENCODING,
+    COMPRESS_UPOS_MAPPING,
+    COMPRESS_FEATURE_VALUES_MAPPING,
+    LemmaVocabulary,
+    compress_features,
+    decompress_features,
+    decompress,
+    encode_binary,
+    decode_binary,
+    decode_field,
+    decode_batch,
+)
+
+
+# Frequencies of the postags and the features, same as in the comments in ud_converter
+UPOS_COUNTS: Dict[str, int] = {
+    "NOUN": 4130481,
+    "VERB": 3345193,
+    "ADP": 1851693,
+    "ADV": 1651200,
+    "PRON": 1525969,
+    "ADJ": 1427357,
+    "PART": 1147072,
+    "CCONJ": 1101499,
+    "DET": 873070,
+    "PROPN": 684675,
+    "SCONJ": 484188,
+    "X": 175188,
+    "NUM": 96248,
+    "PUNCT": 88265,
+    "INTJ": 61924,
+    "SYM": 415,
+    "AUX": 275,
+}
+
+FEATURE_COUNTS: Dict[str, int] = {
+    "Number": 11271039,
+    "Case": 10571690,
+    "Gender": 8542912,
+    "Animacy": 5989920,
+    "Aspect": 3525739,
+    "VerbForm": 3522972,
+    "PronType": 2919605,
+    "Mood": 2853237,
+    "Tense": 2790165,
+    "Person": 2338011,
+    "Degree": 932900,
+    "NameType": 549831,
+    "Polarity": 435068,
+    "Poss": 277106,
+    "Reflex": 200099,
+    "Uninflect": 182471,
+    "Voice": 180374,
+    "Foreign": 174835,
+    "NumType": 168614,
+    "PunctType": 76819,
+    "Abbr": 59132,
+    "Variant": 22024,
+    "Hyph": 13212,
+    "Animacy[gram]": 11597,
+    "PartType": 5582,
+    "Orth": 3516,
+}
+
+DEFAULT_NUM_SENTENCES: int = 10000
+DEFAULT_REPEAT: int = 5
+DEFAULT_SEED: int = 42
+
+# Allowed relative degradation of any metric before it is reported as a regression
+DEFAULT_THRESHOLD: float = 0.2
+
+# Number of the sentences in the synthetic document
+SENTENCES_PER_DOC: int = 20
+
+VOCABULARY_SIZE: int = 50000
+
+_SYLLABLES: List[str] = [
+    c + v for c in "бвгдзклмнпрстхцчшж" for v in ["а", "о", "у", "е", "и", "і", "я"]
+]
+
+
+class MemoryLemmaVocabulary(LemmaVocabulary):
+    """
+    Vocabulary of the lemmas, that is kept in memory only, so the codec can be
+    measured without Mongo
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.lemmas: Dict[int, str] = {}
+
+    def encode(self, lemmas) -> List[int]:
+        res: List[int] = []
+
+        for lemma in lemmas:
+            if lemma not in self.ids:
+                self.ids[lemma] = len(self.ids) + 1
+                self.lemmas[self.ids[lemma]] = lemma
+
+            res.append(self.ids[lemma])
+
+        return res
+
+    def decode(self, ids) -> List[str]:
+        return [self.lemmas.get(id_, "") for id_ in ids]
+
+
+def generate_sentences(
+    num_sentences: int, seed: int = DEFAULT_SEED
+) -> List[Tuple[List[str], List[str], List[str]]]:
+    """
+    Generate synthetic tagged sentences. Lemmas follow the Zipf's law, postags and
+    features are drawn independently with the frequencies of UPOS_COUNTS and FEATURE_COUNTS
+    :param num_sentences: number of the sentences
+    :param seed: seed of the random generator, same seed gives the same sentences
+    :return: list of (lemmas, postags, features) of the sentences, features in the UD format
+    """
+    rnd = random.Random(seed)
+
+    vocabulary: List[str] = [
+        "".join(rnd.choices(_SYLLABLES, k=rnd.randint(1, 4)))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+    lemma_weights: List[float] = list(
+        itertools.accumulate(1 / rank for rank in range(1, VOCABULARY_SIZE + 1))
+    )
+
+    postags: List[str] = list(UPOS_COUNTS)
+    postag_weights: List[int] = list(UPOS_COUNTS.values())
+    total_words: int = sum(postag_weights)
+
+    sentences: List[Tuple[List[str], List[str], List[str]]] = []
+    for _ in range(num_sentences):
+        length: int = min(max(int(rnd.gauss(15, 8)), 1), 60)
+
+        features: List[str] = []
+        for _ in range(length):
+            features.append(
+                "|".join(
+                    f"{cat}={rnd.choice(list(COMPRESS_FEATURE_VALUES_MAPPING[cat]))}"
+                    for cat, count in sorted(FEATURE_COUNTS.items())
+                    if rnd.random() < count / total_words
+                )
+            )
+
+        sentences.append(
+            (
+                rnd.choices(vocabulary, cum_weights=lemma_weights, k=length),
+                rnd.choices(postags, weights=postag_weights, k=length),
+                features,
+            )
+        )
+
+    return sentences
+
+
+def get_layer_docs(
+    sentences: List[Tuple[List[str], List[str], List[str]]]
+) -> List[Dict[str, List[str]]]:
+    """
+    Group the sentences into the documents in the format of the field of the udpiped layer
+    """
+    docs: List[Dict[str, List[str]]] = []
+
+    for i in range(0, len(sentences), SENTENCES_PER_DOC):
+        doc: Dict[str, List[str]] = {
+            "ud_lemmas": [],
+            "ud_postags": [],
+            "ud_features": [],
+        }
+
+        for lemmas, postags, features in sentences[i : i + SENTENCES_PER_DOC]:
+            doc["ud_lemmas"].append(" ".join(lemmas))
+            doc["ud_postags"].append("".join(COMPRESS_UPOS_MAPPING[p] for p in postags))
+            doc["ud_features"].append(" ".join(map(compress_features, features)))
+
+        docs.append(doc)
+
+    return docs
+
+
+def get_string_size(doc: Dict[str, List[str]]) -> int:
+    return sum(len(s.encode("utf-8")) + 1 for values in doc.values() for s in values)
+
+
+def get_binary_size(doc: Dict[str, bytes]) -> int:
+    return sum(map(len, doc.values()))
+
+
+def calibrate(repeat: int = DEFAULT_REPEAT) -> float:
+    """
+    Time the fixed pure python workload, so the throughput measured on the different
+    machines can be compared
+    :return: best time of the workload in seconds
+    """
+
+    def workload() -> None:
+        words: List[str] = [str(i * 7919 % 10007) for i in range(200000)]
+        counts: Dict[str, int] = {}
+
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+
+        " ".join(sorted(words)).split(" ")
+
+    return min(_time(workload) for _ in range(repeat))
+
+
+def _time(func: Callable[[], object]) -> float:
+    gc.collect()
+    started: float = time.perf_counter()
+    func()
+
+    return time.perf_counter() - started
+
+
+def _get_peak_memory(func: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def run(
+    num_sentences: int = DEFAULT_NUM_SENTENCES,
+    repeat: int = DEFAULT_REPEAT,
+    seed: int = DEFAULT_SEED,
+) -> Dict:
+    """
+    Run the benchmarks of the codec
+    :param num_sentences: number of the synthetic sentences
+    :param repeat: number of the runs of each benchmark, the best one is taken
+    :param seed: seed of the generator of the sentences
+    :return: dict with the meta information and the results of each benchmark: throughput
+        in words per second (absolute and relative to the calibration workload), peak
+        memory allocated per word and the size of the encoded data per word
+    """
+    sentences = generate_sentences(num_sentences, seed=seed)
+    docs: List[Dict[str, List[str]]] = get_layer_docs(sentences)
+    num_words: int = sum(len(lemmas) for lemmas, _, _ in sentences)
+
+    ud_features: List[str] = [f for _, _, features in sentences for f in features]
+    compressed_features: List[str] = list(map(compress_features, ud_features))
+    legacy_docs: List[Dict[str, str]] = [
+        {k: "\n".join(v) for k, v in doc.items()} for doc in docs
+    ]
+
+    vocabulary: MemoryLemmaVocabulary = MemoryLemmaVocabulary()
+    binary_docs: List[Dict[str, bytes]] = [
+        encode_binary(doc, vocabulary) for doc in docs
+    ]
+
+    string_size: int = sum(map(get_string_size, docs))
+    binary_size: int = sum(map(get_binary_size, binary_docs))
+
+    benchmarks: Dict[str, Tuple[Callable[[], object], Optional[int]]] = {
+        "compress_features": (
+            lambda: [compress_features(f) for f in ud_features],
+            None,
+        ),
+        "decompress_features": (
+            lambda: [decompress_features(f) for f in compressed_features],
+            None,
+        ),
+        "decompress": (
+            lambda: [decompress(**doc) for doc in legacy_docs],
+            string_size,
+        ),
+        "decode_field": (
+            lambda: [decode_field(doc) for doc in docs],
+            string_size,
+        ),
+        "decode_batch": (lambda: decode_batch(docs), string_size),
+        "encode_binary": (
+            lambda: [encode_binary(doc, vocabulary) for doc in docs],
+            binary_size,
+        ),
+        "decode_binary": (
+            lambda: [decode_binary(doc, vocabulary) for doc in binary_docs],
+            binary_size,
+        ),
+        "decode_field_binary": (
+            lambda: [
+                decode_field(doc, encoding=BINARY_ENCODING, vocabulary=vocabulary)
+                for doc in binary_docs
+            ],
+            binary_size,
+        ),
+    }
+
+    calibration: float = calibrate(repeat)
+    results: Dict[str, Dict] = {}
+
+    for name, (func, size) in benchmarks.items():
+        best: float = min(_time(func) for _ in range(repeat))
+        peak: int = _get_peak_memory(func)
+
+        results[name] = {
+            "words_per_sec": round(num_words / best),
+            "relative_throughput": round(num_words / best * calibration, 2),
+            "peak_bytes_per_word": round(peak / num_words, 2),
+        }
+
+        if size is not None:
+            results[name]["bytes_per_word"] = round(size / num_words, 3)
+
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "sentences": num_sentences,
+            "words": num_words,
+            "seed": seed,
+            "repeat": repeat,
+            "calibration_sec": round(calibration, 6),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    results: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD
+) -> List[str]:
+    """
+    Compare the results with the baseline. Throughput is compared relative to the
+    calibration workload, so the baseline stays valid on the other machines
+    :param results: results, as returned by run
+    :param baseline: stored results of the previous run
+    :param threshold: allowed relative degradation of the metrics
+    :return: list of the descriptions of the regressions
+    """
+    regressions: List[str] = []
+
+    for name, expected in baseline["results"].items():
+        actual: Optional[Dict] = results["results"].get(name)
+
+        if actual is None:
+            regressions.append(f"{name}: benchmark is missing")
+            continue
+
+        if actual["relative_throughput"] < expected["relative_throughput"] * (
+            1 - threshold
+        ):
+            regressions.append(
+                f"{name}: relative throughput dropped from "
+                + f"{expected['relative_throughput']} to {actual['relative_throughput']}"
+            )
+
+        for metric in ["peak_bytes_per_word", "bytes_per_word"]:
+            if metric in expected and actual.get(metric, 0) > expected[metric] * (
+                1 + threshold
+            ):
+                regressions.append(
+                    f"{name}: {metric} grew from {expected[metric]} to {actual[metric]}"
+                )
+
+    return regressions
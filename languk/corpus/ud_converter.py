@@ -1,8 +1,13 @@
+import sys
 import logging
+from array import array
 from collections import deque, OrderedDict
-from typing import Union, List
+from typing import Union, List, Dict, Iterable, Iterator, Optional, Tuple
 from itertools import zip_longest
 
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -233,3 +238,538 @@ def decompress(tokens: str=None, ud_lemmas: str=None, ud_features: str=None, ud_
 
 
     return res
+
+
+# Compact binary encoding of the udpiped layer. Each field (title or text) is stored as:
+#   lengths: uint32 array, number of words in each sentence
+#   lemmas: uint32 array, ids of the lemmas in the LemmaVocabulary
+#   postags: uint8 array, index of the upos in _UPOS_MAPPING
+#   feature_counts: uint8 array, number of the features of each word
+#   features: uint8 array, one byte per feature, index of the category in
+#       _FEATURES_MAPPING in high 5 bits and index of the value in low 3 bits
+# Postags and features, missing in the mappings, are stored with the reserved codes
+# and decoded as UNK, same as in decompress
+# All arrays are little-endian and can be read with array.array or numpy.frombuffer
+BINARY_ENCODING = "binary_v1"
+
+UNKNOWN_POSTAG_CODE = 255
+UNKNOWN_FEATURE_CODE = 255
+
+# Compressed postag and feature, that are written instead of the unknown ones by
+# decode_binary, both are missing in the mappings
+_UNKNOWN_POSTAG_CHAR = "?"
+_UNKNOWN_FEATURE_PAIR = "??"
+
+_POSTAG_CODES = {c_upos: i for i, (_, c_upos) in enumerate(_UPOS_MAPPING)}
+_POSTAG_CHARS = [c_upos for _, c_upos in _UPOS_MAPPING] + [_UNKNOWN_POSTAG_CHAR] * (256 - len(_UPOS_MAPPING))
+
+assert len(_FEATURES_MAPPING) < 32, "Feature categories must fit into 5 bits, the last one is reserved"
+_FEATURE_CODES = {}
+_FEATURE_PAIRS = {UNKNOWN_FEATURE_CODE: _UNKNOWN_FEATURE_PAIR}
+for _cat_no, (_cat, _c_cat) in enumerate(_FEATURES_MAPPING):
+    for _c_val in COMPRESS_FEATURE_VALUES_MAPPING[_cat].values():
+        assert int(_c_val) < 8, "Feature values must fit into 3 bits"
+        _FEATURE_CODES[_c_cat + _c_val] = (_cat_no << 3) | int(_c_val)
+        _FEATURE_PAIRS[(_cat_no << 3) | int(_c_val)] = _c_cat + _c_val
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    return values
+
+
+class LemmaVocabulary:
+    """
+    Shared table of the lemmas, that assigns them integer ids. Stored in the Mongo
+    collection, so the ids are the same for all the processes and runs, and cached in memory
+    """
+
+    def __init__(self, db, collection: str = "ud_lemmas") -> None:
+        self.collection = db[collection]
+        self.counters = db["counters"]
+        self.collection_name = collection
+
+        self.ids: Dict[str, int] = {}
+        self.lemmas: Dict[int, str] = {}
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index("lemma", unique=True)
+
+    def _remember(self, docs) -> None:
+        for doc in docs:
+            self.ids[doc["lemma"]] = doc["_id"]
+            self.lemmas[doc["_id"]] = doc["lemma"]
+
+    def encode(self, lemmas: Iterable[str]) -> List[int]:
+        """
+        Get ids of the lemmas, assigning new ids to the unknown ones
+        :param lemmas: lemmas
+        :return: list of ids
+        """
+        lemmas = list(lemmas)
+        unknown: List[str] = list({lemma for lemma in lemmas if lemma not in self.ids})
+
+        if unknown:
+            self._remember(self.collection.find({"lemma": {"$in": unknown}}))
+            unknown = [lemma for lemma in unknown if lemma not in self.ids]
+
+        if unknown:
+            # Range of ids is reserved at once
+            last_id: int = self.counters.find_one_and_update(
+                {"_id": self.collection_name},
+                {"$inc": {"seq": len(unknown)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )["seq"]
+
+            docs: List[Dict] = [
+                {"_id": last_id - len(unknown) + i + 1, "lemma": lemma}
+                for i, lemma in enumerate(unknown)
+            ]
+
+            try:
+                self.collection.insert_many(docs, ordered=False)
+                self._remember(docs)
+            except BulkWriteError:
+                # Some of the lemmas were added by the other process in the meantime
+                self._remember(self.collection.find({"lemma": {"$in": unknown}}))
+
+        return [self.ids[lemma] for lemma in lemmas]
+
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        """
+        Get lemmas by their ids
+        :param ids: ids of the lemmas
+        :return: list of lemmas
+        """
+        ids = list(ids)
+        unknown: List[int] = list({id_ for id_ in ids if id_ not in self.lemmas})
+
+        if unknown:
+            self._remember(self.collection.find({"_id": {"$in": unknown}}))
+
+        return [self.lemmas.get(id_, "") for id_ in ids]
+
+
+class MalformedLayerError(ValueError):
+    """
+    Fields of the udpiped layer contain different number of sentences or words
+    """
+
+
+def encode_binary(field: Dict[str, List[str]], vocabulary: LemmaVocabulary) -> Dict[str, bytes]:
+    """
+    Encode the field of the udpiped layer into the compact binary form
+    :param field: dict with ud_lemmas, ud_postags and ud_features lists, one string per sentence
+    :param vocabulary: vocabulary of the lemmas
+    :return: dict with the binary arrays, see BINARY_ENCODING
+    :raises MalformedLayerError: when the sentence contains different number of lemmas, postags
+        and features
+    """
+    lengths = array("I")
+    postags = array("B")
+    feature_counts = array("B")
+    features = array("B")
+    lemmas: List[str] = []
+
+    for sent_lemmas, sent_postags, sent_features in zip(
+        field.get("ud_lemmas", []), field.get("ud_postags", []), field.get("ud_features", [])
+    ):
+        words: List[str] = sent_lemmas.split(" ") if sent_postags else []
+        word_features: List[str] = sent_features.split(" ") if sent_postags else []
+
+        if not len(words) == len(sent_postags) == len(word_features):
+            raise MalformedLayerError(
+                f"Sentence contains different number of lemmas, postags and features: {sent_lemmas}"
+            )
+
+        lengths.append(len(words))
+        lemmas += words
+
+        for c_upos in sent_postags:
+            postags.append(_POSTAG_CODES.get(c_upos, UNKNOWN_POSTAG_CODE))
+
+        for compressed in word_features:
+            codes: List[int] = [
+                _FEATURE_CODES.get("".join(pair), UNKNOWN_FEATURE_CODE) for pair in grouper(compressed, 2, "")
+            ]
+            feature_counts.append(len(codes))
+            features.extend(codes)
+
+    return {
+        "lengths": _to_bytes(lengths),
+        "lemmas": _to_bytes(array("I", vocabulary.encode(lemmas))),
+        "postags": postags.tobytes(),
+        "feature_counts": feature_counts.tobytes(),
+        "features": features.tobytes(),
+    }
+
+
+def decode_binary(field: Dict[str, bytes], vocabulary: LemmaVocabulary) -> Dict[str, List[str]]:
+    """
+    Decode the binary field of the udpiped layer back to the strings, one per sentence,
+    as they are stored in the original udpiped layer
+    :param field: dict with the binary arrays, see BINARY_ENCODING
+    :param vocabulary: vocabulary of the lemmas
+    :return: dict with ud_lemmas, ud_postags and ud_features lists
+    """
+    lengths = _from_bytes("I", field["lengths"])
+    lemmas: List[str] = vocabulary.decode(_from_bytes("I", field["lemmas"]))
+    postags: bytes = bytes(field["postags"])
+    feature_counts: bytes = bytes(field["feature_counts"])
+    features: bytes = bytes(field["features"])
+
+    res: Dict[str, List[str]] = {"ud_lemmas": [], "ud_postags": [], "ud_features": []}
+    word: int = 0
+    feature: int = 0
+
+    for length in lengths:
+        sent_features: List[str] = []
+
+        for count in feature_counts[word : word + length]:
+            sent_features.append("".join(_FEATURE_PAIRS[code] for code in features[feature : feature + count]))
+            feature += count
+
+        res["ud_lemmas"].append(" ".join(lemmas[word : word + length]))
+        res["ud_postags"].append("".join(_POSTAG_CHARS[code] for code in postags[word : word + length]))
+        res["ud_features"].append(" ".join(sent_features))
+        word += length
+
+    return res
+
+
+def get_udpiped_fields(layer: Dict, vocabulary: LemmaVocabulary) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Read the title and the text of the udpiped layer in any encoding
+    :param layer: udpiped layer
+    :param vocabulary: vocabulary of the lemmas, used for the binary encoding
+    :return: dict with title and text, each with ud_lemmas, ud_postags and ud_features lists
+    """
+    if layer.get("encoding") == BINARY_ENCODING:
+        return {f: decode_binary(layer[f], vocabulary) for f in ["title", "text"] if layer.get(f)}
+
+    return {f: layer[f] for f in ["title", "text"] if layer.get(f)}
+
+
+# Lookup tables for the batch decoding, see DecodedField. Postags are decoded into
+# their codes (indexes in _UPOS_MAPPING), features of each word into a bitset with
+# the bits set at the positions of the codes of (category, value) pairs, see _FEATURE_CODES
+UPOS_CODES = {upos: i for i, (upos, _) in enumerate(_UPOS_MAPPING)}
+# Codes, missing in the mapping, are decoded as UNK, same as in decompress
+UPOS_NAMES = [upos for upos, _ in _UPOS_MAPPING] + ["UNK"] * (256 - len(_UPOS_MAPPING))
+
+FEATURE_MASKS = {
+    cat + "=" + val: 1 << _FEATURE_CODES[COMPRESS_FEATURES_MAPPING[cat] + c_val]
+    for cat, values in COMPRESS_FEATURE_VALUES_MAPPING.items()
+    for val, c_val in values.items()
+}
+_FEATURE_NAMES = {
+    code: (DECOMPRESS_FEATURES_MAPPING[pair[0]], DECOMPRESS_FEATURE_VALUES_MAPPING[DECOMPRESS_FEATURES_MAPPING[pair[0]]][pair[1]])
+    for code, pair in _FEATURE_PAIRS.items()
+    if code != UNKNOWN_FEATURE_CODE
+}
+_FEATURE_NAMES[UNKNOWN_FEATURE_CODE] = ("UNK", "UNK")
+
+# Translates the compressed postags into the string of chars with the codes, that is
+# then encoded into bytes at once
+_POSTAG_TRANSLATION = str.maketrans({c_upos: chr(code) for c_upos, code in _POSTAG_CODES.items()})
+
+# Distinct combinations of the features are few, so the bitsets of the compressed feature
+# strings (or of the packed feature bytes) and the decoded features of the bitsets are memoized
+_bitsets_of_strings: Dict[str, int] = {}
+_bitsets_of_bytes: Dict[bytes, int] = {}
+_features_of_bitsets: Dict[int, Tuple[Tuple[str, str], ...]] = {}
+
+
+def _get_bitset(compressed: str) -> int:
+    try:
+        return _bitsets_of_strings[compressed]
+    except KeyError:
+        pass
+
+    bitset: int = 0
+    for pair in grouper(compressed, 2, ""):
+        code: Optional[int] = _FEATURE_CODES.get("".join(pair))
+
+        if code is None:
+            logger.warning(f"Cannot find the feature '{''.join(pair)}' in the mapping, decoding it as UNK")
+            code = UNKNOWN_FEATURE_CODE
+
+        bitset |= 1 << code
+
+    _bitsets_of_strings[compressed] = bitset
+
+    return bitset
+
+
+def _get_bitset_of_bytes(codes: bytes) -> int:
+    try:
+        return _bitsets_of_bytes[codes]
+    except KeyError:
+        pass
+
+    bitset: int = 0
+    for code in codes:
+        bitset |= 1 << code
+
+    _bitsets_of_bytes[codes] = bitset
+
+    return bitset
+
+
+def get_features(bitset: int) -> Tuple[Tuple[str, str], ...]:
+    """
+    Decode the bitset of the features
+    :param bitset: bitset, as stored in DecodedField.features
+    :return: tuple of (category, value) pairs in the order of the categories in _FEATURES_MAPPING
+    """
+    try:
+        return _features_of_bitsets[bitset]
+    except KeyError:
+        pass
+
+    features: Tuple[Tuple[str, str], ...] = tuple(
+        _FEATURE_NAMES[code] for code in range(bitset.bit_length()) if bitset >> code & 1
+    )
+    _features_of_bitsets[bitset] = features
+
+    return features
+
+
+class WordView:
+    """
+    Lazy view of the word of DecodedField, that looks like the dict, returned by decompress
+    for the code that still needs it, while the values are decoded only on access
+    """
+
+    __slots__ = ("field", "index")
+
+    KEYS = ("ud_lemmas", "ud_postags", "ud_features")
+
+    def __init__(self, field: "DecodedField", index: int) -> None:
+        self.field = field
+        self.index = index
+
+    @property
+    def lemma(self) -> str:
+        return self.field.lemmas[self.index]
+
+    @property
+    def upos(self) -> str:
+        return UPOS_NAMES[self.field.postags[self.index]]
+
+    @property
+    def feats(self) -> OrderedDict:
+        return OrderedDict(get_features(self.field.features[self.index]))
+
+    def has_feature(self, feature: str) -> bool:
+        """
+        :param feature: feature as "Category=Value", i.e. "Case=Nom"
+        """
+        return bool(self.field.features[self.index] & FEATURE_MASKS[feature])
+
+    def __getitem__(self, key: str):
+        if key == "ud_lemmas":
+            return self.lemma
+        if key == "ud_postags":
+            return self.upos
+        if key == "ud_features":
+            return self.feats
+
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.KEYS
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.KEYS
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self.KEYS else default
+
+    def __repr__(self) -> str:
+        return f"WordView({self.lemma!r}, {self.upos!r}, {dict(self.feats)!r})"
+
+
+class DecodedField:
+    """
+    Flat arrays of the decoded udpiped field, or a batch of fields:
+        lemmas: list of the lemmas of all the words
+        postags: bytes with the postag code of each word, see UPOS_NAMES
+        features: list of the feature bitsets of the words, see FEATURE_MASKS and get_features
+        sentence_offsets: index of the first word of each sentence, plus the total number of words
+        field_offsets: index of the first sentence of each field in the batch, plus the total
+            number of sentences
+    """
+
+    __slots__ = ("lemmas", "postags", "features", "sentence_offsets", "field_offsets")
+
+    def __init__(self) -> None:
+        self.lemmas: List[str] = []
+        self.postags: bytes = b""
+        self.features: List[int] = []
+        self.sentence_offsets = array("I", [0])
+        self.field_offsets = array("I", [0])
+
+    def __len__(self) -> int:
+        return len(self.postags)
+
+    @property
+    def num_sentences(self) -> int:
+        return len(self.sentence_offsets) - 1
+
+    @property
+    def num_fields(self) -> int:
+        return len(self.field_offsets) - 1
+
+    def get_field_words(self, field_no: int) -> range:
+        """
+        :return: range of the indexes of the words of the field of the batch
+        """
+        return range(
+            self.sentence_offsets[self.field_offsets[field_no]],
+            self.sentence_offsets[self.field_offsets[field_no + 1]],
+        )
+
+    def sentences(self) -> Iterator[range]:
+        """
+        Iterate over the sentences
+        :return: ranges of the indexes of the words of the sentences
+        """
+        offsets = self.sentence_offsets
+
+        for i in range(len(offsets) - 1):
+            yield range(offsets[i], offsets[i + 1])
+
+    def words(self, indexes: Optional[Iterable[int]] = None) -> Iterator[WordView]:
+        """
+        Iterate over the lazy views of the words
+        :param indexes: indexes of the words, all of them by default
+        """
+        for i in range(len(self)) if indexes is None else indexes:
+            yield WordView(self, i)
+
+    def to_sentences(self) -> List[List[WordView]]:
+        """
+        Same structure as the one returned by decompress, but with the lazy views of the words
+        """
+        return [list(self.words(sentence)) for sentence in self.sentences()]
+
+
+def _decode_string_field(field: Dict, res: DecodedField, postags: List[str]) -> None:
+    ud_lemmas = field.get("ud_lemmas") or []
+    ud_postags = field.get("ud_postags") or []
+    ud_features = field.get("ud_features")
+
+    # Legacy layout in the corpus documents keeps the sentences joined with newlines
+    if isinstance(ud_lemmas, str):
+        ud_lemmas = ud_lemmas.split("\n")
+    if isinstance(ud_postags, str):
+        ud_postags = ud_postags.split("\n")
+    if isinstance(ud_features, str):
+        ud_features = ud_features.split("\n")
+
+    if len(ud_lemmas) != len(ud_postags) or (ud_features is not None and len(ud_features) != len(ud_postags)):
+        raise MalformedLayerError(
+            f"Text contains different number of sentences: {len(ud_lemmas)}, {len(ud_postags)}"
+            + (f", {len(ud_features)}" if ud_features is not None else "")
+        )
+
+    offset: int = res.sentence_offsets[-1]
+
+    for sent_no, (sent_lemmas, sent_postags) in enumerate(zip(ud_lemmas, ud_postags)):
+        # Postags take exactly one char per word
+        length: int = len(sent_postags)
+        offset += length
+        res.sentence_offsets.append(offset)
+
+        if not length:
+            continue
+
+        postags.append(sent_postags)
+        res.lemmas += sent_lemmas.split(" ")
+
+        if ud_features is not None:
+            res.features += map(_get_bitset, ud_features[sent_no].split(" "))
+        else:
+            res.features += [0] * length
+
+        if not len(res.lemmas) == len(res.features) == offset:
+            raise MalformedLayerError(f"Sentence contains different number of words: {sent_lemmas}")
+
+
+def _decode_binary_field(field: Dict, res: DecodedField, postags: List[bytes], vocabulary: "LemmaVocabulary") -> None:
+    start: int = res.sentence_offsets[-1]
+    offset: int = start
+
+    for length in _from_bytes("I", field["lengths"]):
+        offset += length
+        res.sentence_offsets.append(offset)
+
+    res.lemmas += vocabulary.decode(_from_bytes("I", field["lemmas"]))
+    postags.append(bytes(field["postags"]))
+
+    features: bytes = bytes(field["features"])
+    position: int = 0
+    for count in bytes(field["feature_counts"]):
+        res.features.append(_get_bitset_of_bytes(features[position : position + count]))
+        position += count
+
+    if not len(res.lemmas) == len(res.features) == offset or len(postags[-1]) != offset - start:
+        raise MalformedLayerError(
+            f"Field contains different number of words: {offset - start} in the sentences, "
+            + f"{len(postags[-1])} postags"
+        )
+
+
+def decode_batch(
+    fields: Iterable[Dict], encoding: Optional[str] = None, vocabulary: Optional["LemmaVocabulary"] = None
+) -> DecodedField:
+    """
+    Decode the batch of the fields of the udpiped layers (or of the legacy nlp field of the
+    documents) into the flat arrays at once
+    :param fields: fields with ud_lemmas, ud_postags and optionally ud_features, in the string
+        encoding (list of sentences or newline-joined), or in the binary one
+    :param encoding: BINARY_ENCODING for the binary fields, None for the strings
+    :param vocabulary: vocabulary of the lemmas for the binary encoding
+    :return: decoded fields, see DecodedField.field_offsets to find the words of each of them
+    :raises MalformedLayerError: when the fields contain different number of sentences or words
+    """
+    res: DecodedField = DecodedField()
+    postags: List = []
+
+    for field in fields:
+        if field:
+            if encoding == BINARY_ENCODING:
+                _decode_binary_field(field, res, postags, vocabulary)
+            else:
+                _decode_string_field(field, res, postags)
+
+        res.field_offsets.append(len(res.sentence_offsets) - 1)
+
+    if encoding == BINARY_ENCODING:
+        res.postags = b"".join(postags)
+    else:
+        res.postags = "".join(postags).translate(_POSTAG_TRANSLATION).encode("latin-1", "replace")
+
+    return res
+
+
+def decode_field(field: Dict, encoding: Optional[str] = None, vocabulary: Optional["LemmaVocabulary"] = None) -> DecodedField:
+    """
+    Decode one field of the udpiped layer into the flat arrays, see decode_batch
+    """
+    return decode_batch([field], encoding=encoding, vocabulary=vocabulary)
@@ -0,0 +1,185 @@
+import os
+import pathlib
+from collections import OrderedDict, Counter
+from hashlib import sha1
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pymongo
+
+
+# Number of the sentences, kept in memory by each process
+DEFAULT_LRU_SIZE: int = 200000
+
+# Number of the keys of the sentences, seen only once, see SentenceTagCache
+DEFAULT_DOORKEEPER_SIZE: int = 1000000
+
+# Name of the collection of the persistent tier
+CACHE_COLLECTION: str = "udpipe_cache"
+
+# Compressed lemmas, postags and features of the sentence, as stored in the udpiped layer
+TaggedSentence = Tuple[str, str, str]
+
+# (path, size, mtime) -> checksum of the model file
+_model_ids: Dict[Tuple[str, int, float], str] = {}
+
+
+def get_model_id(path: str) -> str:
+    """
+    Identify the model by the checksum of its file, so the cached tags of the
+    previous model are never used after the model is replaced
+    :param path: path to the UDPipe model
+    :return: sha1 of the model file
+    """
+    stat: os.stat_result = pathlib.Path(path).stat()
+    key: Tuple[str, int, float] = (path, stat.st_size, stat.st_mtime)
+
+    if key not in _model_ids:
+        checksum = sha1()
+
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+                checksum.update(chunk)
+
+        _model_ids[key] = checksum.hexdigest()
+
+    return _model_ids[key]
+
+
+class SentenceTagCache:
+    """
+    Two-tier cache of the tagged sentences: LRU in memory and a Mongo collection,
+    shared by all the processes and runs. Keys are made of the model id and the
+    tokens of the sentence.
+
+    Most of the sentences are unique, so to keep the Mongo tier small the sentence
+    is stored there only when the same process sees it for the second time. Keys of
+    the sentences, seen once, are kept by the doorkeeper
+    """
+
+    def __init__(
+        self,
+        db,
+        model_id: str,
+        lru_size: int = DEFAULT_LRU_SIZE,
+        doorkeeper_size: int = DEFAULT_DOORKEEPER_SIZE,
+    ) -> None:
+        """
+        :param db: Mongo database
+        :param model_id: id of the model, see get_model_id
+        :param lru_size: number of the sentences to keep in memory
+        :param doorkeeper_size: number of the keys of the sentences, seen once, to remember
+        """
+        self.collection = db[CACHE_COLLECTION]
+        self.model_id: str = model_id
+        self.lru_size: int = lru_size
+        self.doorkeeper_size: int = doorkeeper_size
+
+        self.lru: "OrderedDict[str, TaggedSentence]" = OrderedDict()
+        self.doorkeeper: "OrderedDict[str, None]" = OrderedDict()
+        self.pending: List[Dict] = []
+        self.stats: Counter = Counter()
+
+        # Cache is not shared with the forked processes
+        self.pid: int = os.getpid()
+
+    @staticmethod
+    def purge_other_models(db, model_id: str) -> int:
+        """
+        Remove the sentences, tagged by the other models, from the Mongo tier
+        :return: number of the removed sentences
+        """
+        collection = db[CACHE_COLLECTION]
+        collection.create_index("model")
+
+        return collection.delete_many({"model": {"$ne": model_id}}).deleted_count
+
+    def get_key(self, tokens: Iterable[str]) -> str:
+        return sha1(
+            "\x1f".join([self.model_id, *tokens]).encode("utf-8", "surrogatepass")
+        ).hexdigest()
+
+    def _remember(self, key: str, value: TaggedSentence) -> None:
+        self.lru[key] = value
+        self.lru.move_to_end(key)
+
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def prefetch(self, keys: Iterable[str]) -> None:
+        """
+        Load the sentences, missing in memory, from the Mongo tier in one query
+        :param keys: keys of the sentences of the batch
+        """
+        missing: List[str] = list({key for key in keys if key not in self.lru})
+
+        if not missing:
+            return
+
+        for doc in self.collection.find({"_id": {"$in": missing}}):
+            self._remember(doc["_id"], (doc["lemmas"], doc["postags"], doc["features"]))
+            self.stats["loaded"] += 1
+
+    def get(self, key: str) -> Optional[TaggedSentence]:
+        value: Optional[TaggedSentence] = self.lru.get(key)
+
+        if value is None:
+            self.stats["misses"] += 1
+        else:
+            self.lru.move_to_end(key)
+            self.stats["hits"] += 1
+
+            if key in self.doorkeeper:
+                self._admit(key, value)
+
+        return value
+
+    def put(self, key: str, value: TaggedSentence) -> None:
+        """
+        Cache the freshly tagged sentence
+        """
+        self._remember(key, value)
+
+        if key in self.doorkeeper:
+            self._admit(key, value)
+        else:
+            self.doorkeeper[key] = None
+
+            if len(self.doorkeeper) > self.doorkeeper_size:
+                self.doorkeeper.popitem(last=False)
+
+    def _admit(self, key: str, value: TaggedSentence) -> None:
+        """
+        Queue the recurring sentence to be stored in the Mongo tier
+        """
+        del self.doorkeeper[key]
+        self.pending.append(
+            {
+                "_id": key,
+                "model": self.model_id,
+                "lemmas": value[0],
+                "postags": value[1],
+                "features": value[2],
+            }
+        )
+
+    def flush(self) -> None:
+        """
+        Write the recurring sentences to the Mongo tier
+        """
+        if not self.pending:
+            return
+
+        try:
+            self.collection.insert_many(self.pending, ordered=False)
+        except pymongo.errors.BulkWriteError:
+            # Other processes might have stored the same sentences already
+            pass
+
+        self.stats["stored"] += len(self.pending)
+        self.pending = []
+
+    def pop_stats(self) -> Counter:
+        stats: Counter = self.stats
+        self.stats = Counter()
+
+        return stats
@@ -241,6 +241,12 @@ CACHES = {
 RQ_PREFIX = "languk_"
 QUEUE_DEFAULT = RQ_PREFIX + "default"
 CORPUS_EXPORT_PATH = "/tmp"
+# On-disk LSH index of the near-duplicates, see corpus.jobs.DeduplicateJob
+CORPUS_LSH_INDEX_FILE = "/tmp/corpus_lsh_index.sqlite3"
+# Temporary files of the counts, spilled by corpus.jobs.BuildFreqVocabJob
+CORPUS_SPILL_PATH = "/tmp"
+# Versioned raw counts of the lemmas, merged by the incremental corpus.jobs.BuildFreqVocabJob
+CORPUS_FREQ_COUNTS_PATH = "/tmp/freq_counts"
 
 RQ_QUEUES = {
     QUEUE_DEFAULT: {
@@ -254,7 +260,18 @@ UDPIPE_MODEL_FILE = ""
 RQ_SHOW_ADMIN_LINK = True
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 WAGTAILMENUS_MAIN_MENU_ITEMS_RELATED_NAME = "lang_uk_menu_items"
+# Several instances of the nlp_uk_api can be listed, separated by spaces
 NLP_UK_BASE_URL = "http://127.0.0.1:8080/"
+# round_robin or least_loaded
+NLP_UK_BALANCING = "least_loaded"
+NLP_UK_POOL_SIZE = 10
+NLP_UK_CONNECT_TIMEOUT = 10
+NLP_UK_READ_TIMEOUT = 600
+# Instances (or the proxy in front of them) must accept gzipped requests
+NLP_UK_COMPRESS_REQUESTS = False
+# Recorded in the layers, change it after the upgrade of the nlp_uk_api (or LanguageTool),
+# so the texts are reprocessed by the tasks with skip_unchanged
+NLP_UK_VERSION = ""
 WAGTAILADMIN_BASE_URL = "https://lang.org.ua/admin/"
 
 